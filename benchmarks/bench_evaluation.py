@@ -0,0 +1,208 @@
+# benchmarks of the alarm evaluation hot path on synthetic sites, results are written as JSON to compare commits:
+#   python benchmarks/bench_evaluation.py --sites 1 10 100 1000 --output bench.json
+#   python benchmarks/compare.py base.json bench.json
+import os
+import sys
+import json
+import time, datetime
+import argparse
+import platform
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import eniscopedata as ed
+import hwminutes as hw
+from synthetic import SyntheticAPI, SyntheticData
+
+# 2023-10-29 is the 25 hour day of the end of daylight saving time in Europe
+DEFAULT_DATE = "2023-10-29"
+BENCHMARKS = [
+    "alarm_settings",
+    "frame_assembly",
+    "schedule_eq",
+    "threshold_eq",
+    "rolling_mean",
+    "create_report",
+    "evaluate_org",
+]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def best_time(function, repeat):
+    """
+    Returns the best of repeat timings of a call in seconds and the result of the last call.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_org(api, org, days, repeat):
+    """
+    Times every stage of the evaluation of one organization.
+
+    Returns:
+        dict: Seconds per benchmark.
+        int: Number of readings.
+    """
+    tz = org["timeZone"]
+    org_id = org["organizationId"]
+    channel_names = [channel["channelName"] for channel in api.get_channels_list(org_id)]
+    date_ranges = [(start, end) for start, end, _ in days]
+    timings = {}
+
+    timings["alarm_settings"], alarms = best_time(
+        lambda: hw.get_alarm_settings(api, org_id, channel_names), repeat
+    )
+    # readings are generated before the timed runs, so frame assembly only processes the responses
+    api.get_multiple_channel_data(
+        list(alarms["channelId"].unique()),
+        date_ranges,
+        fields=list(dict.fromkeys([*alarms["field"].unique(), "E"])),
+    )
+    timings["frame_assembly"], frame = best_time(
+        lambda: hw.get_channel_frame(api, alarms, date_ranges, tz), repeat
+    )
+
+    channel_rows = frame.groupby("channelId").indices
+    for name in ["schedule_eq", "threshold_eq", "rolling_mean", "create_report"]:
+        timings[name] = 0.0
+    for _, alarm in alarms[alarms["status"] == 1].iterrows():
+        channel_df = frame.iloc[channel_rows[alarm.channelId]]
+        rule = ed.Threshold(
+            alarm.thresholdValue, alarm.thresholdDirection, alarm.field, alarm.reportingInterval
+        )
+        # a new schedule every time, the compiled schedule cache would hide its construction
+        schedule = ed.Schedule(set(alarm.days), (alarm.startTime, alarm.endTime), tz)
+
+        seconds, in_schedule = best_time(lambda: schedule == channel_df["datetime"], repeat)
+        timings["schedule_eq"] += seconds
+        seconds, field_mean = best_time(
+            lambda: pd.Series(
+                ed.rollingMean(channel_df[rule.field], rule.reportInterval),
+                index=channel_df.index,
+            ).bfill(),
+            repeat,
+        )
+        timings["rolling_mean"] += seconds
+        seconds, breaks = best_time(lambda: rule == field_mean, repeat)
+        timings["threshold_eq"] += seconds
+        active = (in_schedule & breaks).to_numpy()
+        seconds, _ = best_time(
+            lambda: ed.createReport(
+                org["organizationName"],
+                channel_df,
+                alarm.channelId,
+                alarm.alarmName,
+                schedule,
+                rule,
+                int(active.sum()),
+                energy=float(np.nansum(channel_df["E"].to_numpy(dtype=float)[active])),
+            ),
+            repeat,
+        )
+        timings["create_report"] += seconds
+
+    timings["evaluate_org"], _ = best_time(
+        lambda: hw.evaluate_alarms(org["organizationName"], frame, alarms, tz, days),
+        repeat,
+    )
+    return timings, len(frame)
+
+
+def bench_scale(sites, args):
+    """
+    Runs all benchmarks for a number of sites, one organization at a time to bound memory.
+    """
+    data = SyntheticData(
+        sites, channels=args.channels, alarms=args.alarms, tz=args.tz, seed=args.seed
+    )
+    api = SyntheticAPI(data)
+    days = hw.report_days(args.tz, args.date, args.end_date)
+    totals = dict.fromkeys(BENCHMARKS, 0.0)
+    rows = 0
+    for org in data.organizations():
+        timings, org_rows = bench_org(api, org, days, args.repeat)
+        for name, seconds in timings.items():
+            totals[name] += seconds
+        rows += org_rows
+        api.forget()
+    return {
+        "sites": sites,
+        "readings": rows,
+        "results": {
+            name: {
+                "seconds": round(seconds, 6),
+                "per_site_ms": round(1000 * seconds / sites, 4),
+                "per_million_readings_s": round(seconds * 1e6 / rows, 4) if rows else None,
+            }
+            for name, seconds in totals.items()
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark alarm evaluation on synthetic sites.")
+    parser.add_argument("--sites", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--channels", type=int, default=5, help="channels per site")
+    parser.add_argument("--alarms", type=int, default=2, help="alarms per channel")
+    parser.add_argument("--date", default=DEFAULT_DATE, metavar="YYYY-MM-DD")
+    parser.add_argument("--end-date", metavar="YYYY-MM-DD", help="last report day, inclusive")
+    parser.add_argument("--tz", default="Europe/Madrid")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per timing, the best is kept")
+    parser.add_argument("--output", metavar="FILE", help="JSON results file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "versions": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+        },
+        "parameters": {
+            key: value for key, value in vars(args).items() if key not in ("sites", "output")
+        },
+        "scales": [],
+    }
+    for sites in args.sites:
+        start = time.perf_counter()
+        report["scales"].append(bench_scale(sites, args))
+        print(
+            f"{sites} sites benchmarked in {time.perf_counter() - start:.1f} s",
+            file=sys.stderr,
+        )
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
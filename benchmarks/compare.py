@@ -0,0 +1,42 @@
+# compare two benchmark result files, e.g. of the base commit and of a change:
+#   python benchmarks/compare.py base.json bench.json
+import sys
+import json
+import argparse
+
+
+def load(file_path):
+    with open(file_path) as f:
+        report = json.load(f)
+    return report, {scale["sites"]: scale["results"] for scale in report["scales"]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument(
+        "--threshold", type=float, default=1.1, help="ratio reported as a slowdown (default: 1.1)"
+    )
+    args = parser.parse_args(argv)
+
+    base_report, base = load(args.base)
+    new_report, new = load(args.new)
+    print(f"base {base_report.get('commit')} ({base_report['created']}), new {new_report.get('commit')} ({new_report['created']})")
+    print(f"{'sites':>6}  {'benchmark':<16}{'base, s':>12}{'new, s':>12}{'ratio':>8}")
+    slower = 0
+    for sites in sorted(set(base) & set(new)):
+        for name in base[sites]:
+            if name not in new[sites]:
+                continue
+            before = base[sites][name]["seconds"]
+            after = new[sites][name]["seconds"]
+            ratio = after / before if before else float("nan")
+            flag = "  slower" if ratio > args.threshold else ""
+            slower += bool(flag)
+            print(f"{sites:>6}  {name:<16}{before:>12.4f}{after:>12.4f}{ratio:>8.2f}{flag}")
+    return 1 if slower else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
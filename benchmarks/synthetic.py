@@ -0,0 +1,243 @@
+import numpy as np
+import pandas as pd
+
+# equipment names of a typical site, alarm templates (field, direction, threshold range, reporting interval)
+# and schedule periods (days, start, end) the generator picks from
+CHANNEL_NAMES = [
+    "PLAYK",
+    "BROILER",
+    "FRYER 1",
+    "FRYER 2",
+    "LOBBY CLIMA",
+    "KITCHEN CLIMA",
+    "LIGHTING",
+    "WALK-IN FREEZER",
+]
+ALARM_TEMPLATES = [
+    ("P", ">", (200, 800), 300),
+    ("P", ">", (100, 400), 900),
+    ("I", ">", (0.5, 3), 300),
+]
+PERIODS = [
+    ("0,1,2,3,4,5,6", "00:00", "06:00"),
+    ("0,1,2,3,4,5,6", "23:00", "23:59"),
+    ("1,2,3,4,5", "01:00", "07:00"),
+    ("0,6", "00:00", "09:00"),
+]
+
+
+class SyntheticData:
+    """
+    Class for a seeded synthetic set of organizations, channels, alarms and minute readings
+    in the shape returned by the Eniscope API.
+
+    Every site has the same number of channels and alarms per channel, alarms get one rule and one
+    period each and some alarms are disabled. Equipment runs during opening hours and is randomly
+    left on at night, readings have random gaps. Data of a site depends only on the seed and the site
+    number, so scales share their first sites, and a reading only on its channel and minute, so requests
+    of different ranges agree.
+
+    Args:
+        sites (int): Number of organizations.
+        channels (int): Channels per organization.
+        alarms (int): Alarms per channel.
+        tz (str): Timezone of all organizations.
+        seed (int): Random seed.
+        gaps (float): Share of missing readings.
+
+    Methods:
+        organizations(self): Returns organizations as get_organizations_list does.
+        channels_list(self, org_id): Returns channels of an organization as get_channels_list does.
+        alarm_data(self, org_id): Returns alarms, rules and periods as get_alarm_data does.
+        channel_data(self, channel_id, start, end, fields): Returns readings as get_channel_data does.
+    """
+
+    def __init__(self, sites, channels=5, alarms=2, tz="Europe/Madrid", seed=0, gaps=0.005):
+        self.sites = sites
+        self.channels = min(channels, len(CHANNEL_NAMES))
+        self.alarms = alarms
+        self.tz = tz
+        self.seed = seed
+        self.gaps = gaps
+
+    def _rng(self, *key):
+        return np.random.default_rng([self.seed, *key])
+
+    def organizations(self) -> list:
+        return [
+            {
+                "organizationId": str(1000 + site),
+                "organizationName": f"Site {site:04d}",
+                "timeZone": self.tz,
+            }
+            for site in range(self.sites)
+        ]
+
+    def channels_list(self, org_id) -> list:
+        return [
+            {
+                "dataChannelId": str(int(org_id) * 100 + channel),
+                "channelName": CHANNEL_NAMES[channel],
+            }
+            for channel in range(self.channels)
+        ]
+
+    def alarm_data(self, org_id) -> tuple:
+        rng = self._rng(int(org_id))
+        alarms, rules, periods = [], [], []
+        for channel in self.channels_list(org_id):
+            for number in range(self.alarms):
+                alarm_id = str(int(channel["dataChannelId"]) * 10 + number)
+                field, direction, (low, high), interval = ALARM_TEMPLATES[
+                    rng.integers(len(ALARM_TEMPLATES))
+                ]
+                days, start, end = PERIODS[rng.integers(len(PERIODS))]
+                alarms.append(
+                    {
+                        "alarmId": alarm_id,
+                        "alarmName": f"{channel['channelName']} out of hours {number + 1}",
+                        "channelId": channel["dataChannelId"],
+                        "organizationId": str(org_id),
+                        "emailRecipients": "",
+                        "emailTemplateId": 1,
+                        "emailLanguage": "en",
+                        "alarmInterval": 60,
+                        "reportingInterval": str(interval),
+                        "reminderInterval": "3600",
+                        "status": "0" if rng.random() < 0.1 else "1",
+                        "expires": None,
+                        "timeZone": self.tz,
+                    }
+                )
+                rules.append(
+                    {
+                        "alarmRuleId": alarm_id,
+                        "alarmId": alarm_id,
+                        "field": field,
+                        "thresholdType": "abs",
+                        "thresholdDirection": direction,
+                        "thresholdValue": str(round(float(rng.uniform(low, high)), 1)),
+                        "thresholdPeriod": 0,
+                    }
+                )
+                periods.append(
+                    {
+                        "alarmPeriodId": alarm_id,
+                        "alarmId": alarm_id,
+                        "days": days,
+                        "startTime": start,
+                        "endTime": end,
+                        "startDate": None,
+                        "endDate": None,
+                    }
+                )
+        return alarms, rules, periods
+
+    def channel_data(self, channel_id, start, end, fields=None) -> dict:
+        ts = np.arange(int(start), int(end), 60, dtype=np.int64)
+        local = pd.to_datetime(ts, unit="s", utc=True).tz_convert(self.tz)
+        hour = local.hour.to_numpy() + local.minute.to_numpy() / 60
+        # random values are drawn per local day and minute of the day, so a reading does not depend
+        # on the requested range and any two requests of the same minute get the same reading
+        midnight = local.normalize()
+        day_keys = midnight.strftime("%Y%m%d").astype(int).to_numpy()
+        minute = (ts - midnight.asi8 // 10**9) // 60
+
+        # opening hours 07:00-22:00, some nights the equipment is left on until a random hour
+        rated = self._rng(int(channel_id)).uniform(800, 4000)
+        on = (hour >= 7) & (hour < 22)
+        noise = np.empty(ts.size)
+        missing = np.empty(ts.size, dtype=bool)
+        for day in np.unique(day_keys):
+            rng = self._rng(int(channel_id), int(day))
+            rows = day_keys == day
+            left_on, until = rng.random(), rng.uniform(0, 7)
+            if left_on < 0.3:
+                on[rows] |= hour[rows] < until
+            # a day with a DST change has up to 1500 minutes
+            noise[rows] = rng.normal(1, 0.05, 1500)[minute[rows]]
+            missing[rows] = (rng.random(1500) < self.gaps)[minute[rows]]
+        power = np.where(on, rated, rated * 0.02) * noise
+        values = {
+            "P": power,
+            "I": power / 230,
+            "E": power / 60,
+        }
+
+        records = pd.DataFrame({"ts": ts})
+        for field in fields or ["P", "I", "E"]:
+            column = values.get(field, power).round(3)
+            column[missing] = np.nan
+            records[field] = column
+        channel = int(channel_id)
+        return {
+            "channel": channel,
+            "name": CHANNEL_NAMES[channel % 100],
+            "records": records.to_dict("records"),
+        }
+
+
+class SyntheticAPI:
+    """
+    Class serving SyntheticData through the EniscopeAPIClient methods used by hwminutes.
+
+    Readings are generated on the first request and kept, so timed requests measure only the processing
+    of the responses.
+
+    Args:
+        data (SyntheticData): Synthetic data set.
+    """
+
+    def __init__(self, data: SyntheticData):
+        self.data = data
+        self.readings = {}
+
+    def authenticate_user(self):
+        return True
+
+    def get_organizations_list(self, organization_id=None, organization_name=None):
+        return [
+            org
+            for org in self.data.organizations()
+            if organization_name in (None, org["organizationName"])
+            and organization_id in (None, org["organizationId"])
+        ]
+
+    def get_channels_list(self, organization_id):
+        return self.data.channels_list(organization_id)
+
+    def get_alarm_data(self, organization_id, channel_ids=None, channel_names=None):
+        alarms, rules, periods = self.data.alarm_data(organization_id)
+        if channel_ids is None and channel_names is None:
+            return alarms, rules, periods
+        allowed = {str(channel_id) for channel_id in channel_ids or []}
+        allowed |= {
+            channel["dataChannelId"]
+            for channel in self.get_channels_list(organization_id)
+            if channel["channelName"] in (channel_names or [])
+        }
+        alarm_ids = {alarm["alarmId"] for alarm in alarms if alarm["channelId"] in allowed}
+        return tuple(
+            [item for item in items if item["alarmId"] in alarm_ids]
+            for items in (alarms, rules, periods)
+        )
+
+    def get_multiple_channel_data(self, channel_ids, date_ranges, fields=None, resolution=60):
+        data = {}
+        for channel_id in channel_ids:
+            for start, end in date_ranges:
+                key = f"{channel_id}_{start}_{end}"
+                if key not in self.readings:
+                    self.readings[key] = self.data.channel_data(channel_id, start, end, fields)
+                data[key] = self.readings[key]
+        return data
+
+    def stream_channel_data(self, channel_ids, date_ranges, fields=None, resolution=60, queue_size=None):
+        for channel_id in channel_ids:
+            yield channel_id, self.get_multiple_channel_data([channel_id], date_ranges, fields, resolution)
+
+    def forget(self):
+        """
+        Drops generated readings, e.g. after an organization is benchmarked.
+        """
+        self.readings.clear()
@@ -0,0 +1,242 @@
+import os
+import json
+import time, datetime
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# HTTP statuses of Drive API responses which are worth retrying with backoff
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+# files larger than this are uploaded in resumable chunks, smaller ones in a single request
+RESUMABLE_SIZE = 5 * 1024 * 1024
+
+
+def current_time():
+    return datetime.datetime.now().strftime("[%Y-%m-%d %H:%M:%S]: ")
+
+
+def file_md5(file_path, chunk_size=1024 * 1024):
+    """
+    Compute MD5 hex digest of a file, the same checksum Drive reports as md5Checksum.
+
+    Parameters:
+    - file_path (str): Path to the file.
+    - chunk_size (int, optional): Bytes read at a time.
+
+    Returns:
+    - str: MD5 hex digest.
+    """
+    digest = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(manifest_path):
+    """
+    Read the manifest of uploaded files: {file name: {"md5": ..., "id": ...}}.
+    """
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, "r") as f:
+        try:
+            return json.load(f)
+        except ValueError:
+            print(f"{current_time()}Drive manifest is not valid JSON, it will be rebuilt.")
+            return {}
+
+
+def save_manifest(manifest_path, manifest):
+    temp_path = f"{manifest_path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+
+def list_folder(drive_service, folder_id):
+    """
+    List all files of a Drive folder with a single paged query.
+
+    Parameters:
+    - drive_service: The Drive API service instance.
+    - folder_id (str): The ID of the folder.
+
+    Returns:
+    - dict: {"id": ..., "md5": ...} for each file name.
+    """
+    files = {}
+    page_token = None
+    while True:
+        results = execute_with_backoff(
+            drive_service.files().list(
+                q=f"'{folder_id}' in parents and trashed=false",
+                fields="nextPageToken, files(id, name, md5Checksum)",
+                pageSize=1000,
+                pageToken=page_token,
+            )
+        )
+        for item in results.get("files", []):
+            files[item["name"]] = {"id": item["id"], "md5": item.get("md5Checksum")}
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            return files
+
+
+def is_retryable(error):
+    """
+    Check if a Drive API HttpError is a quota or transient server error.
+    """
+    status = getattr(getattr(error, "resp", None), "status", None)
+    if status in RETRY_STATUSES:
+        return True
+    if status == 403:
+        try:
+            details = json.loads(error.content.decode())["error"]["errors"]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return False
+        return any(detail.get("reason") in RATE_LIMIT_REASONS for detail in details)
+    return False
+
+
+def execute_with_backoff(request, retries=5):
+    """
+    Execute a Drive API request, retrying quota and server errors with exponential backoff and jitter.
+
+    Parameters:
+    - request: Drive API request object.
+    - retries (int, optional): Number of retries before the error is raised.
+
+    Returns:
+    - dict: Response of the request.
+    """
+    from googleapiclient.errors import HttpError
+
+    for attempt in range(retries + 1):
+        try:
+            return request.execute()
+        except HttpError as error:
+            if attempt == retries or not is_retryable(error):
+                raise
+            time.sleep(min(64, 2**attempt) + random.random())
+
+
+def upload_file(drive_service, folder_id, file_path, file_id=None):
+    """
+    Upload a file to a given folder on Google Drive, updating the file with given ID if there is one.
+
+    Parameters:
+    - drive_service: The Drive API service instance.
+    - folder_id (str): The ID of the folder to upload the file to.
+    - file_path (str): The path to the file to upload.
+    - file_id (str, optional): The ID of the existing Drive file.
+
+    Returns:
+    - str: The ID of the Drive file.
+    """
+    from googleapiclient.http import MediaFileUpload
+
+    file_name = os.path.basename(file_path)
+    media = MediaFileUpload(
+        file_path, resumable=os.path.getsize(file_path) > RESUMABLE_SIZE
+    )
+    if file_id:
+        # Update the existing file (Note: 'parents' can not be set on update)
+        request = drive_service.files().update(
+            fileId=file_id, body={"name": file_name}, media_body=media, fields="id"
+        )
+    else:
+        request = drive_service.files().create(
+            body={"name": file_name, "parents": [folder_id]},
+            media_body=media,
+            fields="id",
+        )
+    return execute_with_backoff(request)["id"]
+
+
+def sync_folder(
+    service_factory, folder_id, folder_path, manifest_path, max_workers=4, retries=5
+):
+    """
+    Upload new and changed files of a local folder to a Drive folder.
+
+    The Drive folder is listed once. A file is skipped when its MD5 matches the checksum on Drive,
+    or the manifest when Drive does not report one. Changed files are uploaded concurrently,
+    every worker with its own service instance, as Drive service objects are not thread safe.
+
+    Parameters:
+    - service_factory (callable): Function returning a new Drive API service instance.
+    - folder_id (str): The ID of the Drive folder.
+    - folder_path (str): Path to the local folder.
+    - manifest_path (str): Path to the manifest of uploaded files.
+    - max_workers (int, optional): Number of concurrent uploads.
+    - retries (int, optional): Number of retries of quota and server errors per request.
+
+    Returns:
+    - dict: Lists of uploaded, skipped and failed file names.
+    """
+    manifest = load_manifest(manifest_path)
+    remote = list_folder(service_factory(), folder_id)
+
+    to_upload = []
+    skipped = []
+    for file_name in sorted(os.listdir(folder_path)):
+        file_path = os.path.join(folder_path, file_name)
+        # Check if it's a regular file (and not a directory)
+        if not os.path.isfile(file_path):
+            continue
+        md5 = file_md5(file_path)
+        remote_file = remote.get(file_name)
+        known = manifest.get(file_name, {})
+        if remote_file and (
+            remote_file["md5"] == md5
+            or (remote_file["md5"] is None and known == {"id": remote_file["id"], "md5": md5})
+        ):
+            manifest[file_name] = {"id": remote_file["id"], "md5": md5}
+            skipped.append(file_name)
+        else:
+            to_upload.append((file_name, file_path, md5, remote_file))
+
+    local = threading.local()
+
+    def upload_single(file_name, file_path, md5, remote_file):
+        if not hasattr(local, "service"):
+            local.service = service_factory()
+        for attempt in range(retries + 1):
+            try:
+                return upload_file(
+                    local.service,
+                    folder_id,
+                    file_path,
+                    remote_file["id"] if remote_file else None,
+                )
+            except (OSError, ConnectionError):
+                # network errors are not HttpErrors and are retried here
+                if attempt == retries:
+                    raise
+                time.sleep(min(64, 2**attempt) + random.random())
+
+    uploaded = []
+    failed = []
+    if to_upload:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(to_upload)))) as executor:
+            futures = {
+                executor.submit(upload_single, *task): task for task in to_upload
+            }
+            for future in as_completed(futures):
+                file_name, file_path, md5, remote_file = futures[future]
+                try:
+                    file_id = future.result()
+                except Exception as error:
+                    print(f"\t{current_time()}An error occurred uploading {file_path}: {error}")
+                    failed.append(file_name)
+                    continue
+                manifest[file_name] = {"id": file_id, "md5": md5}
+                action = "Updated" if remote_file else "Uploaded"
+                print(f"\t{current_time()}{action} {file_path} on Drive, File ID: {file_id}")
+                uploaded.append(file_name)
+
+    save_manifest(manifest_path, manifest)
+    return {"uploaded": sorted(uploaded), "skipped": skipped, "failed": sorted(failed)}
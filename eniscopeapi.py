@@ -1,8 +1,13 @@
 import requests
 import json
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from cryptography.fernet import Fernet
-import credentials
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+# maximum number of concurrent readings requests
+THREAD_LIMIT = 20
+# channels retrieved by stream_channel_data and waiting to be processed
+STREAM_QUEUE = 8
 
 
 class EniscopeAPIClient:
@@ -16,12 +21,25 @@ class EniscopeAPIClient:
         """
         self.api_key = api_key
         self.base_url = base_url
+        # local credentials module holds the key which encrypts stored user credentials
+        import credentials
+
         self.encoded_auth = None
         self.encryption_key = credentials.encryption_key
         self.headers = None
         self.session = requests.Session()
+        # keep as many pooled connections as concurrent requests in get_multiple_channel_data
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=THREAD_LIMIT, pool_maxsize=THREAD_LIMIT
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
         self.session.headers.update({"X-Eniscope-API": api_key, "Accept": "text/json"})
         self.response = None
+        # concurrent requests which find the session token expired authenticate again only once
+        self.auth_lock = threading.Lock()
+        # optional local minute archive (minutearchive.MinuteArchive) every fetched reading is written to
+        self.archive = None
 
     def authenticate_user(self):
         """
@@ -40,9 +58,11 @@ class EniscopeAPIClient:
 
         decoded_credentials = self.decrypt(encrypted_credentials)
 
+        # an expired token of the session is not sent along with the credentials
         self.headers = {
             "Authorization": f"Basic {decoded_credentials}",
             "Accept": "text/json",  # Default response content type
+            "X-Eniscope-Token": None,
         }
 
         response = self.session.get(self.base_url, headers=self.headers)
@@ -66,13 +86,16 @@ class EniscopeAPIClient:
         Returns:
         - str: The decrypted and decoded data as a string.
         """
+        from cryptography.fernet import Fernet
+
         cipher_suite = Fernet(self.encryption_key)
         decrypted_data = cipher_suite.decrypt(encrypted_data)
         return decrypted_data.decode()
 
     def get_request_data(self, url):
         """
-        Send a GET request and return the JSON response data.
+        Send a GET request and return the JSON response data. A request rejected with 401 after the session
+        token has expired is sent again once the client has authenticated again.
 
         Parameters:
         - url (str): The URL to send the GET request to.
@@ -81,7 +104,16 @@ class EniscopeAPIClient:
         - dict: The JSON response data.
         """
         try:
+            token = self.session.headers.get("X-Eniscope-Token")
             response = self.session.get(url)
+            if response.status_code == 401 and token is not None:
+                # the session token has expired: authenticate again on the same session, unless another
+                # request already did, and repeat the request
+                with self.auth_lock:
+                    if self.session.headers.get("X-Eniscope-Token") == token:
+                        print("Session token expired, authenticating again.")
+                        self.authenticate_user()
+                response = self.session.get(url)
             response.raise_for_status()
             return json.loads(response.text)
         except requests.exceptions.RequestException as e:
@@ -194,13 +226,14 @@ class EniscopeAPIClient:
         Returns:
         - dict: Channel data.
         """
+        # fields are shaped into a local string as the client is shared by concurrent requests
         if not fields:
             url = f"{self.base_url}/readings/{channel_id}/"
             response = self.options_request(url)
-            self.__shape_fields__(response["filters"]["fields"])
+            shaped_fields = self.__shape_fields__(response["filters"]["fields"])
         else:
-            self.__shape_fields__(fields)
-        url = f"{self.base_url}readings/{channel_id}/?action=summarise&{self.fields}daterange[]={start_date}&daterange[]={end_date}&res={resolution}"
+            shaped_fields = self.__shape_fields__(fields)
+        url = f"{self.base_url}readings/{channel_id}/?action=summarise&{shaped_fields}daterange[]={start_date}&daterange[]={end_date}&res={resolution}"
 
         response = self.get_request_data(url)
         return response
@@ -211,10 +244,15 @@ class EniscopeAPIClient:
 
         Parameters:
         - fields (list): List of fields to include in the URL.
+
+        Returns:
+        - str: The 'fields' parameter string.
         """
-        self.fields = ""
+        shaped_fields = ""
         for field in fields:
-            self.fields += f"fields[]={field}&"
+            shaped_fields += f"fields[]={field}&"
+        self.fields = shaped_fields
+        return shaped_fields
 
     def get_multiple_channel_data(
         self, channel_ids, date_ranges, fields=None, resolution=60
@@ -228,11 +266,12 @@ class EniscopeAPIClient:
         - fields (list, optional): List of fields to retrieve. Default is None.
         - resolution (int, optional): The resolution of the data. Default is 60.
 
+        Readings are also written to the client's minute archive, if it has one.
+
         Returns:
         - dict: Dictionary of channel data with keys in the format 'channel_id_start_date_end_date'.
         """
         data = {}
-        THREAD_LIMIT = 20
 
         # Create a generator of all tasks
         tasks = (
@@ -276,14 +315,123 @@ class EniscopeAPIClient:
                 except StopIteration:
                     # No more tasks left
                     pass
+
+        # keep the readings in the local archive, a failed write does not fail the request
+        if self.archive is not None:
+            try:
+                self.archive.store_channel_data(data)
+            except Exception as e:
+                print(f"\nError while archiving readings: {str(e)}")
         return data
 
-    def get_alarm_data(self, organization_id):
+    def stream_channel_data(
+        self, channel_ids, date_ranges, fields=None, resolution=60, queue_size=STREAM_QUEUE
+    ):
+        """
+        Retrieve data for multiple channels and date ranges like get_multiple_channel_data, yielding the data
+        of every channel as soon as all its date ranges are retrieved, so a channel can be processed while
+        the next ones are still requested.
+
+        Requests run in a background thread and retrieved channels wait in a queue of at most queue_size
+        channels. While the queue is full no new requests are sent, so a slow consumer bounds the readings
+        held in memory. Closing the generator early cancels the requests which are not sent yet.
+
+        Parameters:
+        - channel_ids (list): List of channel IDs to retrieve data for, requested in this order.
+        - date_ranges (list): List of date ranges in the format [(start_date, end_date)].
+        - fields (list, optional): List of fields to retrieve. Default is None.
+        - resolution (int, optional): The resolution of the data. Default is 60.
+        - queue_size (int, optional): Maximum number of retrieved channels waiting to be processed.
+
+        Readings are also written to the client's minute archive, if it has one.
+
+        Yields:
+        - tuple: Channel ID and a dictionary of its data with keys in the format 'channel_id_start_date_end_date'.
+        """
+        tasks = iter(
+            [(channel_id, date_range) for channel_id in channel_ids for date_range in date_ranges]
+        )
+        max_workers = min(THREAD_LIMIT, len(channel_ids) * len(date_ranges))
+        if not max_workers:
+            return
+        ready = queue.Queue(maxsize=max(1, queue_size))
+        stop = threading.Event()
+
+        # wait for room in the queue, unless the consumer has stopped
+        def put(item):
+            while not stop.is_set():
+                try:
+                    ready.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def fetch():
+            received = {}
+            try:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    futures = {}
+
+                    def submit_next():
+                        task = next(tasks, None)
+                        if task is not None:
+                            channel_id, (start_date, end_date) = task
+                            future = executor.submit(
+                                self.get_channel_data, channel_id, start_date, end_date, fields, resolution
+                            )
+                            futures[future] = task
+
+                    for _ in range(max_workers):
+                        submit_next()
+                    while futures and not stop.is_set():
+                        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            channel_id, (start_date, end_date) = futures.pop(future)
+                            channel_data = received.setdefault(channel_id, {})
+                            channel_data[f"{channel_id}_{start_date}_{end_date}"] = future.result()
+                            print(".", end="", flush=True)
+                            if len(channel_data) == len(date_ranges):
+                                del received[channel_id]
+                                # a failed archive write does not fail the request
+                                if self.archive is not None:
+                                    try:
+                                        self.archive.store_channel_data(channel_data)
+                                    except Exception as e:
+                                        print(f"\nError while archiving readings: {str(e)}")
+                                # blocks while the queue is full, so no new requests are sent meanwhile
+                                if not put((channel_id, channel_data)):
+                                    return
+                            submit_next()
+                put(None)
+            except Exception as e:
+                put(e)
+
+        thread = threading.Thread(target=fetch, daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = ready.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            thread.join()
+
+    def get_alarm_data(self, organization_id, channel_ids=None, channel_names=None):
         """
         Retrieve alarm data for a specified organization ID with respective alarm rules and periods.
 
+        Rules and periods are requested per alarm, two requests each, so with an allowlist of channels
+        they are requested only for alarms on those channels and other alarms are left out.
+
         Parameters:
         - organization_id (str or list): The ID of the organization to retrieve data for.
+        - channel_ids (list, optional): IDs of the channels whose alarms are retrieved.
+        - channel_names (list, optional): Names of the channels whose alarms are retrieved, resolved with get_channels_list.
 
 
         Returns:
@@ -329,6 +477,20 @@ class EniscopeAPIClient:
             response = self.get_request_data(url)
             alarms_dict = response["alarms"]
 
+        # keep only alarms of the allowed channels, ids are compared as strings as the API returns them
+        if channel_ids is not None or channel_names is not None:
+            allowed = {str(channel_id) for channel_id in channel_ids or []}
+            if channel_names is not None:
+                names = set(channel_names)
+                allowed |= {
+                    str(channel["dataChannelId"])
+                    for channel in self.get_channels_list(organization_id)
+                    if channel.get("channelName") in names
+                }
+            alarms_dict = [
+                alarm for alarm in alarms_dict if str(alarm["channelId"]) in allowed
+            ]
+
         # once list of alarms for one or multiple arganisation is ready, get alarm rules and periods
         # create list of alarm ids
         alarms_id_list = []
@@ -339,7 +501,7 @@ class EniscopeAPIClient:
         alarm_rules_dict = []
         alarm_periods_dict = []
 
-        with ThreadPoolExecutor(max_workers=len(alarms_id_list * 2)) as executor:
+        with ThreadPoolExecutor(max_workers=max(1, len(alarms_id_list * 2))) as executor:
 
             def query_single_rules(alarm_id):
                 try:
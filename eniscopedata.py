@@ -1,4 +1,5 @@
 from typing import List, Set, Union, Optional
+import numpy as np
 import pandas as pd
 
 
@@ -71,6 +72,34 @@ class Schedule:
         self.days = days
         self.time_range = pd.date_range(time_range[0], time_range[1], freq="min").time
         self.tz = tz
+        # minutes of the day of the first and last scheduled minute for vectorized matching
+        if len(self.time_range):
+            self.start_minute = self.time_range[0].hour * 60 + self.time_range[0].minute
+            self.end_minute = self.time_range[-1].hour * 60 + self.time_range[-1].minute
+        else:
+            self.start_minute, self.end_minute = 0, -1
+
+    def _match(self, other: pd.Series) -> pd.Series:
+        """
+        Checks vectorized if local datetimes are in the schedule. Datetimes which are not whole minutes do not match.
+
+        Args:
+            other (pd.Series): Series of datetimes in the schedule timezone.
+
+        Returns:
+            pd.Series: True where the day and time are in the schedule.
+        """
+        dt = other.dt
+        minute = dt.hour * 60 + dt.minute
+        time_match = (
+            (minute >= self.start_minute)
+            & (minute <= self.end_minute)
+            & (dt.second == 0)
+            & (dt.microsecond == 0)
+            & (dt.nanosecond == 0)
+        )
+        day_match = ((dt.dayofweek + 1) % 7).isin(self.days)
+        return time_match & day_match
 
     def __eq__(self, other) -> bool:
         """
@@ -100,39 +129,16 @@ class Schedule:
 
         elif isinstance(other, pd.Series):
             if other.dtypes == f"datetime64[ns, {self.tz}]":
-                time_match = other.apply(lambda x: x.time() in self.time_range)
-                day_match = other.apply(lambda x: (x.dayofweek + 1) % 7 in self.days)
-                return time_match & day_match
+                return self._match(other)
             elif other.dtypes == "datetime64[ns]":
-                time_match = (
-                    other.tz_localize("UTC")
-                    .tz_convert(self.tz)
-                    .apply(lambda x: x.time() in self.time_range)
-                )
-                day_match = (
-                    other.tz_localize("UTC")
-                    .tz_convert(self.tz)
-                    .apply(lambda x: (x.dayofweek + 1) % 7 in self.days)
-                )
-                return time_match & day_match
+                return self._match(other.dt.tz_localize("UTC").dt.tz_convert(self.tz))
             elif other.dtypes == "int64":
-                time_match = other.apply(
-                    lambda x: pd.Timestamp(int(x), unit="s", tz=self.tz)
-                    .floor("min")
-                    .time()
-                    in self.time_range
-                )
-                day_match = other.apply(
-                    lambda x: (
-                        pd.Timestamp(int(x), unit="s", tz=self.tz)
-                        .floor("min")
-                        .dayofweek
-                        + 1
-                    )
-                    % 7
-                    in self.days
-                )
-                return time_match & day_match
+                local = pd.to_datetime(other, unit="s", utc=True)
+                if self.tz:
+                    local = local.dt.tz_convert(self.tz)
+                else:
+                    local = local.dt.tz_localize(None)
+                return self._match(local.dt.floor("min"))
 
         else:
             return False
@@ -192,6 +198,117 @@ class Schedule:
         return f"{formatted_days}: {start_time} to {end_time}"
 
 
+# number of set bits for every possible byte value, used to count active minutes in packed rows
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+class ActivationMatrix:
+    """
+    Class for storing alarm activations of a channel bit-packed, one row per alarm and one bit per minute.
+
+    Args:
+        n_minutes (int): Number of minutes (channel readings) covered by every alarm row.
+        keys (Optional[List]): Alarm keys (e.g. alarm settings line index) to allocate rows for upfront.
+
+    Methods:
+        set(self, key, mask): Stores the activation mask of an alarm.
+        get(self, key): Returns the activation mask of an alarm as a boolean array.
+        active_minutes(self, key): Returns the number of minutes an alarm was active.
+        masked_sum(self, key, values): Sums values over the minutes an alarm was active.
+    """
+
+    def __init__(self, n_minutes: int, keys: Optional[List] = None):
+        self.n_minutes = int(n_minutes)
+        self.n_bytes = (self.n_minutes + 7) // 8
+        self.rows = {}
+        self.bits = np.zeros((len(keys) if keys else 0, self.n_bytes), dtype=np.uint8)
+        for key in keys or []:
+            self._row(key)
+
+    def _row(self, key) -> int:
+        """
+        Returns the row index of an alarm, allocating a new row if the alarm is unknown.
+        """
+        if key not in self.rows:
+            if len(self.rows) == self.bits.shape[0]:
+                grown = np.zeros(
+                    (max(4, 2 * self.bits.shape[0]), self.n_bytes), dtype=np.uint8
+                )
+                grown[: self.bits.shape[0]] = self.bits
+                self.bits = grown
+            self.rows[key] = len(self.rows)
+        return self.rows[key]
+
+    def __contains__(self, key) -> bool:
+        return key in self.rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def keys(self) -> list:
+        return list(self.rows.keys())
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.rows) * self.n_bytes
+
+    def set(self, key, mask):
+        """
+        Stores the activation mask of an alarm, replacing a previously stored one.
+
+        Args:
+            key: Alarm key.
+            mask (Union[np.ndarray, pd.Series]): Boolean mask with one value per minute.
+        """
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != (self.n_minutes,):
+            raise ValueError(
+                f"Mask length {mask.shape[0]} does not match {self.n_minutes} minutes"
+            )
+        row = self._row(key)
+        self.bits[row] = np.packbits(mask)
+
+    def get(self, key) -> np.ndarray:
+        """
+        Returns the activation mask of an alarm.
+
+        Args:
+            key: Alarm key.
+
+        Returns:
+            np.ndarray: Boolean mask with one value per minute.
+        """
+        return np.unpackbits(self.bits[self.rows[key]], count=self.n_minutes).astype(
+            bool
+        )
+
+    def active_minutes(self, key) -> int:
+        """
+        Returns the number of minutes an alarm was active.
+
+        Args:
+            key: Alarm key.
+
+        Returns:
+            int: Number of active minutes.
+        """
+        return int(_POPCOUNT[self.bits[self.rows[key]]].sum())
+
+    def masked_sum(self, key, values) -> float:
+        """
+        Sums values (e.g. energy readings) over the minutes an alarm was active. NaN values are skipped.
+
+        Args:
+            key: Alarm key.
+            values (Union[np.ndarray, pd.Series]): Values with one value per minute.
+
+        Returns:
+            float: Sum of the values for active minutes.
+        """
+        values = np.asarray(values, dtype=float)
+        return float(np.nansum(values[self.get(key)]))
+
+
 # # Function which generate report with calculation results
 def createReport(
     org_name,
@@ -201,6 +318,7 @@ def createReport(
     schedule: Schedule,
     rule: Threshold,
     is_active,
+    energy=None,
 ):
     """
     Function which generate report with calculation results
@@ -212,6 +330,9 @@ def createReport(
         alarm_name (str): Alarm name.
         schedule (Schedule): Schedule object.
         rule (Threshold): Threshold object.
+        is_active (int): Number of minutes the alarm was active.
+        energy (Optional[float]): Energy consumed while the alarm was active, Wh. If None, it is summed
+            over the {field}_alarm_active column of channel_df.
 
     Returns:
         str: Report string.
@@ -219,10 +340,11 @@ def createReport(
 
     active_time = str(pd.to_timedelta(is_active, unit="min"))[-8:-3]
 
-    energy = channel_df[
-        (channel_df["channelId"] == channel_id)
-        & (channel_df[f"{rule.field}_alarm_active"])
-    ]["E"].sum()
+    if energy is None:
+        energy = channel_df[
+            (channel_df["channelId"] == channel_id)
+            & (channel_df[f"{rule.field}_alarm_active"])
+        ]["E"].sum()
 
     channel_name = channel_df[channel_df["channelId"] == channel_id][
         "channelName"
@@ -236,8 +358,324 @@ def createReport(
             "Alarm Rule": [str(rule)],
             "Schedule": [str(schedule)],
             "Active Time, HH:mm": [active_time],
-            "Energy consumed, kWh": [(energy / 1000).round(2)],
+            "Energy consumed, kWh": [round(energy / 1000, 2)],
         }
     )
 
     return report
+
+
+# Function which turns activation masks into episodes of consecutive active minutes
+def extractEpisodes(mask, timestamps, values=None, energy=None, step=60, tz=None):
+    """
+    Function which turns an activation mask into episodes (runs of consecutive active minutes)
+
+    Args:
+        mask (Union[np.ndarray, pd.Series]): Boolean activation mask, one value per reading.
+        timestamps (Union[np.ndarray, pd.Series]): Unix time of every reading, seconds.
+        values (Optional[Union[np.ndarray, pd.Series]]): Values to take the episode peak of, e.g. the alarm field.
+        energy (Optional[Union[np.ndarray, pd.Series]]): Energy of every reading, Wh.
+        step (int): Readings resolution, seconds. A larger gap between active readings starts a new episode.
+        tz (Optional[str]): Timezone to convert episode start and end to. Unix time is returned if None.
+
+    Returns:
+        pd.DataFrame: One row per episode with start, end, duration (minutes), peak and energy (Wh) columns.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    active = np.flatnonzero(mask)
+
+    # an episode breaks where active readings are not adjacent or readings are missing in between
+    breaks = np.ones(active.size, dtype=bool)
+    breaks[1:] = (np.diff(active) != 1) | (np.diff(timestamps[active]) > step)
+    first = np.flatnonzero(breaks)
+    last = np.append(first[1:], active.size)[: first.size] - 1
+
+    episodes = pd.DataFrame(
+        {
+            "start": timestamps[active[first]],
+            "end": timestamps[active[last]] + step,
+            "duration": last - first + 1,
+        }
+    )
+    if active.size == 0:
+        episodes["peak"] = pd.Series(dtype=float)
+        episodes["energy"] = pd.Series(dtype=float)
+    else:
+        if values is not None:
+            # fmax ignores NaN readings unless the whole episode is NaN
+            values = np.asarray(values, dtype=float)[active]
+            episodes["peak"] = np.fmax.reduceat(values, first)
+        else:
+            episodes["peak"] = np.nan
+        if energy is not None:
+            # bincount adds readings one by one in time order, the same way AlarmStream accumulates them
+            energy = np.nan_to_num(np.asarray(energy, dtype=float)[active])
+            episodes["energy"] = np.bincount(
+                np.cumsum(breaks) - 1, weights=energy, minlength=first.size
+            )
+        else:
+            episodes["energy"] = np.nan
+
+    if tz:
+        for column in ["start", "end"]:
+            episodes[column] = pd.to_datetime(
+                episodes[column], unit="s", utc=True
+            ).dt.tz_convert(tz)
+
+    return episodes
+
+
+def _window_means(padded, window: int) -> np.ndarray:
+    """
+    Returns the mean of every window of window values of padded, each window summed on its own from its first
+    value to its last, so a mean depends only on the values of its window.
+    """
+    n_windows = padded.size - window + 1
+    sums = padded[:n_windows].copy()
+    for offset in range(1, window):
+        sums += padded[offset : offset + n_windows]
+    return sums / window
+
+
+# Function which calculates rolling mean of readings of one batch
+def rollingMean(values, window: int):
+    """
+    Function which calculates the mean of every value and the window - 1 values before it
+
+    The mean is NaN if any of the window values is NaN or there are fewer than window values,
+    as pd.Series.rolling(window).mean(). Windows are summed on their own instead of by a running sum,
+    so AlarmStream, which carries the last window - 1 values between batches, gets exactly the same means.
+
+    Args:
+        values (Union[np.ndarray, pd.Series]): Readings, one value per minute.
+        window (int): Number of readings in the window.
+
+    Returns:
+        np.ndarray: Rolling mean of every value.
+    """
+    values = np.asarray(values, dtype=float)
+    if window < 1:
+        return np.full(values.size, np.nan)
+    return _window_means(np.concatenate([np.full(window - 1, np.nan), values]), window)
+
+
+class AlarmStream:
+    """
+    Class for evaluating an alarm incrementally as new readings of its channel arrive.
+
+    The stream carries the last window - 1 readings of the rolling mean, readings whose mean is not known yet
+    (NaN means are back-filled by the next known mean, as in the batch evaluation), the open episode, and
+    active minutes and energy of every local day. An update costs O(batch * window). Means are those of
+    rollingMean and energy is added in the same order, so days, once closed, and closed episodes are
+    identical to the batch evaluation of the same readings.
+
+    Args:
+        rule (Threshold): Alarm threshold.
+        schedule (Schedule): Alarm schedule; its timezone defines local days.
+        step (int): Readings resolution, seconds. A larger gap between active readings starts a new episode.
+        valid (tuple): First and last local date (YYYY-MM-DD) the alarm may fire on, None if not limited.
+            Readings of other days are never active.
+
+    Methods:
+        update(self, ts, values, energy): Adds readings and returns the episodes they closed.
+        flush(self): Ends the stream and returns the remaining episodes.
+        closed_days(self): Returns the days no further reading can change.
+        pop_closed(self): Returns and forgets active minutes and energy of closed days.
+    """
+
+    def __init__(self, rule: Threshold, schedule: Schedule, step: int = 60, valid: tuple = (None, None)):
+        self.rule = rule
+        self.schedule = schedule
+        self.tz = schedule.tz or "UTC"
+        self.step = step
+        self.valid = valid
+        # last window - 1 readings, missing ones before the first reading count as NaN
+        self.window_values = np.full(max(0, self.rule.reportInterval - 1), np.nan)
+        # readings waiting for the next known mean: ts, values, energy
+        self.pending = (np.empty(0, dtype=np.int64), np.empty(0), np.empty(0))
+        # open episode: start, last ts, duration, peak, energy
+        self.episode = None
+        self.last_ts = None
+        self.minutes = {}
+        self.energy = {}
+        self.days = []
+        self.flushed = False
+
+    def _episodes(self, start, last, duration, peak, energy) -> pd.DataFrame:
+        episodes = pd.DataFrame(
+            {
+                "start": np.asarray(start, dtype=np.int64),
+                "end": np.asarray(last, dtype=np.int64) + self.step,
+                "duration": np.asarray(duration, dtype=np.int64),
+                "peak": np.asarray(peak, dtype=float),
+                "energy": np.asarray(energy, dtype=float),
+            }
+        )
+        for column in ["start", "end"]:
+            episodes[column] = pd.to_datetime(
+                episodes[column], unit="s", utc=True
+            ).dt.tz_convert(self.tz)
+        return episodes
+
+    def _finalize(self, ts, values, energy, means) -> pd.DataFrame:
+        """
+        Evaluates readings with known means: updates day totals and episodes.
+        """
+        local = pd.Series(pd.to_datetime(ts, unit="s", utc=True)).dt.tz_convert(self.tz)
+        active = (self.schedule._match(local) & (self.rule == pd.Series(means))).to_numpy()
+        day_codes, day_starts = pd.factorize(local.dt.normalize())
+        dates = list(day_starts.strftime("%Y-%m-%d"))
+        first, last = self.valid
+        valid_days = np.array(
+            [(first is None or date >= first) and (last is None or date <= last) for date in dates], dtype=bool
+        )
+        active &= valid_days[day_codes]
+        for date in dates:
+            if not self.days or self.days[-1] != date:
+                self.days.append(date)
+
+        # active minutes and energy of every day, energy added one reading at a time after the carried sum
+        energy = np.nan_to_num(energy)
+        active_days = day_codes[active]
+        day_minutes = np.bincount(active_days, minlength=len(dates))
+        day_energy = np.bincount(
+            np.concatenate([np.arange(len(dates)), active_days]),
+            weights=np.concatenate(
+                [[self.energy.get(date, 0.0) for date in dates], energy[active]]
+            ),
+            minlength=len(dates),
+        )
+        for code in np.flatnonzero(day_minutes):
+            self.minutes[dates[code]] = self.minutes.get(dates[code], 0) + int(
+                day_minutes[code]
+            )
+            self.energy[dates[code]] = float(day_energy[code])
+
+        # episodes, the first one continues the open episode if its readings are adjacent
+        rows = np.flatnonzero(active)
+        continues = (
+            self.episode is not None
+            and rows.size > 0
+            and rows[0] == 0
+            and ts[0] - self.episode[1] <= self.step
+        )
+        breaks = np.ones(rows.size, dtype=bool)
+        breaks[1:] = (np.diff(rows) != 1) | (np.diff(ts[rows]) > self.step)
+        if continues:
+            breaks[0] = False
+        labels = np.cumsum(breaks) - (0 if continues else 1)
+        n_episodes = int(labels[-1]) + 1 if rows.size else 0
+
+        starts, lasts, durations, peaks, energies = [], [], [], [], []
+        carried = [self.episode] if self.episode is not None and not continues else []
+        if n_episodes:
+            first = np.flatnonzero(np.append(True, labels[1:] != labels[:-1]))
+            last = np.append(first[1:], rows.size) - 1
+            starts = ts[rows[first]]
+            lasts = ts[rows[last]]
+            durations = last - first + 1
+            peaks = np.fmax.reduceat(values[rows], first)
+            energies = np.bincount(
+                np.concatenate([[0], labels]),
+                weights=np.concatenate(
+                    [[self.episode[4] if continues else 0.0], energy[rows]]
+                ),
+                minlength=n_episodes,
+            )
+            if continues:
+                starts[0] = self.episode[0]
+                durations[0] += self.episode[2]
+                peaks[0] = np.fmax(peaks[0], self.episode[3])
+        closed = carried + list(zip(starts, lasts, durations, peaks, energies))
+
+        # the last episode stays open while the last reading is active
+        self.episode = closed.pop() if active.size and active[-1] else None
+        self.last_ts = int(ts[-1])
+        return self._episodes(*zip(*closed)) if closed else self._episodes([], [], [], [], [])
+
+    def _rolling_means(self, values) -> np.ndarray:
+        """
+        Returns rolling means of new readings, the windows of the first ones start with the carried readings.
+        """
+        window = self.rule.reportInterval
+        if window < 1:
+            return np.full(values.size, np.nan)
+        padded = np.concatenate([self.window_values, values])
+        self.window_values = padded[values.size :]
+        return _window_means(padded, window)
+
+    def update(self, ts, values, energy) -> pd.DataFrame:
+        """
+        Adds readings of the channel, in time order after the readings already added.
+
+        Args:
+            ts (Union[np.ndarray, pd.Series]): Unix time of every reading, seconds.
+            values (Union[np.ndarray, pd.Series]): Readings of the alarm field.
+            energy (Union[np.ndarray, pd.Series]): Energy of every reading, Wh.
+
+        Returns:
+            pd.DataFrame: Episodes closed by the readings, as returned by extractEpisodes.
+        """
+        ts = np.asarray(ts, dtype=np.int64)
+        values = np.asarray(values, dtype=float)
+        energy = np.asarray(energy, dtype=float)
+        means = self._rolling_means(values)
+
+        # readings up to the last known mean are evaluated, the rest wait for the next known mean
+        ts, values, energy = (
+            np.concatenate([waiting, new])
+            for waiting, new in zip(self.pending, (ts, values, energy))
+        )
+        means = np.concatenate([np.full(ts.size - means.size, np.nan), means])
+        known = np.flatnonzero(~np.isnan(means))
+        ready = known[-1] + 1 if known.size else 0
+        self.pending = (ts[ready:], values[ready:], energy[ready:])
+        if ready == 0:
+            return self._episodes([], [], [], [], [])
+        means = pd.Series(means[:ready]).bfill().to_numpy()
+        return self._finalize(ts[:ready], values[:ready], energy[:ready], means)
+
+    def flush(self) -> pd.DataFrame:
+        """
+        Ends the stream: readings without a known mean are inactive and the open episode is closed.
+
+        Returns:
+            pd.DataFrame: Episodes closed by the end of the stream.
+        """
+        ts, values, energy = self.pending
+        self.pending = (ts[:0], values[:0], energy[:0])
+        if ts.size:
+            episodes = self._finalize(ts, values, energy, np.full(ts.size, np.nan))
+        else:
+            episodes = self._episodes([], [], [], [], [])
+        if self.episode is not None:
+            episodes = pd.concat(
+                [episodes, self._episodes(*zip(self.episode))], ignore_index=True
+            )
+            self.episode = None
+        self.flushed = True
+        return episodes
+
+    def closed_days(self) -> list:
+        """
+        Returns days in YYYY-MM-DD format no further reading can change, i.e. all days before the day
+        of the last evaluated reading, or all days once the stream is flushed.
+        """
+        return self.days if self.flushed else self.days[:-1]
+
+    def pop_closed(self) -> dict:
+        """
+        Returns active minutes and energy (Wh) of closed days with activations and forgets all closed days.
+
+        Returns:
+            dict: (minutes, energy) for every closed day with active minutes.
+        """
+        closed = self.closed_days()
+        totals = {
+            date: (self.minutes.pop(date), self.energy.pop(date))
+            for date in closed
+            if date in self.minutes
+        }
+        self.days = [] if self.flushed else self.days[-1:]
+        return totals
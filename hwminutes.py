@@ -2,18 +2,71 @@
 # script using the eniscope API to retrive organization alarm settings and control monitored equipment work our of working hours
 # version 1.1
 import eniscopeapi as es
+import numpy as np
 import pandas as pd
-import credentials as cr
 import time, datetime
-import os, ast, pprint
-
-import openpyxl
-from openpyxl.styles import Font, Border, Side, PatternFill, Alignment
+import os, ast, pprint, argparse, functools, threading, contextlib
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import eniscopedata as ed
+from summarystore import SummaryStore
+import reportwriter
+import drivesync
+from runjournal import RunJournal
+import runprofile
+from minutearchive import MinuteArchive
+import sharedeval
 
 # %%
 
-config_file = "orgs_to_monitor.cfg"
 UPLOAD_FILES = True
+# number of top incidents (by energy) listed per report day, 0 to skip the episodes sheet
+TOP_EPISODES = 10
+# number of organizations processed at the same time and the pool running them ("thread" or "process")
+ORG_WORKERS = 4
+ORG_EXECUTOR = "thread"
+
+REPORTS_FOLDER = "./reports"
+SUMMARY_FILE = "./reports/hwminutes_summary.xlsx"
+# summary store is the system of record, SUMMARY_FILE is its Excel export, written on request as it rewrites all history
+SUMMARY_DB = "./hwminutes_summary.db"
+EXPORT_SUMMARY = False
+# update feedback loop sheets at the end of a run from the summary in memory
+UPDATE_SHEETS = False
+
+# Google Drive service account JSON key file and the ID of the folder where reports are uploaded.
+# You can get the folder ID from the folder's URL on Google Drive: https://drive.google.com/drive/folders/YOUR_FOLDER_ID
+SERVICE_ACCOUNT_FILE = "feedbackloop-399807-300aec3efe37.json"
+FOLDER_ID = "1G1YUlZZQV52sBZ1lpefHcV2EbPb8u8M-"  # the folder ID of Projects/HW Minutes/ folder to store the files
+# stage outputs of runs for --resume, kept for JOURNAL_KEEP_DAYS
+JOURNAL_FOLDER = "./journal"
+JOURNAL_KEEP_DAYS = 7
+# run reports and cProfile dumps of profiled runs
+PROFILE_FOLDER = "./profiles"
+# local memory-mapped archive of all fetched minute readings
+ARCHIVE_READINGS = True
+ARCHIVE_FOLDER = "./archive"
+# estimated memory of one minute reading while it is fetched (parsed JSON) and framed, used to size channel chunks
+READING_BYTES = 1024
+# readings of all monitored channels ("full"), only around Eniscope alarm events ("events"),
+# or both with the events path checked against the full one ("events-check")
+READINGS_MODE = "full"
+# fields of Eniscope events: the alarm which sent the event and the Unix time it was sent at
+EVENT_ALARM = "alarmId"
+EVENT_TIME = "ts"
+# reminder interval assumed for alarms without one and extra margin around event spans, seconds
+EVENT_REMINDER = 3600
+EVENT_MARGIN = 600
+# processes evaluating alarms of one organization, None or 1 to evaluate them in the organization's worker
+EVAL_WORKERS = None
+# evaluate every channel as soon as its readings arrive and write Excel reports in a background thread;
+# channels waiting for evaluation and reports waiting for the writer are bounded by the queue sizes
+PIPELINE = False
+PIPELINE_QUEUE = 8
+WRITE_QUEUE = 2
+# content hashes and Drive file ids of uploaded reports, and number of concurrent uploads
+DRIVE_MANIFEST = "./drive_manifest.json"
+UPLOAD_WORKERS = 4
 
 # define list of organizations and equipment datachannels to be monitored
 default_config = {
@@ -45,13 +98,13 @@ default_config = {
         "LOBBY CLIMA",
     ],
 }
-# check if configuration file orgs_to_monitor.cfg exist, if yes, then read it into monitoring list dictionary, if not - then create a new one and store as JSON default_monitoring_list
+# check if configuration file orgs_to_monitor.conf exist, if yes, then read it into monitoring list dictionary, if not - then create a new one and store as JSON default_monitoring_list
 
 
 config_file = "orgs_to_monitor.conf"
 
 
-def write_default_config():
+def write_default_config(config_file=config_file):
     with open(config_file, "w") as f:
         f.write(pprint.pformat(default_config))
 
@@ -60,7 +113,7 @@ def current_time():
     return datetime.datetime.now().strftime("[%Y-%m-%d %H:%M:%S]: ")
 
 
-def read_config():
+def read_config(config_file=config_file):
     with open(config_file, "r") as f:
         content = f.read()
         try:
@@ -72,73 +125,172 @@ def read_config():
             return {}
 
 
-# Check if the configuration file exists
-if not os.path.exists(config_file):
-    write_default_config()
-    monitoring_list = default_config
-else:
-    monitoring_list = read_config()
+def load_monitoring_list(config_file=config_file):
+    """
+    Read the monitoring list from the configuration file, creating the file with the default configuration if it does not exist.
 
-    # report export to excel file
-folder_path = f"./reports"
-if not os.path.exists(folder_path):
-    os.makedirs(folder_path)
+    Parameters:
+    - config_file (str, optional): Path to the configuration file.
 
-# check if hwminutes_summary.csv exists, then read it to dataframe hwminutes_summary
-if not os.path.exists("./reports/hwminutes_summary.xlsx"):
-    hwminutes_summary = pd.DataFrame()
-else:
-    hwminutes_summary = pd.read_excel("./reports/hwminutes_summary.xlsx")
+    Returns:
+    - dict: Monitored channel names for each organization name.
+    """
+    if not os.path.exists(config_file):
+        write_default_config(config_file)
+        return default_config
+    return read_config(config_file)
 
 
-# %%
-start_time = time.time()
-# create the API object
-api = es.EniscopeAPIClient(cr.api_key)
-
-# authenticate the API object
-if not api.authenticate_user():
-    print(f"{current_time()}Authentication failed")
-    exit()
-else:
-    print(f"{current_time()}Authentication successful")
+def report_window(tz, report_date=None):
+    """
+    Compute the report day boundaries as Unix time, normalized to midnight in the organization timezone.
 
-# Run dtata collection and report prepare for ech organisation in the monitoring list
+    Parameters:
+    - tz (str): Organization timezone.
+    - report_date (str, optional): Report date in YYYY-MM-DD format. Default is yesterday in the organization timezone.
 
-for org_to_monitor in monitoring_list.keys():
-    # get organization id for the organization to be monitored
-    print(
-        f'{current_time()}Getting organization id for "{org_to_monitor}"...',
-        end="",
-        flush=True,
-    )
-    org = api.get_organizations_list(organization_name=org_to_monitor)[0]
-    print("done")
-    org_id = org["organizationId"]
+    Returns:
+    - int: Unix time of the report day start.
+    - int: Unix time of the report day end.
+    - str: Report date in YYYY-MM-DD format.
+    """
+    if report_date is None:
+        day = pd.Timestamp.now(tz=tz).date() - datetime.timedelta(days=1)
+    else:
+        day = pd.Timestamp(report_date).date()
 
-    # get list of channels for the organization
-    print(
-        f'{current_time()}Getting list of channels for "{org_to_monitor}"...',
-        end="",
-        flush=True,
-    )
-    channels = api.get_channels_list(organization_id=org_id)
-    print("done")
+    # localize both midnights separately, so days with a DST change are 23 or 25 hours long
+    def midnight(date):
+        return int(
+            pd.Timestamp(date)
+            .tz_localize(tz, ambiguous=True, nonexistent="shift_forward")
+            .timestamp()
+        )
 
-    # retrive the alarm settings for the organization
-    print(
-        f'{current_time()}Getting alarm settings for "{org_to_monitor}"...',
-        end="",
-        flush=True,
+    return (
+        midnight(day),
+        midnight(day + datetime.timedelta(days=1)),
+        day.strftime("%Y-%m-%d"),
     )
-    alarms, rules, periods = api.get_alarm_data(organization_id=org_id)
-    print("done")
 
-    # %%
-    # create dataframes for channels, alarms, rules and periods for the whole organization
 
-    print(f"{current_time()}Alarms data prerocessing...", end="")
+def report_days(tz, report_date=None, end_date=None):
+    """
+    Compute boundaries of all report days from report_date to end_date, inclusive.
+
+    Parameters:
+    - tz (str): Organization timezone.
+    - report_date (str, optional): First report date in YYYY-MM-DD format. Default is yesterday in the organization timezone.
+    - end_date (str, optional): Last report date in YYYY-MM-DD format for a backfill, not before report_date.
+      Default is report_date.
+
+    Returns:
+    - list: (start, end, date) tuples as returned by report_window, one per day.
+    """
+    days = [report_window(tz, report_date)]
+    if end_date is not None:
+        if pd.Timestamp(end_date) < pd.Timestamp(days[0][2]):
+            raise ValueError(f"End date {end_date} is before report date {days[0][2]}")
+        for day in pd.date_range(days[0][2], end_date, freq="D")[1:]:
+            days.append(report_window(tz, day.strftime("%Y-%m-%d")))
+    return days
+
+
+def report_day_codes(ts, tz, days=None, active_spans=None):
+    """
+    Assign readings to report days, DST-correct as day boundaries are local midnights.
+
+    Parameters:
+    - ts (np.ndarray): Unix times of the readings, sorted within every channel.
+    - tz (str): Organization timezone.
+    - days (list, optional): (start, end, date) tuples of the report days as returned by report_days.
+      Default is one day covering all readings.
+    - active_spans (list, optional): (start, end) Unix time spans, readings out of them get no day, see in_spans.
+
+    Returns:
+    - list: The report days.
+    - np.ndarray: Report day index of every reading, -1 for readings out of the report days and spans.
+    """
+    if days is None:
+        first = pd.to_datetime(ts.min(), unit="s", utc=True).tz_convert(tz)
+        days = [(int(ts.min()), int(ts.max()) + 60, first.strftime("%Y-%m-%d"))]
+    day_starts = np.array([day[0] for day in days])
+    day_codes = np.searchsorted(day_starts, ts, side="right") - 1
+    day_codes[(day_codes < 0) | (ts >= days[-1][1])] = -1
+    if active_spans is not None:
+        day_codes[~in_spans(ts, active_spans)] = -1
+    return days, day_codes
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_schedule(days, startTime, endTime, tz):
+    """
+    Build a Schedule once for each distinct alarm period, so repeated evaluations reuse it.
+
+    Parameters:
+    - days (frozenset): Days of the week (0-6, where 0 is Sunday).
+    - startTime (str): Start time in HH:MM format.
+    - endTime (str): End time in HH:MM format.
+    - tz (str): Organization timezone.
+
+    Returns:
+    - Schedule: Schedule object.
+    """
+    return ed.Schedule(set(days), [startTime, endTime], tz=tz)
+
+
+# columns of alarm settings selected by get_alarm_settings
+ALARM_SETTINGS_COLUMNS = [
+    "alarmId",
+    "alarmName",
+    "channelId",
+    "channelName",
+    "emailRecipients",
+    "emailTemplateId",
+    "emailLanguage",
+    "alarmInterval",
+    "reportingInterval",
+    "reminderInterval",
+    "status",
+    "expires",
+    "timeZone",
+    "alarmRuleId",
+    "field",
+    "thresholdType",
+    "thresholdDirection",
+    "thresholdValue",
+    "thresholdPeriod",
+    "alarmPeriodId",
+    "days",
+    "startTime",
+    "endTime",
+    "startDate",
+    "endDate",
+]
+
+
+def get_alarm_settings(api, org_id, channel_names):
+    """
+    Retrieve channels and alarm settings of an organization and select alarms of the monitored channels.
+
+    Parameters:
+    - api (EniscopeAPIClient): Authenticated API client.
+    - org_id (str): The ID of the organization.
+    - channel_names (list): Names of the monitored channels.
+
+    Returns:
+    - pd.DataFrame: Alarm settings (alarm, rule and period) for the monitored channels.
+    """
+    channels = api.get_channels_list(organization_id=org_id)
+    # rules and periods are requested only for alarms of the monitored channels
+    monitored_ids = [
+        channel["dataChannelId"] for channel in channels if channel["channelName"] in channel_names
+    ]
+    alarms, rules, periods = api.get_alarm_data(organization_id=org_id, channel_ids=monitored_ids)
+    if not alarms or not rules or not periods:
+        return pd.DataFrame(columns=ALARM_SETTINGS_COLUMNS)
 
+    # create dataframes for channels, alarms, rules and periods for the whole organization
     channels_df = pd.DataFrame.from_dict(channels)
     alarms_df = pd.DataFrame.from_dict(alarms)
     rules_df = pd.DataFrame.from_dict(rules)
@@ -177,8 +329,6 @@ for org_to_monitor in monitoring_list.keys():
         lambda x: pd.to_numeric(x, errors="ignore", downcast="integer")
     )
 
-    # %%
-
     # convert period_df days column from string to list of integers
     periods_df["days"] = periods_df["days"].apply(
         lambda x: [int(i) for i in x.split(",")]
@@ -188,195 +338,593 @@ for org_to_monitor in monitoring_list.keys():
     merged_df = pd.merge(alarms_df, rules_df, on="alarmId", how="inner")
     merged_df = pd.merge(merged_df, periods_df, on="alarmId", how="inner")
 
-    # Select the columns you want to include in the final result
-    selected_columns = [
-        "alarmId",
-        "alarmName",
-        "channelId",
-        "channelName",
-        "emailRecipients",
-        "emailTemplateId",
-        "emailLanguage",
-        "alarmInterval",
-        "reportingInterval",
-        "reminderInterval",
-        "status",
-        "expires",
-        "timeZone",
-        "alarmRuleId",
-        "field",
-        "thresholdType",
-        "thresholdDirection",
-        "thresholdValue",
-        "thresholdPeriod",
-        "alarmPeriodId",
-        "days",
-        "startTime",
-        "endTime",
-        "startDate",
-        "endDate",
-    ]
-
     # Extract the selected columns and transpose to create a one-row DataFrame
-    alarm_settings = merged_df[selected_columns]
+    alarm_settings = merged_df[ALARM_SETTINGS_COLUMNS]
 
     # filter out dataframes for the channels, alarms, rules and periods to be monitored
+    return alarm_settings[alarm_settings["channelName"].isin(channel_names)]
+
+
+def alarm_date(value, tz):
+    """
+    Convert an alarm or period date setting to a local timestamp, None if it is not set or not a valid date.
+    """
+    if value is None or value in ("", 0, "0"):
+        return None
+    date = pd.to_datetime(value, utc=True, errors="coerce")
+    if pd.isna(date):
+        return None
+    return date.tz_convert(tz)
+
+
+def alarm_validity(alarm, tz):
+    """
+    Tell the first and last local date an alarm may fire on: its period start date, and the earlier of
+    its period end date and expiry.
+
+    Parameters:
+    - alarm (pd.Series): Alarm settings line.
+    - tz (str): Organization timezone.
+
+    Returns:
+    - tuple: First and last date in YYYY-MM-DD format, None if the alarm is not limited.
+    """
+    start = alarm_date(alarm.startDate, tz)
+    ends = [end for end in (alarm_date(alarm.endDate, tz), alarm_date(alarm.expires, tz)) if end is not None]
+    return (
+        start.strftime("%Y-%m-%d") if start is not None else None,
+        min(ends).strftime("%Y-%m-%d") if ends else None,
+    )
 
-    alarms_to_monitor = alarm_settings[
-        alarm_settings["channelName"].isin(monitoring_list[org_to_monitor])
-    ]
-
-    print("done")
 
-    # %%
-    # Portion of code to pull last day of data for monitored channels
-    # set the start and end dates for the data pull. Integer Unix time normalized to midnight and linked to the Organization timezone
-    startTimestamp = (
-        int(
-            pd.to_datetime("now", utc=True)
-            .tz_convert(org["timeZone"])
-            .normalize()
-            .timestamp()
-        )
-        - 86400
-    )
-    endTimestamp = int(
-        pd.to_datetime("now", utc=True)
-        .tz_convert(org["timeZone"])
-        .normalize()
-        .timestamp()
-    )
+def alarm_valid_days(alarm, days, tz):
+    """
+    Tell which report days an alarm may fire on: days from its period start date to its period end date and expiry,
+    compared by whole local days as plan_alarms does, see alarm_validity.
+
+    Parameters:
+    - alarm (pd.Series): Alarm settings line.
+    - days (list): (start, end, date) tuples of the report days as returned by report_days.
+    - tz (str): Organization timezone.
+
+    Returns:
+    - np.ndarray: True for every report day within the alarm's validity.
+    """
+    first, last = alarm_validity(alarm, tz)
+    dates = np.array([date for _, _, date in days])
+    valid = np.ones(len(days), dtype=bool)
+    if first is not None:
+        valid &= dates >= first
+    if last is not None:
+        valid &= dates <= last
+    return valid
+
+
+def plan_alarms(alarms_to_monitor, days, tz):
+    """
+    Select alarms which can fire in the report days from their settings alone, before any readings are requested.
+
+    An alarm is dropped if it is disabled, has expired or its period ended before the first day or starts after the last one,
+    if its period is empty (e.g. it ends before it starts) or none of the report days is one of its weekdays.
+    Dates are compared by whole days, so an alarm is kept if it may fire on any report day; evaluate_alarms
+    then counts only the days within its validity, see alarm_valid_days.
+
+    Parameters:
+    - alarms_to_monitor (pd.DataFrame): Alarm settings of the monitored channels.
+    - days (list): (start, end, date) tuples of the report days as returned by report_days.
+    - tz (str): Organization timezone.
+
+    Returns:
+    - pd.DataFrame: Alarm settings of the alarms which can fire.
+    - dict: Number of dropped alarms per reason, alarms, channels and readings requests before and after planning.
+    """
+    window_start = pd.Timestamp(days[0][0], unit="s", tz=tz)
+    window_end = pd.Timestamp(days[-1][1], unit="s", tz=tz)
+    # weekdays of the report days, 0 is Sunday as in alarm periods
+    weekdays = {(pd.Timestamp(date).dayofweek + 1) % 7 for _, _, date in days}
+
+    def drop_reason(alarm):
+        if alarm.status != 1:
+            return "disabled"
+        expires = alarm_date(alarm.expires, tz)
+        if expires is not None and expires.normalize() + pd.Timedelta(days=1) <= window_start:
+            return "expired"
+        end = alarm_date(alarm.endDate, tz)
+        if end is not None and end.normalize() + pd.Timedelta(days=1) <= window_start:
+            return "period ended"
+        start = alarm_date(alarm.startDate, tz)
+        if start is not None and start.normalize() >= window_end:
+            return "period not started"
+        if not len(compile_schedule(frozenset(alarm.days), alarm.startTime, alarm.endTime, tz).time_range):
+            return "empty period"
+        if not weekdays & set(alarm.days):
+            return "no scheduled day"
+        return None
+
+    reasons = alarms_to_monitor.apply(drop_reason, axis=1) if len(alarms_to_monitor) else pd.Series(dtype=object)
+    planned = alarms_to_monitor[reasons.isna()] if len(alarms_to_monitor) else alarms_to_monitor
+
+    channels = alarms_to_monitor["channelId"].nunique()
+    planned_channels = planned["channelId"].nunique()
+    plan = {
+        "alarms": len(alarms_to_monitor),
+        "planned_alarms": len(planned),
+        "dropped": reasons.dropna().value_counts().to_dict(),
+        "channels": channels,
+        "planned_channels": planned_channels,
+        # readings are requested per channel and day
+        "requests": channels * len(days),
+        "saved_requests": (channels - planned_channels) * len(days),
+    }
+    return planned, plan
+
+
+def get_channel_frame(api, alarms_to_monitor, date_ranges, tz, profiler=None, org="*"):
+    """
+    Pull readings of the channels with monitored alarms and combine them into a single dataframe.
+
+    Parameters:
+    - api (EniscopeAPIClient): Authenticated API client.
+    - alarms_to_monitor (pd.DataFrame): Alarm settings of the monitored channels.
+    - date_ranges (list): List of (startTimestamp, endTimestamp) Unix time ranges, e.g. one per report day.
+    - tz (str): Organization timezone.
+    - profiler (StageProfiler, optional): Profiler timing the fetch and frame stages.
+    - org (str, optional): Organization name the stages are recorded for.
+
+    Returns:
+    - pd.DataFrame: Readings of all channels sorted by channel and time, with channelId, channelName and datetime columns.
+    """
     fields = list(alarms_to_monitor["field"].unique())
     # add Energy meter into a list if thereis not E in the list
     if "E" not in fields:
         fields.append("E")
-
-    print(
-        f'{current_time()}Geting channels readings for {org_to_monitor} for {pd.to_datetime(startTimestamp, unit="s", utc=True).tz_convert(org["timeZone"]).date()}...',
-        end="",
-        flush=True,
-    )
-    channel_data = api.get_multiple_channel_data(
-        list(alarms_to_monitor["channelId"].unique()),
-        [(startTimestamp, endTimestamp)],
-        fields=fields,
-    )
-    channel_data_df = pd.DataFrame()
-    for channel in channel_data.values():
-        df = pd.DataFrame(channel["records"])
-        df["channelId"] = channel["channel"]
-        df["channelName"] = channel["name"]
-        df["datetime"] = pd.to_datetime(df["ts"], unit="s", utc=True).dt.tz_convert(
-            org["timeZone"]
+    # nothing to request if no alarm can fire
+    if alarms_to_monitor.empty:
+        return build_channel_frame({}, fields, tz)
+
+    # all channels and days are requested as one batch
+    with runprofile.stage(profiler, org, "fetch"):
+        channel_data = api.get_multiple_channel_data(
+            list(alarms_to_monitor["channelId"].unique()),
+            date_ranges,
+            fields=fields,
         )
-        channel_data_df = pd.concat([channel_data_df, df], ignore_index=True)
+    with runprofile.stage(profiler, org, "frame"):
+        return build_channel_frame(channel_data, fields, tz)
 
-    channel_data_df
 
-    print("done")
+def build_channel_frame(channel_data, fields, tz):
+    """
+    Combine channel readings as returned by get_multiple_channel_data into a single dataframe.
 
-    # %%
+    Parameters:
+    - channel_data (dict): Readings of every channel and date range.
+    - fields (list): Requested fields.
+    - tz (str): Organization timezone.
 
-    import eniscopedata as ed
+    Returns:
+    - pd.DataFrame: Readings of all channels sorted by channel and time, with channelId, channelName and datetime columns.
+    """
+    frames = []
+    for channel in channel_data.values():
+        df = pd.DataFrame(channel["records"])
+        df["channelId"] = channel["channel"]
+        df["channelName"] = channel["name"]
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=["ts", *fields, "channelId", "channelName", "datetime"])
+
+    channel_data_df = (
+        pd.concat(frames, ignore_index=True)
+        .sort_values(["channelId", "ts"], kind="stable")
+        .reset_index(drop=True)
+    )
+    channel_data_df["datetime"] = pd.to_datetime(
+        channel_data_df["ts"], unit="s", utc=True
+    ).dt.tz_convert(tz)
+    return channel_data_df
+
+
+def event_time(value, tz):
+    """
+    Convert an event time (Unix time or a date string, local time if it has no offset) to Unix time, None if it is not valid.
+    """
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    try:
+        if isinstance(value, (int, float, np.integer, np.floating)) or str(value).isdigit():
+            return int(float(value))
+        timestamp = pd.Timestamp(value)
+    except (ValueError, TypeError):
+        return None
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize(tz, ambiguous=True, nonexistent="shift_forward")
+    return int(timestamp.timestamp())
+
+
+def event_spans(events, alarms_to_monitor, days, tz):
+    """
+    Derive the time spans in which monitored alarms can have been active from their Eniscope events.
+
+    An event is sent once an alarm's reporting interval mean has broken the threshold for its alarm interval and
+    is repeated every reminder interval while it stays broken. An activation therefore starts at most
+    reporting + alarm interval before an event and ends before the next reminder would have been sent.
+    Readings are fetched from one more reporting interval before a span, so rolling means in the span are
+    complete; activations are only counted within the spans. Spans are merged and clipped to the report days.
+    Activations shorter than the alarm interval raise no event, so they are missed by the events path.
+
+    Parameters:
+    - events (list): Events as returned by get_events_list.
+    - alarms_to_monitor (pd.DataFrame): Alarm settings of the monitored channels.
+    - days (list): (start, end, date) tuples of the report days as returned by report_days.
+    - tz (str): Organization timezone.
+
+    Returns:
+    - list: IDs of the channels with events.
+    - list: Merged (start, end) Unix time spans to fetch readings for.
+    - list: Merged (start, end) Unix time spans in which activations are counted.
+    - int: Number of events without a valid alarm ID or time, which are skipped.
+    """
+    alarms = {str(alarm.alarmId): alarm for alarm in alarms_to_monitor.itertuples()}
+    window_start, window_end = days[0][0], days[-1][1]
+    channel_ids = set()
+    spans = []
+    fetch_spans = []
+    skipped = 0
+    for event in events if isinstance(events, list) else []:
+        start = event_time(event.get(EVENT_TIME), tz)
+        if event.get(EVENT_ALARM) is None or start is None:
+            skipped += 1
+            continue
+        # events of alarms which are not monitored or can not fire in the report days
+        alarm = alarms.get(str(event[EVENT_ALARM]))
+        if alarm is None:
+            continue
+        reporting = int(alarm.reportingInterval)
+        reminder = pd.to_numeric(alarm.reminderInterval, errors="coerce")
+        reminder = int(reminder) if reminder and reminder > 0 else EVENT_REMINDER
+        alarm_interval = pd.to_numeric(alarm.alarmInterval, errors="coerce")
+        alarm_interval = int(alarm_interval) if alarm_interval and alarm_interval > 0 else 0
+        span_start = max(window_start, start - reporting - alarm_interval - EVENT_MARGIN)
+        span_end = min(window_end, start + reminder + EVENT_MARGIN)
+        if span_start < span_end:
+            channel_ids.add(alarm.channelId)
+            # readings are per minute, spans are widened to whole minutes
+            span_start, span_end = span_start // 60 * 60, -(-span_end // 60) * 60
+            spans.append([span_start, span_end])
+            fetch_spans.append([max(window_start, span_start - reporting - EVENT_MARGIN), span_end])
+
+    def merge(spans):
+        merged = []
+        for start, end in sorted(spans):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return [tuple(span) for span in merged]
+
+    return sorted(channel_ids), merge(fetch_spans), merge(spans), skipped
+
+
+def in_spans(ts, spans):
+    """
+    Tell which Unix times are within any of sorted, merged (start, end) spans, e.g. event spans.
+    """
+    starts, ends = np.array(spans, dtype=np.int64).reshape(-1, 2).T
+    if not len(starts):
+        return np.zeros(len(ts), dtype=bool)
+    span = np.searchsorted(starts, ts, side="right") - 1
+    return (span >= 0) & (ts < ends[np.maximum(span, 0)])
+
+
+def get_event_frame(api, org_id, alarms_to_monitor, days, tz, profiler=None, org="*"):
+    """
+    Pull readings only of the channels and time spans with alarm events, see event_spans.
+    All channels with events are requested for the union of their spans, in one batch.
+
+    Parameters:
+    - api (EniscopeAPIClient): Authenticated API client.
+    - org_id (str): The ID of the organization.
+    - alarms_to_monitor (pd.DataFrame): Alarm settings of the monitored channels.
+    - days (list): (start, end, date) tuples of the report days as returned by report_days.
+    - tz (str): Organization timezone.
+    - profiler (StageProfiler, optional): Profiler timing the events, fetch and frame stages.
+    - org (str, optional): Organization name the stages are recorded for.
+
+    Returns:
+    - pd.DataFrame: Readings as returned by get_channel_frame, only for the spans with events.
+    - list: (start, end) Unix time spans to count activations in, see evaluate_alarms.
+    - dict: Number of events, channels with events and fetched minutes per channel.
+    """
+    with runprofile.stage(profiler, org, "events") as record:
+        events = api.get_events_list(org_id, (days[0][0], days[-1][1])) if len(alarms_to_monitor) else []
+        channel_ids, fetch_spans, spans, skipped = event_spans(events, alarms_to_monitor, days, tz)
+        info = {
+            "events": len(events) if isinstance(events, list) else 0,
+            "skipped_events": skipped,
+            "event_channels": len(channel_ids),
+            "event_minutes": sum(end - start for start, end in fetch_spans) // 60,
+        }
+        if record is not None:
+            record.update(info)
+    alarms_with_events = alarms_to_monitor[alarms_to_monitor["channelId"].isin(channel_ids)]
+    return get_channel_frame(api, alarms_with_events, fetch_spans, tz, profiler, org), spans, info
+
+
+def compare_reports(report, reference):
+    """
+    Compare active minutes and energy of two reports of the same days, e.g. of the events and the full path.
+
+    Parameters:
+    - report (pd.DataFrame): Report lines with the Date column as returned by evaluate_alarms.
+    - reference (pd.DataFrame): Report lines to compare with.
+
+    Returns:
+    - pd.DataFrame: Date, Equipment, Alarm and both active times and energies of the lines which differ.
+    """
+    columns = ["Date", "Equipment", "Alarm", "Active Time, HH:mm", "Energy consumed, kWh"]
+    empty = pd.DataFrame(columns=columns)
+    compared = pd.merge(
+        report[columns] if not report.empty else empty,
+        reference[columns] if not reference.empty else empty,
+        on=["Date", "Equipment", "Alarm"],
+        how="outer",
+        suffixes=(" events", " full"),
+    )
+    differs = (
+        compared["Active Time, HH:mm events"].fillna("00:00")
+        != compared["Active Time, HH:mm full"].fillna("00:00")
+    ) | (
+        compared["Energy consumed, kWh events"].fillna(0) != compared["Energy consumed, kWh full"].fillna(0)
+    )
+    return compared[differs].reset_index(drop=True)
 
-    report = pd.DataFrame()
 
-    print(f"{current_time()}Calculating alarms activation...", end="", flush=True)
+def alarm_rule(alarm, tz):
+    """
+    Build the threshold and the compiled schedule of an alarm.
 
-    for channel_id in sorted(channel_data_df["channelId"].unique().tolist()):
-        ch_alarms = alarms_to_monitor[alarms_to_monitor["channelId"] == channel_id]
-        for alarm in ch_alarms.iterrows():
-            alarm = alarm[1]
-            if alarm.status == 1:
-                rule = ed.Threshold(
-                    alarm.thresholdValue,
-                    alarm.thresholdDirection,
-                    alarm.field,
-                    alarm.reportingInterval,
-                )
-                schedule = ed.Schedule(
-                    set(alarm.days),
-                    [alarm.startTime, alarm.endTime],
-                    tz=org["timeZone"],
-                )
+    Parameters:
+    - alarm (pd.Series): Alarm settings line.
+    - tz (str): Organization timezone.
 
-                # checkif startDate is valid
-                if alarm.startDate != None:
-                    startDate = (
-                        pd.to_datetime(alarm.startDate, utc=True)
-                        .tz_convert(org["timeZone"])
-                        .timestamp()
-                    )
-                else:
-                    startDate = pd.to_datetime("1970/01/01").timestamp()
-                # checkif endDate is valid
-                if alarm.endDate != None:
-                    endDate = (
-                        pd.to_datetime(alarm.endDate, utc=True)
-                        .tz_convert(org["timeZone"])
-                        .timestamp()
-                    )
-                else:
-                    endDate = pd.to_datetime("2038/01/19").timestamp()
-
-                # Calculate mean value for the 'field' column for the period defined by reportingInterval, NaN data filled with closed future value. Calculation stored in a new column named {field}_mean.
-                channel_data_df.loc[
-                    channel_data_df["channelId"] == channel_id, f"{rule.field}_mean"
-                ] = (
-                    channel_data_df.loc[
-                        channel_data_df["channelId"] == channel_id, rule.field
-                    ]
-                    .rolling(rule.reportInterval)
-                    .mean()
-                    .bfill()
-                )
+    Returns:
+    - tuple: (ed.Threshold, ed.Schedule)
+    """
+    rule = ed.Threshold(
+        alarm.thresholdValue,
+        alarm.thresholdDirection,
+        alarm.field,
+        alarm.reportingInterval,
+    )
+    schedule = compile_schedule(frozenset(alarm.days), alarm.startTime, alarm.endTime, tz)
+    return rule, schedule
+
+
+def evaluate_alarms(
+    org_to_monitor, channel_data_df, alarms_to_monitor, tz, days=None, active_spans=None, eval_pool=None
+):
+    """
+    Check alarms of the monitored channels against the readings of one or many days in a single pass
+    and collect report lines and episodes per day.
+
+    Parameters:
+    - org_to_monitor (str): Organization name.
+    - channel_data_df (pd.DataFrame): Readings of the monitored channels sorted by channel and time.
+    - alarms_to_monitor (pd.DataFrame): Alarm settings of the monitored channels.
+    - tz (str): Organization timezone.
+    - days (list, optional): (start, end, date) tuples of the report days as returned by report_days.
+      Default is one day covering all readings.
+    - active_spans (list, optional): (start, end) Unix time spans out of which readings are not counted as active,
+      e.g. the readings fetched before event spans only to complete their rolling means.
+    - eval_pool (ProcessPoolExecutor, optional): Pool started by sharedeval.eval_pool to evaluate alarms in processes
+      sharing the readings in shared memory, see sharedeval.activation_masks. Default is to evaluate them in this process.
+
+    Returns:
+    - pd.DataFrame: Report with one line per active alarm and day, Date column first.
+    - pd.DataFrame: Activation episodes of the active alarms, dated by episode start.
+    """
+    report = []
+    episodes = []
+
+    ts = channel_data_df["ts"].to_numpy(dtype="int64")
+    energy = channel_data_df["E"].to_numpy(dtype=float)
+    days, day_codes = report_day_codes(ts, tz, days, active_spans)
+
+    # activations of all alarms are computed up front by worker processes, if there are several
+    masks = None
+    enabled = alarms_to_monitor[alarms_to_monitor["status"] == 1]
+    if eval_pool is not None and len(enabled) > 1:
+        masks = sharedeval.activation_masks(channel_data_df, enabled, tz, eval_pool)
+
+    channel_rows = channel_data_df.groupby("channelId").indices
+    for channel_id in sorted(channel_rows):
+        rows = channel_rows[channel_id]
+        channel_df = channel_data_df.iloc[rows]
+        channel_days = day_codes[rows]
+        channel_energy = energy[rows]
+        ch_alarms = enabled[enabled["channelId"] == channel_id]
+
+        # activations of the channel's alarms, one bit per channel reading, so alarms on the same field
+        # do not overwrite each other; alarms are keyed by their settings line, an alarm may have several periods
+        activations = ed.ActivationMatrix(len(rows), keys=ch_alarms.index.tolist())
+        rules = {}
+        for key, alarm in ch_alarms.iterrows():
+            rule, schedule = rules[key] = alarm_rule(alarm, tz)
+            if masks is not None:
+                alarm_active = masks[key]
+            else:
+                # Calculate mean value for the 'field' column for the period defined by reportingInterval, NaN data filled with closed future value.
+                # Readings of all days are continuous, so the mean at midnight includes the previous evening.
+                field_mean = pd.Series(
+                    ed.rollingMean(channel_df[rule.field], rule.reportInterval), index=channel_df.index
+                ).bfill()
                 # check is alarm is active in certain time in accordance to the schedule of alarms and thresholds breaks
-                alarm_active_1 = channel_data_df["channelId"] == channel_id
-                alarm_active_2 = schedule == channel_data_df["datetime"]
-                alarm_active_3 = rule == channel_data_df[f"{rule.field}_mean"]
-                alarm_active = alarm_active_1 & alarm_active_2 & alarm_active_3
-                is_active = (alarm_active).sum()
-                # add a new column to the dataframe named {field}_alarm_active with the result of the previous check
-                if f"{rule.field}_alarm_active" not in channel_data_df.columns:
-                    channel_data_df[f"{rule.field}_alarm_active"] = False
-                channel_data_df.loc[alarm_active, f"{rule.field}_alarm_active"] = bool(
-                    True
+                alarm_active = ((schedule == channel_df["datetime"]) & (rule == field_mean)).to_numpy()
+            # readings out of the report days and of days before the alarm's start date or after its end
+            # date or expiry are not counted; the appended False is the code -1 of readings out of the days
+            valid_days = np.append(alarm_valid_days(alarm, days, tz), False)
+            activations.set(key, alarm_active & valid_days[channel_days])
+
+        for key, alarm in ch_alarms.iterrows():
+            if activations.active_minutes(key) == 0:
+                continue
+            rule, schedule = rules[key]
+
+            # active minutes and energy of every day
+            alarm_active = activations.get(key)
+            active_days = channel_days[alarm_active]
+            day_minutes = np.bincount(active_days, minlength=len(days))
+            day_energy = np.bincount(
+                active_days,
+                weights=np.nan_to_num(channel_energy[alarm_active]),
+                minlength=len(days),
+            )
+            # add resulsts to the report
+            for day in np.flatnonzero(day_minutes):
+                alarm_report = ed.createReport(
+                    org_to_monitor,
+                    channel_df,
+                    channel_id,
+                    alarm.alarmName,
+                    schedule,
+                    rule,
+                    int(day_minutes[day]),
+                    energy=float(day_energy[day]),
                 )
-                # add resulsts to the report
-                if is_active != 0:
-                    report = pd.concat(
-                        [
-                            report,
-                            ed.createReport(
-                                org_to_monitor,
-                                channel_data_df,
-                                channel_id,
-                                alarm.alarmName,
-                                schedule,
-                                rule,
-                                is_active,
-                            ),
-                        ],
-                        ignore_index=True,
-                    )
-                print(".", end="", flush=True)
-    print("done")
-
-    # %%
-    # code to calculate summary for the report columns Active Time, HH:mm	and Energy consumed, kWh. Active time is a string  in hh:mm format and need to be converted to timedelta to be able to sum it
-    # define funtion which takes a string in hh:mm format and returns a timedelta object and ass it to a timedelta sum
-    totalTime = pd.Timedelta(0)
-
-    def activeTime(x):
-        a_timedelta = pd.Timedelta(f"{x}:00")
-        global totalTime
-        totalTime += a_timedelta
-
-    report["Active Time, HH:mm"].apply(activeTime)
+                alarm_report.insert(0, "Date", days[day][2])
+                report.append(alarm_report)
+
+            # split activations into episodes to see when equipment was left on
+            alarm_episodes = ed.extractEpisodes(
+                alarm_active,
+                channel_df["ts"],
+                values=channel_df[rule.field],
+                energy=channel_df["E"],
+                tz=tz,
+            )
+            alarm_episodes.insert(0, "Alarm", alarm.alarmName)
+            alarm_episodes.insert(0, "Equipment", alarm.channelName)
+            alarm_episodes.insert(0, "Date", alarm_episodes["start"].dt.strftime("%Y-%m-%d"))
+            episodes.append(alarm_episodes)
+
+    report = pd.concat(report, ignore_index=True) if report else pd.DataFrame()
+    episodes = pd.concat(episodes, ignore_index=True) if episodes else pd.DataFrame()
+    return report, episodes
+
+
+def create_alarm_streams(alarms_to_monitor, tz):
+    """
+    Prepare incremental evaluation of the enabled alarms, e.g. to check new minutes every few minutes
+    instead of evaluating whole days again.
+
+    Parameters:
+    - alarms_to_monitor (pd.DataFrame): Alarm settings of the monitored channels.
+    - tz (str): Organization timezone.
+
+    Returns:
+    - dict: ed.AlarmStream for every alarm settings line of an enabled alarm.
+    """
+    streams = {}
+    for index, alarm in alarms_to_monitor.iterrows():
+        if alarm.status == 1:
+            streams[index] = ed.AlarmStream(*alarm_rule(alarm, tz), valid=alarm_validity(alarm, tz))
+    return streams
+
+
+def stream_readings(org_to_monitor, streams, alarms_to_monitor, channel_data_df, flush=False):
+    """
+    Add new readings to the alarm streams and collect report lines of the days they closed and the closed episodes.
+    Readings of a channel must follow its readings added before. Closed days give the same lines as evaluate_alarms.
+
+    Parameters:
+    - org_to_monitor (str): Organization name.
+    - streams (dict): Alarm streams as returned by create_alarm_streams.
+    - alarms_to_monitor (pd.DataFrame): Alarm settings of the monitored channels.
+    - channel_data_df (pd.DataFrame): New readings sorted by channel and time, as returned by get_channel_frame.
+    - flush (bool, optional): End the streams after the readings, closing all days and episodes.
+
+    Returns:
+    - pd.DataFrame: Report with one line per active alarm and closed day, Date column first.
+    - pd.DataFrame: Closed activation episodes, dated by episode start.
+    """
+    report = []
+    episodes = []
+    channel_rows = (
+        channel_data_df.groupby("channelId").indices if len(channel_data_df) else {}
+    )
+    for index, stream in streams.items():
+        alarm = alarms_to_monitor.loc[index]
+        rows = channel_rows.get(alarm.channelId)
+        alarm_episodes = []
+        if rows is not None:
+            channel_df = channel_data_df.iloc[rows]
+            alarm_episodes.append(
+                stream.update(channel_df["ts"], channel_df[alarm.field], channel_df["E"])
+            )
+        if flush:
+            alarm_episodes.append(stream.flush())
+
+        channel_name = pd.DataFrame(
+            {"channelId": [alarm.channelId], "channelName": [alarm.channelName]}
+        )
+        for date, (minutes, energy) in stream.pop_closed().items():
+            alarm_report = ed.createReport(
+                org_to_monitor,
+                channel_name,
+                alarm.channelId,
+                alarm.alarmName,
+                stream.schedule,
+                stream.rule,
+                minutes,
+                energy=energy,
+            )
+            alarm_report.insert(0, "Date", date)
+            report.append(alarm_report)
+
+        alarm_episodes = [frame for frame in alarm_episodes if len(frame)]
+        if alarm_episodes:
+            alarm_episodes = pd.concat(alarm_episodes, ignore_index=True)
+            alarm_episodes.insert(0, "Alarm", alarm.alarmName)
+            alarm_episodes.insert(0, "Equipment", alarm.channelName)
+            alarm_episodes.insert(
+                0, "Date", alarm_episodes["start"].dt.strftime("%Y-%m-%d")
+            )
+            episodes.append(alarm_episodes)
+
+    report = pd.concat(report, ignore_index=True) if report else pd.DataFrame()
+    episodes = pd.concat(episodes, ignore_index=True) if episodes else pd.DataFrame()
+    return report, episodes
+
+
+def summarize_report(report):
+    """
+    Sort report lines by consumed energy and add a SUMMARY line with total active time and energy.
+
+    Parameters:
+    - report (pd.DataFrame): Report with one line per active alarm.
+
+    Returns:
+    - pd.DataFrame: Report with the SUMMARY line at the end.
+    """
+    report_columns = [
+        "Organization",
+        "Equipment",
+        "Alarm",
+        "Alarm Rule",
+        "Schedule",
+        "Active Time, HH:mm",
+        "Energy consumed, kWh",
+    ]
+    # night without any activations still gets a report with an empty summary
+    if report.empty:
+        report = pd.DataFrame(columns=report_columns)
+    # Active time is a string in hh:mm format and need to be converted to timedelta to be able to sum it
+    totalTime = pd.to_timedelta(report["Active Time, HH:mm"] + ":00").sum()
     totalTime = str(totalTime)[-8:-3]
-    report.sort_values("Energy consumed, kWh", ascending=False, inplace=True)
+    report = report.sort_values("Energy consumed, kWh", ascending=False)
 
-    report_sum = pd.concat(
+    return pd.concat(
         [
             report,
             pd.DataFrame(
@@ -395,187 +943,1022 @@ for org_to_monitor in monitoring_list.keys():
         ]
     )
 
-    # %%
-
-    # Define the Excel file path
-    file_path = f"./reports/{org_to_monitor}_alarms_report.xlsx"
-
-    reportDate = (
-        pd.to_datetime(startTimestamp, unit="s", utc=True)
-        .tz_convert(org["timeZone"])
-        .strftime("%Y-%m-%d")
-    )
-
-    # # Check if the Excel file exists
-    # if os.path.exists(file_path):
-    #     # If it exists, load it
-    #     with pd.ExcelFile(file_path, engine="openpyxl") as xls:
-    #         if f"Report_{reportDate}" in xls.sheet_names:
-    #             existing_df = pd.read_excel(xls, f"Report_{reportDate}")
-    #         else:
-    #             existing_df = None
-
-    # Write (or overwrite) the specific sheet with openpyxl
-    # Determine the mode for the ExcelWriter ('a' for append if file exists, 'w' otherwise)
-    write_mode = "a" if os.path.exists(file_path) else "w"
-    with pd.ExcelWriter(file_path, engine="openpyxl", mode=write_mode) as writer:
-        if f"Report_{reportDate}" in writer.book.sheetnames:
-            del writer.book[f"Report_{reportDate}"]
-        report_sum.to_excel(writer, index=False, sheet_name=f"Report_{reportDate}")
-        workbook = writer.book
-        worksheet = writer.sheets[f"Report_{reportDate}"]
-
-        # Formatting
-        wrap_alignment = Alignment(wrap_text=True)
-        center_alignment = Alignment(
-            horizontal="center", vertical="center", wrap_text=True
+
+def episodes_table(episodes):
+    """
+    Format top episodes by consumed energy for the report workbook.
+
+    Parameters:
+    - episodes (pd.DataFrame): Activation episodes as returned by evaluate_alarms.
+
+    Returns:
+    - pd.DataFrame: TOP_EPISODES episodes with readable columns.
+    """
+    top_episodes = episodes.nlargest(TOP_EPISODES, "energy")
+    return pd.DataFrame(
+        {
+            "Equipment": top_episodes["Equipment"],
+            "Alarm": top_episodes["Alarm"],
+            "Start": top_episodes["start"].dt.strftime("%Y-%m-%d %H:%M"),
+            "End": top_episodes["end"].dt.strftime("%Y-%m-%d %H:%M"),
+            "Duration, HH:mm": pd.to_timedelta(top_episodes["duration"], unit="min").map(
+                lambda x: str(x)[-8:-3]
+            ),
+            "Peak value": top_episodes["peak"].round(2),
+            "Energy consumed, kWh": (top_episodes["energy"] / 1000).round(2),
+        }
+    )
+
+
+def write_reports(org_to_monitor, day_reports):
+    """
+    Write daily reports and their top episodes into the organization's monthly Excel workbooks, all days at once.
+
+    Parameters:
+    - org_to_monitor (str): Organization name.
+    - day_reports (dict): (report_sum, episodes) tuple for each report date in YYYY-MM-DD format,
+      report_sum with the SUMMARY line.
+    """
+    day_sheets = {}
+    for reportDate, (report_sum, episodes) in day_reports.items():
+        day_sheets[reportDate] = {f"Report_{reportDate}": report_sum}
+        if TOP_EPISODES and not episodes.empty:
+            day_sheets[reportDate][f"Episodes_{reportDate}"] = episodes_table(episodes)
+
+    reportwriter.write_reports(REPORTS_FOLDER, org_to_monitor, day_sheets)
+
+
+def channel_chunks(alarms_to_monitor, days, chunk_channels=None, memory_budget=None):
+    """
+    Split the channels with monitored alarms into chunks of at most chunk_channels channels, or of as many
+    channels as their readings of all report days fit into memory_budget.
+
+    Parameters:
+    - alarms_to_monitor (pd.DataFrame): Alarm settings of the monitored channels.
+    - days (list): (start, end, date) tuples of the report days as returned by report_days.
+    - chunk_channels (int, optional): Maximum number of channels in a chunk.
+    - memory_budget (int, optional): Memory budget of a chunk, MB.
+
+    Returns:
+    - list: Lists of channel ids in evaluation order, a single chunk of all channels if no limit is given.
+    """
+    channels = sorted(alarms_to_monitor["channelId"].unique())
+    size = len(channels)
+    if chunk_channels:
+        size = min(size, chunk_channels)
+    if memory_budget:
+        channel_readings = sum(end - start for start, end, _ in days) // 60
+        size = min(size, memory_budget * 2**20 // (channel_readings * READING_BYTES))
+    size = max(1, size)
+    return [channels[i : i + size] for i in range(0, len(channels), size)] or [[]]
+
+
+def evaluate_in_chunks(
+    api, org_to_monitor, alarms_to_monitor, tz, days, chunks, profiler=None, eval_pool=None
+):
+    """
+    Fetch and evaluate readings chunk by chunk of channels, keeping only report lines and episodes,
+    so peak memory is bounded by the chunk size rather than the number of channels.
+
+    Parameters:
+    - api (EniscopeAPIClient): Authenticated API client.
+    - org_to_monitor (str): Organization name.
+    - alarms_to_monitor (pd.DataFrame): Alarm settings of the monitored channels.
+    - tz (str): Organization timezone.
+    - days (list): (start, end, date) tuples of the report days as returned by report_days.
+    - chunks (list): Lists of channel ids as returned by channel_chunks.
+    - profiler (StageProfiler, optional): Profiler timing the fetch, frame and evaluate stages of every chunk.
+    - eval_pool (ProcessPoolExecutor, optional): Pool evaluating the alarms of every chunk, see evaluate_alarms.
+
+    Returns:
+    - pd.DataFrame: Report, the same as evaluate_alarms of all channels at once returns.
+    - pd.DataFrame: Activation episodes.
+    """
+
+    # readings live only for the call, so they are freed before the next chunk is fetched
+    def evaluate_chunk(chunk_alarms):
+        channel_data_df = get_channel_frame(
+            api, chunk_alarms, [day[:2] for day in days], tz, profiler, org_to_monitor
         )
+        with runprofile.stage(profiler, org_to_monitor, "evaluate"):
+            return evaluate_alarms(
+                org_to_monitor, channel_data_df, chunk_alarms, tz, days, eval_pool=eval_pool
+            )
+
+    reports = []
+    episodes = []
+    for channels in chunks:
+        report, chunk_episodes = evaluate_chunk(
+            alarms_to_monitor[alarms_to_monitor["channelId"].isin(channels)]
+        )
+        reports.append(report)
+        episodes.append(chunk_episodes)
+
+    reports = [report for report in reports if not report.empty]
+    episodes = [frame for frame in episodes if not frame.empty]
+    report = pd.concat(reports, ignore_index=True) if reports else pd.DataFrame()
+    episodes = pd.concat(episodes, ignore_index=True) if episodes else pd.DataFrame()
+    return report, episodes
+
+
+def evaluate_stream(api, org_to_monitor, alarms_to_monitor, tz, days, profiler=None):
+    """
+    Evaluate every channel as soon as its readings arrive from api.stream_channel_data, while the readings of
+    the next channels are still requested, keeping only report lines and episodes. The fetch waits when
+    PIPELINE_QUEUE channels wait for evaluation, so peak memory is bounded as with channel chunks.
+
+    Parameters:
+    - api (EniscopeAPIClient): Authenticated API client.
+    - org_to_monitor (str): Organization name.
+    - alarms_to_monitor (pd.DataFrame): Alarm settings of the monitored channels.
+    - tz (str): Organization timezone.
+    - days (list): (start, end, date) tuples of the report days as returned by report_days.
+    - profiler (StageProfiler, optional): Profiler timing the pipeline stage.
+
+    Returns:
+    - pd.DataFrame: Report, the same as evaluate_alarms of all channels at once returns.
+    - pd.DataFrame: Activation episodes.
+    """
+    fields = list(alarms_to_monitor["field"].unique())
+    if "E" not in fields:
+        fields.append("E")
+    channel_alarms = dict(list(alarms_to_monitor.groupby("channelId")))
+
+    reports = {}
+    episodes = {}
+    with runprofile.stage(profiler, org_to_monitor, "pipeline") as record:
+        for channel_id, channel_data in api.stream_channel_data(
+            sorted(channel_alarms),
+            [day[:2] for day in days],
+            fields=fields,
+            queue_size=PIPELINE_QUEUE,
+        ):
+            if not any(channel["records"] for channel in channel_data.values()):
+                continue
+            reports[channel_id], episodes[channel_id] = evaluate_alarms(
+                org_to_monitor,
+                build_channel_frame(channel_data, fields, tz),
+                channel_alarms[channel_id],
+                tz,
+                days,
+            )
+        if record is not None:
+            record["channels"] = len(reports)
+
+    # channels arrive in completion order, the report keeps the channel order of evaluate_alarms
+    reports = [reports[channel_id] for channel_id in sorted(reports) if not reports[channel_id].empty]
+    episodes = [episodes[channel_id] for channel_id in sorted(episodes) if not episodes[channel_id].empty]
+    report = pd.concat(reports, ignore_index=True) if reports else pd.DataFrame()
+    episodes = pd.concat(episodes, ignore_index=True) if episodes else pd.DataFrame()
+    return report, episodes
+
+
+def process_org(
+    api,
+    org_to_monitor,
+    channel_names,
+    report_date=None,
+    end_date=None,
+    journal=None,
+    metadata_cache=None,
+    profiler=None,
+    chunk_channels=None,
+    memory_budget=None,
+    readings_mode=READINGS_MODE,
+    eval_pool=None,
+    pipeline=PIPELINE,
+    writer=None,
+):
+    """
+    Run the full report pipeline for one organization: resolve, alarm settings, readings, evaluation and Excel report.
+
+    Parameters:
+    - api (EniscopeAPIClient): Authenticated API client.
+    - org_to_monitor (str): Organization name.
+    - channel_names (list): Names of the monitored channels.
+    - report_date (str, optional): Report date in YYYY-MM-DD format. Default is yesterday.
+    - end_date (str, optional): Last report date for a backfill from report_date, inclusive.
+    - journal (RunJournal, optional): Run journal to checkpoint stage outputs to and resume from.
+    - metadata_cache (MetadataCache, optional): Cache of resolved organizations and alarm settings kept between runs.
+    - profiler (StageProfiler, optional): Profiler timing the stages of the organization.
+    - chunk_channels (int, optional): Fetch and evaluate readings of at most this many channels at a time.
+    - memory_budget (int, optional): Fetch and evaluate readings of as many channels at a time as fit into this many MB.
+    - readings_mode (str, optional): "full", "events" to fetch readings only around alarm events, or "events-check"
+      to also run the full path, report its results and print where the events path differs.
+    - eval_pool (ProcessPoolExecutor, optional): Pool evaluating alarms of the organization, see evaluate_alarms.
+    - pipeline (bool, optional): Evaluate every channel as soon as its readings arrive, see evaluate_stream.
+      Takes the place of channel chunks and evaluation processes in the "full" readings mode.
+    - writer (callable, optional): Takes the Excel report stage and returns a future of its result, so the report
+      is written while the caller goes on with the next organization.
+
+    Returns:
+    - pd.DataFrame: Report lines with the Date column, ready to be stored in the summary store.
+    - list: Dates of all report days, including days without report lines.
+      A future of both if a writer is given.
+    """
+
+    # run a stage, or take its output from the journal when resuming
+    def stage(name, compute):
+        if journal is None:
+            return compute()
+        if journal.resume and journal.done(org_to_monitor, name):
+            print(f"{current_time()}Resuming {org_to_monitor}: {name} is done.")
+        return journal.checkpoint(org_to_monitor, name, compute)
+
+    # metadata stages are also taken from the cache of a long-running service; the monitored channels are
+    # part of the key, so an edited configuration is not answered from the cache
+    def metadata(name, compute):
+        if metadata_cache is None:
+            return stage(name, compute)
+        key = (org_to_monitor, name, tuple(channel_names))
+        return stage(name, lambda: metadata_cache.get(key, compute))
 
-        # Header format
-        header_font = Font(bold=True)
-        header_fill = PatternFill(
-            start_color="C0C0C0", end_color="C0C0C0", fill_type="solid"
+    # get organization id for the organization to be monitored
+    print(f'{current_time()}Getting organization id for "{org_to_monitor}"...')
+    with runprofile.stage(profiler, org_to_monitor, "resolve"):
+        org = metadata(
+            "org",
+            lambda: api.get_organizations_list(organization_name=org_to_monitor)[0],
         )
-        header_alignment = Alignment(
-            horizontal="center", vertical="center", wrap_text=True
+    org_id = org["organizationId"]
+
+    # retrive the channels and alarm settings for the organization
+    print(f'{current_time()}Getting alarm settings for "{org_to_monitor}"...')
+    with runprofile.stage(profiler, org_to_monitor, "metadata"):
+        alarms_to_monitor = metadata(
+            "alarm_settings", lambda: get_alarm_settings(api, org_id, channel_names)
         )
-        header_format = {
-            "font": header_font,
-            "fill": header_fill,
-            "alignment": header_alignment,
-        }
-        for cell in worksheet["1:1"]:
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.alignment = header_alignment
 
-        # Set column widths and formats
-        for col in worksheet["A:C"]:
-            col[0].alignment = wrap_alignment
-            worksheet.column_dimensions[col[0].column_letter].width = 20
+    # set the start and end dates for the data pull of every report day. Integer Unix time normalized to midnight and linked to the Organization timezone
+    days = report_days(org["timeZone"], report_date, end_date)
+    period = days[0][2] if len(days) == 1 else f"{days[0][2]} to {days[-1][2]}"
 
-        for col in worksheet["D:G"]:
-            col[0].alignment = center_alignment
-            worksheet.column_dimensions[col[0].column_letter].width = 15
+    # readings are requested only for channels with alarms which can fire in the report days
+    with runprofile.stage(profiler, org_to_monitor, "plan") as record:
+        alarms_to_monitor, plan = plan_alarms(alarms_to_monitor, days, org["timeZone"])
+        if record is not None:
+            record.update(plan)
+    dropped = ", ".join(f"{count} {reason}" for reason, count in plan["dropped"].items())
+    print(
+        f"{current_time()}{org_to_monitor}: {plan['planned_alarms']} of {plan['alarms']} alarms can fire{f' ({dropped} dropped)' if dropped else ''}, "
+        f"{plan['planned_channels']} of {plan['channels']} channels to fetch, {plan['saved_requests']} readings requests saved."
+    )
 
-        # insert date column to report_sum and remove summary line
-        report_sum.insert(0, "Date", reportDate)
-        report_sum = report_sum.iloc[:-1]
-    print(f"{current_time()}Report for {org_to_monitor} is ready.\n")
-
-    # check is lines with same date and organization exist in hwminutes_summary dataframe and delete them, then append report_sum to hwminutes_summary
-    if not hwminutes_summary.empty:
-        hwminutes_summary = hwminutes_summary[
-            ~(
-                (hwminutes_summary["Date"] == reportDate)
-                & (hwminutes_summary["Organization"] == org_to_monitor)
+    chunks = channel_chunks(alarms_to_monitor, days, chunk_channels, memory_budget)
+    if readings_mode != "full":
+        # readings around events are a small part of the day, they are not chunked
+        print(
+            f"{current_time()}Geting alarm events and channels readings around them for {org_to_monitor} for {period}..."
+        )
+        channel_data_df, active_spans, events_info = stage(
+            "event_readings",
+            lambda: get_event_frame(
+                api, org_id, alarms_to_monitor, days, org["timeZone"], profiler, org_to_monitor
+            ),
+        )
+        print(
+            f"{current_time()}{org_to_monitor}: {events_info['events']} events on {events_info['event_channels']} of "
+            f"{plan['planned_channels']} channels, {events_info['event_minutes']} minutes of readings fetched."
+        )
+        if events_info.get("skipped_events"):
+            print(
+                f"{current_time()}Warning: {org_to_monitor}: {events_info['skipped_events']} events without {EVENT_ALARM} or {EVENT_TIME} "
+                f"are skipped, activations around them are not reported."
             )
-        ]
-        hwminutes_summary = pd.concat(
-            [hwminutes_summary, report_sum], ignore_index=True
+        with runprofile.stage(profiler, org_to_monitor, "evaluate"):
+            report, episodes = stage(
+                "event_report",
+                lambda: evaluate_alarms(
+                    org_to_monitor,
+                    channel_data_df,
+                    alarms_to_monitor,
+                    org["timeZone"],
+                    days,
+                    active_spans,
+                    eval_pool,
+                )
+                if len(channel_data_df)
+                else (pd.DataFrame(), pd.DataFrame()),
+            )
+        del channel_data_df
+
+        if readings_mode == "events-check":
+            # the full path is the reference: its results are reported, differences of the events path are printed
+            full_df = stage(
+                "readings",
+                lambda: get_channel_frame(
+                    api,
+                    alarms_to_monitor,
+                    [day[:2] for day in days],
+                    org["timeZone"],
+                    profiler,
+                    org_to_monitor,
+                ),
+            )
+            with runprofile.stage(profiler, org_to_monitor, "evaluate"):
+                full_report, full_episodes = stage(
+                    "report",
+                    lambda: evaluate_alarms(
+                        org_to_monitor,
+                        full_df,
+                        alarms_to_monitor,
+                        org["timeZone"],
+                        days,
+                        eval_pool=eval_pool,
+                    ),
+                )
+            del full_df
+            mismatches = compare_reports(report, full_report)
+            print(
+                f"{current_time()}{org_to_monitor}: events path {'matches the full path' if mismatches.empty else f'differs from the full path in {len(mismatches)} lines'}."
+            )
+            if not mismatches.empty:
+                print(mismatches.to_string(index=False))
+            report, episodes = full_report, full_episodes
+    elif pipeline:
+        print(
+            f"{current_time()}Geting channels readings and calculating alarms activation for {org_to_monitor} for {period} as they arrive..."
+        )
+        report, episodes = stage(
+            "report",
+            lambda: evaluate_stream(
+                api, org_to_monitor, alarms_to_monitor, org["timeZone"], days, profiler
+            ),
+        )
+    elif len(chunks) > 1:
+        # readings of a chunk are freed once evaluated, so they are not journaled
+        print(
+            f"{current_time()}Geting channels readings and calculating alarms activation for {org_to_monitor} for {period} in {len(chunks)} chunks..."
+        )
+        report, episodes = stage(
+            "report",
+            lambda: evaluate_in_chunks(
+                api,
+                org_to_monitor,
+                alarms_to_monitor,
+                org["timeZone"],
+                days,
+                chunks,
+                profiler,
+                eval_pool,
+            ),
         )
     else:
-        hwminutes_summary = report_sum.copy()
-
-    print(f"{current_time()}Summary for {org_to_monitor} is updated.\n")
+        print(
+            f"{current_time()}Geting channels readings for {org_to_monitor} for {period}..."
+        )
+        channel_data_df = stage(
+            "readings",
+            lambda: get_channel_frame(
+                api,
+                alarms_to_monitor,
+                [day[:2] for day in days],
+                org["timeZone"],
+                profiler,
+                org_to_monitor,
+            ),
+        )
 
-# save updated hwminutes_summary to csv file
-hwminutes_summary.to_excel("./reports/hwminutes_summary.xlsx", index=False)
+        print(f"{current_time()}Calculating alarms activation for {org_to_monitor}...")
+        with runprofile.stage(profiler, org_to_monitor, "evaluate"):
+            report, episodes = stage(
+                "report",
+                lambda: evaluate_alarms(
+                    org_to_monitor,
+                    channel_data_df,
+                    alarms_to_monitor,
+                    org["timeZone"],
+                    days,
+                    eval_pool=eval_pool,
+                ),
+            )
+        del channel_data_df
+
+    def write_excel():
+        day_reports = {}
+        for _, _, reportDate in days:
+            day_report = (
+                report[report["Date"] == reportDate].drop(columns="Date")
+                if not report.empty
+                else report
+            )
+            day_episodes = (
+                episodes[episodes["Date"] == reportDate]
+                if not episodes.empty
+                else episodes
+            )
+            day_reports[reportDate] = (summarize_report(day_report), day_episodes)
 
+        write_reports(org_to_monitor, day_reports)
 
-# %%
-if UPLOAD_FILES == True:
-    from oauth2client.service_account import ServiceAccountCredentials
+        # insert date column to report_sum and remove summary line
+        summary_lines = []
+        for reportDate, (report_sum, _) in day_reports.items():
+            report_sum = report_sum.iloc[:-1].copy()
+            report_sum.insert(0, "Date", reportDate)
+            summary_lines.append(report_sum)
+        # days without lines are left out, unless no day has lines
+        return pd.concat([lines for lines in summary_lines if not lines.empty] or summary_lines[:1], ignore_index=True)
+
+    def write_stage():
+        with runprofile.stage(profiler, org_to_monitor, "excel"):
+            summary_lines = stage("excel", write_excel)
+        print(f"{current_time()}Report for {org_to_monitor} is ready.")
+        # days without report lines are returned too, so their stored lines are cleared
+        return summary_lines, [reportDate for _, _, reportDate in days]
+
+    if writer is not None:
+        return writer(write_stage)
+    return write_stage()
+
+
+def process_org_with_records(*args, eval_workers=None, **kwargs):
+    """
+    Run process_org in a process pool worker and return its stage records along with the report lines,
+    as the worker profiles into its own copy of the profiler. The evaluation pool can not be passed to
+    the worker, so the worker starts its own one with eval_workers processes.
+    """
+    profiler = args[7]
+    with sharedeval.eval_pool(eval_workers) as eval_pool:
+        org_report = process_org(*args, eval_pool=eval_pool, **kwargs)
+    return org_report, profiler.records if profiler is not None else []
+
+
+def process_orgs(
+    api,
+    monitoring_list,
+    report_date=None,
+    end_date=None,
+    workers=ORG_WORKERS,
+    executor=ORG_EXECUTOR,
+    journal=None,
+    metadata_cache=None,
+    profiler=None,
+    chunk_channels=None,
+    memory_budget=None,
+    readings_mode=READINGS_MODE,
+    eval_workers=EVAL_WORKERS,
+    pipeline=PIPELINE,
+):
+    """
+    Run process_org for every organization in the monitoring list in a thread or process pool.
+    A failure of one organization is reported and does not stop the others.
+
+    In a thread pool with pipeline on, Excel reports are written by a background writer thread, so a worker
+    goes on with the next organization's metadata and readings while the report of the previous one is written.
+    A worker waits when WRITE_QUEUE reports wait for the writer.
+
+    Parameters:
+    - api (EniscopeAPIClient): Authenticated API client.
+    - monitoring_list (dict): Monitored channel names for each organization name.
+    - report_date (str, optional): Report date in YYYY-MM-DD format. Default is yesterday.
+    - end_date (str, optional): Last report date for a backfill from report_date, inclusive.
+    - workers (int, optional): Number of organizations processed at the same time.
+    - executor (str, optional): "thread" or "process" pool.
+    - journal (RunJournal, optional): Run journal to checkpoint stage outputs to and resume from.
+    - metadata_cache (MetadataCache, optional): Cache of resolved organizations and alarm settings kept between runs.
+    - profiler (StageProfiler, optional): Profiler timing the stages of every organization.
+    - chunk_channels (int, optional): Fetch and evaluate readings of at most this many channels at a time.
+    - memory_budget (int, optional): Fetch and evaluate readings of as many channels at a time as fit into this many MB.
+    - readings_mode (str, optional): "full", "events" or "events-check", see process_org.
+    - eval_workers (int, optional): Processes evaluating the alarms of one organization, see evaluate_alarms.
+      One pool of them is started for the run and shared by the organizations.
+    - pipeline (bool, optional): Evaluate channels as their readings arrive and write reports in the background.
+
+    Returns:
+    - dict: Report lines and report dates for each successfully processed organization, in monitoring list order.
+    """
+    in_process = executor == "process"
+    pool = ProcessPoolExecutor if in_process else ThreadPoolExecutor
+    results = {}
+
+    # the writer can not be passed to process pool workers, they write their reports themselves
+    writer = None
+    write_pool = ThreadPoolExecutor(max_workers=1) if pipeline and not in_process else contextlib.nullcontext()
+    if pipeline and not in_process:
+        pending_writes = threading.BoundedSemaphore(WRITE_QUEUE)
+
+        def writer(write_stage):
+            pending_writes.acquire()
+            future = write_pool.submit(write_stage)
+            future.add_done_callback(lambda _: pending_writes.release())
+            return future
+
+    # evaluation processes are started once for the run, process pool workers start their own
+    with write_pool, sharedeval.eval_pool(None if in_process else eval_workers) as eval_pool, pool(
+        max_workers=max(1, min(workers, len(monitoring_list)))
+    ) as executor:
+        futures = {}
+        for org_to_monitor, channel_names in monitoring_list.items():
+            args = (
+                api,
+                org_to_monitor,
+                channel_names,
+                report_date,
+                end_date,
+                journal,
+                metadata_cache,
+                profiler,
+                chunk_channels,
+                memory_budget,
+                readings_mode,
+            )
+            if in_process:
+                future = executor.submit(
+                    process_org_with_records, *args, eval_workers=eval_workers, pipeline=pipeline
+                )
+            else:
+                future = executor.submit(
+                    process_org, *args, eval_pool=eval_pool, pipeline=pipeline, writer=writer
+                )
+            futures[future] = org_to_monitor
+        for future in as_completed(futures):
+            org_to_monitor = futures[future]
+            try:
+                result = future.result()
+                # the report of the organization may still be written
+                results[org_to_monitor] = result.result() if isinstance(result, Future) else result
+                if in_process:
+                    results[org_to_monitor], records = results[org_to_monitor]
+                    if profiler is not None:
+                        profiler.merge(records)
+            except Exception as e:
+                print(f"{current_time()}Report for {org_to_monitor} failed: {e}")
+
+    # keep the monitoring list order regardless of completion order
+    return {org: results[org] for org in monitoring_list if org in results}
+
+
+def store_summary(store, org_reports):
+    """
+    Replace lines with same date and organization in the summary store by the new report lines.
+    Stored lines of report days without new lines are removed.
+
+    Parameters:
+    - store (SummaryStore): Summary store.
+    - org_reports (dict): Report lines and report dates for each organization, as returned by process_orgs.
+
+    Returns:
+    - pd.DataFrame: New report lines of all organizations.
+    """
+    for org_to_monitor, (report_sum, report_dates) in org_reports.items():
+        store.upsert(report_sum, partitions=[(date, org_to_monitor) for date in report_dates])
+        print(f"{current_time()}Summary for {org_to_monitor} is updated.")
+    lines = [report_sum for report_sum, _ in org_reports.values() if not report_sum.empty]
+    return pd.concat(lines, ignore_index=True) if lines else pd.DataFrame()
+
+
+def upload_reports(folder_path=REPORTS_FOLDER):
+    """
+    Copy new and changed reports and the updated summary to the Google Drive folder.
+
+    Parameters:
+    - folder_path (str, optional): Path to the folder containing the files to upload.
+
+    Returns:
+    - dict: Lists of uploaded, skipped and failed file names.
+    """
+    # Google API client is only needed when uploads are on
     from googleapiclient.discovery import build
-    from googleapiclient.errors import HttpError
-    from googleapiclient.http import MediaFileUpload
     from google.oauth2.service_account import Credentials as ServiceAccountCredentials
-    import os
 
-    # function which upload files to a given google drive folder
+    print(f"{current_time()}Copy reports and updated summary to a Google Drive:")
 
-    print("{current_time()}Copy reports and updated summary to a Google Drive:")
+    creds = ServiceAccountCredentials.from_service_account_file(
+        SERVICE_ACCOUNT_FILE, scopes=["https://www.googleapis.com/auth/drive.file"]
+    )
 
-    def get_file_id(drive_service, folder_id, file_name):
-        """Get the file ID of a file in a specific folder by its name."""
-        query = f"'{folder_id}' in parents and name='{file_name}'"
-        results = (
-            drive_service.files().list(q=query, fields="files(id, name)").execute()
-        )
-        files = results.get("files", [])
+    # every upload worker builds its own Drive API client
+    def drive_service():
+        return build("drive", "v3", credentials=creds, cache_discovery=False)
 
-        if not files:
-            return None
-        return files[0]["id"]
+    result = drivesync.sync_folder(
+        drive_service, FOLDER_ID, folder_path, DRIVE_MANIFEST, max_workers=UPLOAD_WORKERS
+    )
+    print(
+        f"{current_time()}{len(result['uploaded'])} files uploaded, {len(result['skipped'])} unchanged, {len(result['failed'])} failed."
+    )
+    return result
 
-    def upload_to_drive(drive_service, folder_id, file_path):
-        """
-        Upload a file to a given folder on Google Drive.
-        Parameters:
-        - drive_service: The Drive API service instance.
-        - folder_id: The ID of the folder to upload the file to.
-        - file_path: The path to the files to upload.
-        """
-        file_name = os.path.basename(file_path)
-        file_metadata = {"name": file_name, "parents": [folder_id]}
 
-        # Check if the file already exists in the folder
-        existing_file_id = get_file_id(drive_service, folder_id, file_name)
+def open_summary_store():
+    """
+    Open the summary store, filling a new store from the existing Excel summary.
 
-        media = MediaFileUpload(file_path, resumable=True)
+    Returns:
+    - SummaryStore: Summary store.
+    """
+    store = SummaryStore(SUMMARY_DB)
+    if store.is_new and os.path.exists(SUMMARY_FILE):
+        lines = store.import_excel(SUMMARY_FILE)
+        print(f"{current_time()}Imported {lines} summary lines from {SUMMARY_FILE}")
+    return store
 
-        try:
-            if existing_file_id:
-                # Update the existing file (Note: We remove the 'parents' key from the metadata)
-                update_metadata = {"name": file_name}
-                request = drive_service.files().update(
-                    fileId=existing_file_id,
-                    body=update_metadata,
-                    media_body=media,
-                    fields="id",
-                )
-                file_info = request.execute()
-                print(
-                    f"\t{current_time()}Updated {file_path} on Drive, File ID: {file_info['id']}"
-                )
-            else:
-                # Create a new file
-                request = drive_service.files().create(
-                    body=file_metadata, media_body=media, fields="id"
-                )
-                file_info = request.execute()
-                print(
-                    f"\t{current_time()}Uploaded {file_path} to Drive, File ID: {file_info['id']}"
-                )
-        except HttpError as error:
-            print(f"\t{current_time()}An error occurred: {error}")
 
-    # Routine that perfom Authentication and upload steps
-    # Path to the service account JSON key file
+def authenticate():
+    """
+    Create the API object and authenticate it.
 
-    service_account_file = "feedbackloop-399807-300aec3efe37.json"
+    Returns:
+    - EniscopeAPIClient: Authenticated API client, or None if authentication failed.
+    """
+    import credentials as cr
 
-    # The ID of the folder where you want to upload the file.
-    # You can get this from the folder's URL on Google Drive: https://drive.google.com/drive/folders/YOUR_FOLDER_ID
-    FOLDER_ID = "1G1YUlZZQV52sBZ1lpefHcV2EbPb8u8M-"  # the folder ID of Projects/HW Minutes/ folder to store the files
+    # create the API object
+    api = es.EniscopeAPIClient(cr.api_key)
 
-    creds = ServiceAccountCredentials.from_service_account_file(
-        service_account_file, scopes=["https://www.googleapis.com/auth/drive.file"]
+    # authenticate the API object
+    if not api.authenticate_user():
+        print(f"{current_time()}Authentication failed")
+        return None
+    print(f"{current_time()}Authentication successful")
+    return api
+
+
+def run(
+    orgs=None,
+    report_date=None,
+    end_date=None,
+    upload=UPLOAD_FILES,
+    export=EXPORT_SUMMARY,
+    workers=ORG_WORKERS,
+    executor=ORG_EXECUTOR,
+    config_file=config_file,
+    resume=False,
+    api=None,
+    metadata_cache=None,
+    profile=False,
+    trace_memory=False,
+    profile_stage=None,
+    chunk_channels=None,
+    memory_budget=None,
+    archive=ARCHIVE_READINGS,
+    sheets=UPDATE_SHEETS,
+    readings_mode=READINGS_MODE,
+    eval_workers=EVAL_WORKERS,
+    pipeline=PIPELINE,
+    run_info=None,
+):
+    """
+    Prepare reports for the monitored organizations, update the summary and upload the files to Google Drive.
+
+    Parameters:
+    - orgs (list, optional): Names of the organizations to report. Default is all organizations in the configuration file.
+    - report_date (str, optional): Report date in YYYY-MM-DD format. Default is yesterday.
+    - end_date (str, optional): Last report date for a backfill from report_date, inclusive.
+    - upload (bool, optional): Upload reports to Google Drive.
+    - export (bool, optional): Export the whole summary store to the Excel summary.
+    - workers (int, optional): Number of organizations processed at the same time.
+    - executor (str, optional): "thread" or "process" pool.
+    - config_file (str, optional): Path to the monitoring list configuration file.
+    - resume (bool, optional): Skip stages completed by a previous run with the same dates and configuration.
+    - api (EniscopeAPIClient, optional): Authenticated API client to reuse, e.g. by the long-running service.
+    - metadata_cache (MetadataCache, optional): Cache of resolved organizations and alarm settings kept between runs.
+    - profile (bool, optional): Time every stage of every organization and write a run report to PROFILE_FOLDER.
+    - trace_memory (bool, optional): Also track peak memory of every stage, implies profile.
+    - profile_stage (str, optional): Name of a stage to dump cProfile statistics of, implies profile.
+    - chunk_channels (int, optional): Fetch and evaluate readings of at most this many channels of an organization at a time.
+    - memory_budget (int, optional): Fetch and evaluate readings of as many channels at a time as fit into this many MB.
+    - archive (bool, optional): Keep fetched readings in the minute archive in ARCHIVE_FOLDER.
+    - sheets (bool, optional): Update feedback loop Google Sheets from the summary store, without reading the Excel summary.
+    - readings_mode (str, optional): "full", "events" to fetch readings only around alarm events, or "events-check"
+      to run both paths and print where they differ.
+    - eval_workers (int, optional): Evaluate the alarms of an organization in this many processes sharing its readings.
+    - pipeline (bool, optional): Evaluate channels as their readings arrive and write Excel reports in the background.
+    - run_info (dict, optional): Filled with the organizations of the run and the failed ones, as failures of
+      single organizations are reported and do not fail the run.
+
+    Returns:
+    - pd.DataFrame: Summary lines of this run, or None if authentication failed.
+    """
+    monitoring_list = load_monitoring_list(config_file)
+    if orgs:
+        unknown = [org for org in orgs if org not in monitoring_list]
+        if unknown:
+            print(f"{current_time()}Not in {config_file}: {', '.join(unknown)}")
+        monitoring_list = {
+            org: monitoring_list[org] for org in orgs if org in monitoring_list
+        }
+
+    # report export to excel file
+    if not os.path.exists(REPORTS_FOLDER):
+        os.makedirs(REPORTS_FOLDER)
+
+    start_time = time.time()
+    profiler = None
+    if profile or trace_memory or profile_stage:
+        profiler = runprofile.StageProfiler(trace_memory, profile_stage, PROFILE_FOLDER)
+
+    # stage outputs are journaled by run date and configuration, so a failed run can be resumed
+    run_key = report_date or f"run-{datetime.date.today()}"
+    if end_date:
+        run_key = f"{run_key}_{end_date}"
+    journal = RunJournal(
+        JOURNAL_FOLDER,
+        run_key,
+        (monitoring_list, report_date, end_date, TOP_EPISODES),
+        resume=resume,
     )
+    journal.prune(JOURNAL_KEEP_DAYS)
 
-    # Build the Drive API client once
-    drive_service = build("drive", "v3", credentials=creds)
+    # authenticate the API object, unless all reports are taken from the journal or a client is given
+    if api is not None:
+        pass
+    elif resume and all(journal.done(org, "excel") for org in monitoring_list):
+        print(f"{current_time()}All reports are resumed from the journal")
+    else:
+        with runprofile.stage(profiler, "*", "auth"):
+            api = authenticate()
+        if api is None:
+            return None
+    if archive and api is not None and getattr(api, "archive", None) is None:
+        api.archive = MinuteArchive(ARCHIVE_FOLDER)
+
+    # Run data collection and report prepare for each organisation in the monitoring list
+    org_reports = process_orgs(
+        api,
+        monitoring_list,
+        report_date,
+        end_date,
+        workers,
+        executor,
+        journal,
+        metadata_cache,
+        profiler,
+        chunk_channels,
+        memory_budget,
+        readings_mode,
+        eval_workers,
+        pipeline,
+    )
+    failed = [org for org in monitoring_list if org not in org_reports]
+    if run_info is not None:
+        run_info.update(organizations=list(monitoring_list), failed=failed)
+
+    with runprofile.stage(profiler, "*", "summary"), open_summary_store() as store:
+        hwminutes_summary = store_summary(store, org_reports)
+        # save updated summary to excel file
+        if export:
+            store.export_excel(SUMMARY_FILE)
+        # sheets get the whole history, their sync compares it with the synced dates
+        sheet_summary = store.read() if sheets else None
+
+    if upload:
+        with runprofile.stage(profiler, "*", "upload"):
+            upload_reports(REPORTS_FOLDER)
+
+    if sheets:
+        import sheet_update
+
+        with runprofile.stage(profiler, "*", "sheets"):
+            sheet_update.main(summary=sheet_summary)
+
+    print(
+        f"\n{current_time()}Total reports prepare time: {time.time() - start_time} seconds.\n{current_time()}All done."
+    )
+    if profiler is not None:
+        report_path = profiler.write(
+            run_key=run_key,
+            organizations=list(monitoring_list),
+            failed=failed,
+            workers=workers,
+            executor=executor,
+        )
+        print(f"{current_time()}Run profile is written to {report_path}")
+    return hwminutes_summary
+
+
+def main(argv=None):
+    """
+    Command line entry point: `hwminutes run` prepares reports, `hwminutes sheets` updates feedback loop sheets,
+    `hwminutes trends` prints weekly or monthly rollups,
+    `hwminutes serve` runs reports on schedule as a long-running service. Without a command reports are prepared with default settings.
+    """
+    parser = argparse.ArgumentParser(
+        prog="hwminutes",
+        description="Report monitored equipment energy consumption out of working hours.",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    run_parser = subparsers.add_parser("run", help="prepare reports and update summary")
+    run_parser.add_argument(
+        "--org",
+        action="append",
+        dest="orgs",
+        metavar="NAME",
+        help="organization to report, can be repeated (default: all configured)",
+    )
+    run_parser.add_argument(
+        "--date", metavar="YYYY-MM-DD", help="report date (default: yesterday)"
+    )
+    run_parser.add_argument(
+        "--end-date",
+        metavar="YYYY-MM-DD",
+        help="backfill all days from --date to this date, inclusive",
+    )
+    run_parser.add_argument(
+        "--no-upload",
+        dest="upload",
+        action="store_false",
+        default=UPLOAD_FILES,
+        help="do not upload reports to Google Drive",
+    )
+    run_parser.add_argument(
+        "--export",
+        action="store_true",
+        default=EXPORT_SUMMARY,
+        help=f"export the whole summary store to {os.path.basename(SUMMARY_FILE)}",
+    )
+    run_parser.add_argument(
+        "--sheets",
+        action="store_true",
+        default=UPDATE_SHEETS,
+        help="update feedback loop Google Sheets at the end of the run",
+    )
+    run_parser.add_argument("--workers", type=int, default=ORG_WORKERS)
+    run_parser.add_argument(
+        "--executor", choices=["thread", "process"], default=ORG_EXECUTOR
+    )
+    run_parser.add_argument("--config", default=config_file, metavar="FILE")
+    run_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="skip stages completed by a previous run with the same dates and configuration",
+    )
+    run_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=f"time every stage of every organization into a JSON run report in {PROFILE_FOLDER}",
+    )
+    run_parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="also track peak memory of every stage (slower; exact per stage with --workers 1)",
+    )
+    run_parser.add_argument(
+        "--profile-stage",
+        choices=runprofile.STAGES,
+        help="dump cProfile statistics of this stage for every organization",
+    )
+    run_parser.add_argument(
+        "--no-archive",
+        dest="archive",
+        action="store_false",
+        default=ARCHIVE_READINGS,
+        help=f"do not keep fetched readings in the minute archive in {ARCHIVE_FOLDER}",
+    )
+    run_parser.add_argument(
+        "--chunk-channels",
+        type=int,
+        metavar="N",
+        help="fetch and evaluate readings of at most N channels of an organization at a time",
+    )
+    run_parser.add_argument(
+        "--memory-budget",
+        type=int,
+        metavar="MB",
+        help="fetch and evaluate as many channels at a time as their readings fit into MB",
+    )
+    run_parser.add_argument(
+        "--readings",
+        choices=["full", "events", "events-check"],
+        default=READINGS_MODE,
+        help="fetch readings of all monitored channels, only around Eniscope alarm events, "
+        "or both and print where the events path differs (default: %(default)s)",
+    )
+    run_parser.add_argument(
+        "--eval-workers",
+        type=int,
+        default=EVAL_WORKERS,
+        metavar="N",
+        help="evaluate the alarms of an organization in N processes sharing its readings",
+    )
+    run_parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        default=PIPELINE,
+        help="evaluate every channel as soon as its readings arrive and write Excel reports in the background",
+    )
 
-    # Path to the folder containing the files you want to upload
-    folder_path = "./reports"
+    sheets_parser = subparsers.add_parser("sheets", help="update feedback loop Google Sheets")
+    sheets_parser.add_argument(
+        "--full",
+        dest="incremental",
+        action="store_false",
+        help="rewrite every worksheet instead of writing only new and changed dates",
+    )
+    sheets_parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="spreadsheets updated concurrently within the Sheets API quotas (default: 8)",
+    )
+
+    trends_parser = subparsers.add_parser(
+        "trends", help="print weekly or monthly active time and energy from the summary store"
+    )
+    trends_parser.add_argument("--period", choices=["week", "month"], default="month")
+    trends_parser.add_argument("--org", metavar="NAME", help="organization name")
+    trends_parser.add_argument("--start", metavar="YYYY-MM-DD", help="first period start")
+    trends_parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="recompute the rollups from the summary lines first, e.g. after a backfill",
+    )
 
-    for file_name in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, file_name)
+    serve_parser = subparsers.add_parser(
+        "serve", help="run report cycles on schedule with warm sessions and cached metadata"
+    )
+    serve_parser.add_argument(
+        "--schedule",
+        default="30 2 * * *",
+        metavar="CRON",
+        help='cron-like cycle schedule, "minute hour day month weekday" (default: "30 2 * * *")',
+    )
+    serve_parser.add_argument(
+        "--port", type=int, default=8765, help="local health endpoint port, 0 to disable"
+    )
+    serve_parser.add_argument(
+        "--no-upload", dest="upload", action="store_false", default=UPLOAD_FILES
+    )
+    serve_parser.add_argument("--export", action="store_true", default=EXPORT_SUMMARY)
+    serve_parser.add_argument(
+        "--no-archive", dest="archive", action="store_false", default=ARCHIVE_READINGS
+    )
+    serve_parser.add_argument("--sheets", action="store_true", default=UPDATE_SHEETS)
+    serve_parser.add_argument(
+        "--readings", choices=["full", "events", "events-check"], default=READINGS_MODE
+    )
+    serve_parser.add_argument("--pipeline", action="store_true", default=PIPELINE)
+    serve_parser.add_argument("--workers", type=int, default=ORG_WORKERS)
+    serve_parser.add_argument("--config", default=config_file, metavar="FILE")
+
+    args = parser.parse_args(argv)
+    if getattr(args, "end_date", None) and not args.date:
+        parser.error("--end-date requires --date")
+    if getattr(args, "end_date", None) and args.end_date < args.date:
+        parser.error("--end-date must not be before --date")
+
+    if args.command == "sheets":
+        import sheet_update
+
+        return sheet_update.main(incremental=args.incremental, workers=args.workers)
+
+    if args.command == "trends":
+        with open_summary_store() as store:
+            if args.refresh:
+                partitions = store.refresh_rollups(start_date=args.start, organization=args.org)
+                print(f"{current_time()}Recomputed rollups of {partitions} summary partitions")
+            trends = store.read_rollup(args.period, organization=args.org, start_date=args.start)
+        print(trends.to_string(index=False))
+        return 0
+
+    if args.command == "serve":
+        import hwservice
+
+        service = hwservice.HWMinutesService(
+            schedule=args.schedule,
+            port=args.port,
+            run_options=dict(
+                upload=args.upload,
+                export=args.export,
+                archive=args.archive,
+                sheets=args.sheets,
+                readings_mode=args.readings,
+                pipeline=args.pipeline,
+                workers=args.workers,
+                config_file=args.config,
+            ),
+        )
+        service.serve_forever()
+        return 0
+
+    if args.command is None:
+        args = run_parser.parse_args([])
+    summary = run(
+        orgs=args.orgs,
+        report_date=args.date,
+        end_date=args.end_date,
+        upload=args.upload,
+        export=args.export,
+        workers=args.workers,
+        executor=args.executor,
+        config_file=args.config,
+        resume=args.resume,
+        profile=args.profile,
+        trace_memory=args.trace_memory,
+        profile_stage=args.profile_stage,
+        chunk_channels=args.chunk_channels,
+        memory_budget=args.memory_budget,
+        archive=args.archive,
+        sheets=args.sheets,
+        readings_mode=args.readings,
+        eval_workers=args.eval_workers,
+        pipeline=args.pipeline,
+    )
+    return 0 if summary is not None else 1
 
-        # Check if it's a regular file (and not a directory)
-        if os.path.isfile(file_path):
-            upload_to_drive(drive_service, FOLDER_ID, file_path)
 
-print(
-    f"\n{current_time()}Total reports prepare time: {time.time() - start_time} seconds.\n{current_time()}All done."
-)
+# %%
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,306 @@
+# long-running service which keeps the authenticated API client and metadata warm and runs report cycles on schedule
+import json
+import time, datetime
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import hwminutes as hw
+
+# default cycle schedule (every day at 02:30) and number of cycles metadata is kept for before it is requested again;
+# the API client authenticates again by itself when its session token expires
+DEFAULT_SCHEDULE = "30 2 * * *"
+METADATA_CYCLES = 7
+HEALTH_HOST = "127.0.0.1"
+HEALTH_PORT = 8765
+
+
+class CronSchedule:
+    """
+    Class for a cron-like schedule of five fields: minute, hour, day of month, month and day of week.
+
+    Fields accept '*', numbers, ranges 'a-b', steps '*/n' or 'a-b/n' and comma separated lists.
+    Day of week is 0-6 where 0 (or 7) is Sunday. As in cron, if both day fields are restricted,
+    a day matching either of them matches.
+
+    Args:
+        expression (str): Schedule expression, e.g. "30 2 * * *".
+
+    Methods:
+        __eq__(self, other): Checks if a datetime is a scheduled minute.
+        next_after(self, moment): Returns the first scheduled minute after a datetime.
+    """
+
+    RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Schedule '{expression}' must have 5 fields")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = [
+            self._parse(field, low, high)
+            for field, (low, high) in zip(fields, self.RANGES)
+        ]
+        self.weekdays = {day % 7 for day in self.weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse(field, low, high):
+        values = set()
+        for part in field.split(","):
+            value_range, _, step = part.partition("/")
+            if value_range == "*":
+                start, end = low, high
+            elif "-" in value_range:
+                start, end = (int(value) for value in value_range.split("-"))
+            else:
+                start = end = int(value_range)
+                if step:
+                    end = high
+            if start < low or end > high or start > end:
+                raise ValueError(f"Schedule field '{field}' is out of range {low}-{high}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_match(self, moment) -> bool:
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def __eq__(self, other) -> bool:
+        return (
+            other.month in self.months
+            and self._day_match(other)
+            and other.hour in self.hours
+            and other.minute in self.minutes
+        )
+
+    def next_after(self, moment: datetime.datetime) -> datetime.datetime:
+        """
+        Returns the first scheduled minute after a datetime, skipping whole days and hours which do not match.
+
+        Args:
+            moment (datetime.datetime): Start moment.
+
+        Returns:
+            datetime.datetime: Next scheduled minute.
+        """
+        moment = moment.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        limit = moment + datetime.timedelta(days=366 * 4)
+        while moment < limit:
+            if moment.month not in self.months or not self._day_match(moment):
+                moment = moment.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + datetime.timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += datetime.timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Schedule '{self.expression}' never matches")
+
+    def __str__(self) -> str:
+        return self.expression
+
+
+class MetadataCache:
+    """
+    Class for a thread-safe cache of values with time to live, e.g. resolved organizations and alarm settings.
+
+    Args:
+        ttl (int): Clock units a value stays valid.
+        clock (callable): Returns the current time, e.g. the number of cycles run. Default is seconds.
+
+    Methods:
+        get(self, key, compute): Returns the cached value or computes and caches it.
+        clear(self): Drops all values.
+    """
+
+    def __init__(self, ttl: int, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.values = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, compute):
+        with self.lock:
+            if key in self.values and self.clock() - self.values[key][0] < self.ttl:
+                self.hits += 1
+                return self.values[key][1]
+        value = compute()
+        with self.lock:
+            self.misses += 1
+            self.values[key] = (self.clock(), value)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+
+class HWMinutesService:
+    """
+    Class for the resident report service: runs hwminutes cycles on a schedule with a warm API client
+    and metadata cache, and exposes health and metrics over a local HTTP endpoint.
+
+    Args:
+        schedule (str): Cron-like cycle schedule.
+        host (str): Health endpoint host.
+        port (int): Health endpoint port, 0 to disable the endpoint.
+        run_options (dict): Keyword arguments for hwminutes.run, e.g. upload or workers.
+
+    Methods:
+        run_cycle(self): Runs one report cycle.
+        serve_forever(self): Runs cycles on schedule until stopped.
+        stop(self): Stops the service.
+    """
+
+    def __init__(self, schedule=DEFAULT_SCHEDULE, host=HEALTH_HOST, port=HEALTH_PORT, run_options=None):
+        self.schedule = CronSchedule(schedule)
+        self.host = host
+        self.port = port
+        # metadata cache is shared in memory, so organizations run in threads
+        self.run_options = dict(run_options or {}, executor="thread")
+        # metadata is refreshed every METADATA_CYCLES cycles, whatever the time between them
+        self.cache = MetadataCache(METADATA_CYCLES, clock=lambda: self.metrics["cycles"])
+        self.api = None
+        self.stopped = threading.Event()
+        self.server = None
+        self.started_at = time.time()
+        self.metrics = {
+            "cycles": 0,
+            "failures": 0,
+            "last_cycle_start": None,
+            "last_cycle_seconds": None,
+            "last_success": None,
+            "last_error": None,
+            "last_cycle_organizations": None,
+            "last_cycle_failed": [],
+            "organization_failures": 0,
+            "next_cycle": None,
+        }
+
+    def _client(self):
+        # the client is created once and keeps its session and connection pool; it authenticates again
+        # by itself when its token expires, so a new one is created only if authentication failed
+        if self.api is None:
+            self.api = hw.authenticate()
+        return self.api
+
+    def run_cycle(self):
+        """
+        Runs one report cycle for yesterday with the warm client and cache.
+
+        Returns:
+            bool: True if the cycle succeeded.
+        """
+        start = time.monotonic()
+        self.metrics["last_cycle_start"] = datetime.datetime.now().isoformat(timespec="seconds")
+        try:
+            api = self._client()
+            if api is None:
+                raise RuntimeError("Authentication failed")
+            run_info = {}
+            summary = hw.run(api=api, metadata_cache=self.cache, run_info=run_info, **self.run_options)
+            if summary is None:
+                raise RuntimeError("Report cycle failed")
+            # failures of single organizations do not fail the run, they are counted here
+            failed = run_info.get("failed", [])
+            self.metrics["last_cycle_organizations"] = len(run_info.get("organizations", []))
+            self.metrics["last_cycle_failed"] = failed
+            self.metrics["organization_failures"] += len(failed)
+            if failed and len(failed) == self.metrics["last_cycle_organizations"]:
+                raise RuntimeError(f"All {len(failed)} organizations failed")
+            self.metrics["last_success"] = datetime.datetime.now().isoformat(timespec="seconds")
+            self.metrics["last_error"] = None
+            return True
+        except Exception as e:
+            print(f"{hw.current_time()}Report cycle failed: {e}")
+            self.metrics["failures"] += 1
+            self.metrics["last_error"] = str(e)
+            return False
+        finally:
+            self.metrics["cycles"] += 1
+            self.metrics["last_cycle_seconds"] = round(time.monotonic() - start, 3)
+
+    def status(self):
+        """
+        Returns health and metrics of the service.
+        """
+        return dict(
+            self.metrics,
+            status="ok"
+            if self.metrics["last_error"] is None and not self.metrics["last_cycle_failed"]
+            else "degraded",
+            schedule=str(self.schedule),
+            uptime_seconds=round(time.time() - self.started_at),
+            metadata_cache={
+                "entries": len(self.cache.values),
+                "hits": self.cache.hits,
+                "misses": self.cache.misses,
+            },
+            compiled_schedules=hw.compile_schedule.cache_info()._asdict(),
+        )
+
+    def _start_endpoint(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/health", "/metrics"):
+                    self.send_error(404)
+                    return
+                status = service.status()
+                if self.path == "/health":
+                    status = {
+                        "status": status["status"],
+                        "last_success": status["last_success"],
+                        "last_cycle_failed": status["last_cycle_failed"],
+                    }
+                body = json.dumps(status).encode()
+                self.send_response(200 if status["status"] == "ok" else 503)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        print(f"{hw.current_time()}Health endpoint at http://{self.host}:{self.server.server_port}/health")
+
+    def serve_forever(self):
+        """
+        Runs report cycles on schedule until stop is called or SIGTERM/SIGINT is received.
+        """
+        if self.port:
+            self._start_endpoint()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *args: self.stop())
+            signal.signal(signal.SIGINT, lambda *args: self.stop())
+
+        # authenticate and warm the connection pool before the first cycle
+        self._client()
+        while not self.stopped.is_set():
+            next_cycle = self.schedule.next_after(datetime.datetime.now())
+            self.metrics["next_cycle"] = next_cycle.isoformat()
+            print(f"{hw.current_time()}Next report cycle at {next_cycle}")
+            # wait in short steps, so a clock change or stop request is noticed
+            while not self.stopped.is_set() and datetime.datetime.now() < next_cycle:
+                self.stopped.wait(min(30, max(0.1, (next_cycle - datetime.datetime.now()).total_seconds())))
+            if not self.stopped.is_set():
+                self.run_cycle()
+
+        if self.server is not None:
+            self.server.shutdown()
+        print(f"{hw.current_time()}Service stopped.")
+
+    def stop(self):
+        self.stopped.set()
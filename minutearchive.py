@@ -0,0 +1,288 @@
+import os
+import json
+import threading
+import numpy as np
+import pandas as pd
+
+# readings are stored one value per minute, as little endian float64
+MINUTE = 60
+DTYPE = np.dtype("<f8")
+# field marking minutes with a reading row, 1.0 or NaN, so rows with NaN values are kept as fetched
+ROW_FIELD = "_row"
+
+
+class MinuteArchive:
+    """
+    Class for a local archive of channel readings: every field of a channel is a memory-mapped array
+    of float64 values, one per minute since the channel's first archived minute, NaN for missing minutes.
+
+    Layout: {folder}/{channel id}/meta.json holds the channel name, the first minute (minutes since epoch),
+    the number of minutes, the fields and the archived time ranges; {folder}/{channel id}/{field}.f64
+    holds the values. All fields of a channel share the same first minute and length, so a minute is
+    at the same offset in every file and a time range is sliced without reading anything else.
+    The ROW_FIELD file marks the minutes which had a reading row, also if all its values were NaN.
+
+    Args:
+        folder (str): Archive folder.
+
+    Methods:
+        store(self, channel_id, ts, fields, name, covered): Writes readings of a channel.
+        store_channel_data(self, channel_data): Writes readings as returned by get_multiple_channel_data.
+        read(self, channel_id, field, start, end): Returns a field's values of a time range.
+        frame(self, channel_ids, fields, date_ranges, tz): Returns readings as get_channel_frame does.
+        covered(self, channel_id): Returns archived time ranges of a channel.
+        missing(self, channel_id, start, end): Returns parts of a time range which are not archived.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.lock = threading.Lock()
+        self.channel_locks = {}
+        os.makedirs(folder, exist_ok=True)
+
+    def __getstate__(self):
+        # process pool workers get their own locks, they write different channels
+        state = self.__dict__.copy()
+        del state["lock"], state["channel_locks"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.channel_locks = {}
+
+    def _channel_lock(self, channel_id):
+        # writes of one channel are serialized, different channels are written concurrently
+        with self.lock:
+            return self.channel_locks.setdefault(str(channel_id), threading.Lock())
+
+    def _channel_path(self, channel_id, file_name=None):
+        path = os.path.join(self.folder, str(channel_id))
+        return path if file_name is None else os.path.join(path, file_name)
+
+    def meta(self, channel_id) -> dict:
+        """
+        Returns the metadata header of a channel, None if the channel is not archived.
+        """
+        meta_path = self._channel_path(channel_id, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as f:
+            return json.load(f)
+
+    def _save_meta(self, channel_id, meta):
+        meta_path = self._channel_path(channel_id, "meta.json")
+        with open(f"{meta_path}.tmp", "w") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+    def _values(self, channel_id, field, meta, mode="r"):
+        return np.memmap(
+            self._channel_path(channel_id, f"{field}.f64"),
+            dtype=DTYPE,
+            mode=mode,
+            shape=(meta["length"],),
+        )
+
+    def _resize(self, channel_id, meta, first, last, fields):
+        """
+        Extends the files of a channel to cover minutes first to last and adds files of new fields.
+        Appending is cheap, an earlier first minute rewrites the files.
+        """
+        if meta is None:
+            meta = {"first_minute": first, "length": 0, "fields": [], "covered": []}
+        head = max(0, meta["first_minute"] - first)
+        tail = max(0, last + 1 - (meta["first_minute"] + meta["length"]))
+        for field in meta["fields"]:
+            file_path = self._channel_path(channel_id, f"{field}.f64")
+            if head:
+                values = np.fromfile(file_path, dtype=DTYPE)
+                with open(f"{file_path}.tmp", "wb") as f:
+                    np.full(head, np.nan, dtype=DTYPE).tofile(f)
+                    values.tofile(f)
+                    np.full(tail, np.nan, dtype=DTYPE).tofile(f)
+                os.replace(f"{file_path}.tmp", file_path)
+            elif tail:
+                with open(file_path, "ab") as f:
+                    np.full(tail, np.nan, dtype=DTYPE).tofile(f)
+        meta["first_minute"] -= head
+        meta["length"] += head + tail
+        for field in fields:
+            if field not in meta["fields"]:
+                with open(self._channel_path(channel_id, f"{field}.f64"), "wb") as f:
+                    np.full(meta["length"], np.nan, dtype=DTYPE).tofile(f)
+                meta["fields"].append(field)
+        return meta
+
+    def store(self, channel_id, ts, fields: dict, name=None, covered=None):
+        """
+        Writes readings of a channel, replacing archived values of the same minutes.
+
+        Args:
+            channel_id: Channel ID.
+            ts (Union[np.ndarray, pd.Series]): Unix time of every reading, seconds.
+            fields (dict): Values of every reading for each field name.
+            name (Optional[str]): Channel name.
+            covered (Optional[tuple]): (start, end) Unix time range the readings were requested for,
+                its minutes without readings are archived as NaN.
+        """
+        ts = np.asarray(ts, dtype=np.int64)
+        minutes = ts // MINUTE
+        fields = {**fields, ROW_FIELD: np.ones(ts.size)}
+        first = int(minutes.min()) if ts.size else None
+        last = int(minutes.max()) if ts.size else None
+        if covered is not None:
+            first = covered[0] // MINUTE if first is None else min(first, covered[0] // MINUTE)
+            last = (covered[1] - 1) // MINUTE if last is None else max(last, (covered[1] - 1) // MINUTE)
+        if first is None:
+            return
+
+        with self._channel_lock(channel_id):
+            os.makedirs(self._channel_path(channel_id), exist_ok=True)
+            meta = self._resize(channel_id, self.meta(channel_id), first, last, fields)
+            if name is not None:
+                meta["name"] = name
+            for field, values in fields.items():
+                archived = self._values(channel_id, field, meta, mode="r+")
+                if covered is not None:
+                    low = covered[0] // MINUTE - meta["first_minute"]
+                    high = (covered[1] - 1) // MINUTE + 1 - meta["first_minute"]
+                    archived[low:high] = np.nan
+                archived[minutes - meta["first_minute"]] = pd.to_numeric(
+                    pd.Series(values), errors="coerce"
+                ).to_numpy(dtype=float)
+                archived.flush()
+                del archived
+            if covered is not None:
+                meta["covered"] = _merge_ranges(meta["covered"] + [list(covered)])
+            self._save_meta(channel_id, meta)
+
+    def store_channel_data(self, channel_data: dict):
+        """
+        Writes readings as returned by EniscopeAPIClient.get_multiple_channel_data, keyed by
+        'channel_id_start_end', so the requested ranges are archived as covered.
+        """
+        for key, channel in channel_data.items():
+            if not channel or "records" not in channel:
+                continue
+            start, end = (int(value) for value in key.rsplit("_", 2)[1:])
+            records = pd.DataFrame(channel["records"])
+            if records.empty:
+                self.store(channel["channel"], [], {}, channel.get("name"), (start, end))
+                continue
+            self.store(
+                channel["channel"],
+                records["ts"],
+                {field: records[field] for field in records.columns if field != "ts"},
+                channel.get("name"),
+                (start, end),
+            )
+
+    def read(self, channel_id, field, start, end) -> np.ndarray:
+        """
+        Returns values of a field for the minutes of a Unix time range [start, end).
+        Within the archived minutes this is a read-only view of the memory-mapped file, nothing is copied.
+
+        Args:
+            channel_id: Channel ID.
+            field (str): Field name, e.g. P or E.
+            start (int): Start of the range, Unix time.
+            end (int): End of the range, Unix time.
+
+        Returns:
+            np.ndarray: One value per minute, NaN for missing minutes.
+        """
+        meta = self.meta(channel_id)
+        first = start // MINUTE
+        length = max(0, -(-end // MINUTE) - first)
+        if meta is None or field not in meta["fields"]:
+            return np.full(length, np.nan)
+        values = self._values(channel_id, field, meta)
+        offset = first - meta["first_minute"]
+        if offset >= 0 and offset + length <= meta["length"]:
+            return values[offset : offset + length]
+        # the range sticks out of the archive, the archived part is copied into NaN padding
+        result = np.full(length, np.nan)
+        low, high = max(offset, 0), min(offset + length, meta["length"])
+        if low < high:
+            result[low - offset : high - offset] = values[low:high]
+        return result
+
+    def frame(self, channel_ids, fields, date_ranges, tz) -> pd.DataFrame:
+        """
+        Returns archived readings in the layout of hwminutes.get_channel_frame: one row per minute
+        which had a reading row when fetched, sorted by channel and time.
+
+        Args:
+            channel_ids (list): Channel IDs.
+            fields (list): Field names.
+            date_ranges (list): List of (start, end) Unix time ranges.
+            tz (str): Timezone of the datetime column.
+
+        Returns:
+            pd.DataFrame: Readings with ts, the fields, channelId, channelName and datetime columns.
+        """
+        frames = []
+        for channel_id in sorted(channel_ids):
+            meta = self.meta(channel_id) or {}
+            for start, end in date_ranges:
+                first = start // MINUTE
+                values = {field: self.read(channel_id, field, start, end) for field in fields}
+                ts = (first + np.arange(len(next(iter(values.values()))))) * MINUTE
+                if ROW_FIELD in meta.get("fields", []):
+                    known = ~np.isnan(self.read(channel_id, ROW_FIELD, start, end))
+                else:
+                    # archived before rows were marked, minutes with any value are rows
+                    known = np.zeros(ts.size, dtype=bool)
+                    for column in values.values():
+                        known |= ~np.isnan(column)
+                df = pd.DataFrame({"ts": ts[known]})
+                for field, column in values.items():
+                    df[field] = np.array(column[known])
+                df["channelId"] = channel_id
+                df["channelName"] = meta.get("name")
+                frames.append(df)
+        if not frames:
+            return pd.DataFrame(columns=["ts", *fields, "channelId", "channelName", "datetime"])
+        channel_data_df = (
+            pd.concat(frames, ignore_index=True)
+            .sort_values(["channelId", "ts"], kind="stable")
+            .reset_index(drop=True)
+        )
+        channel_data_df["datetime"] = pd.to_datetime(
+            channel_data_df["ts"], unit="s", utc=True
+        ).dt.tz_convert(tz)
+        return channel_data_df
+
+    def covered(self, channel_id) -> list:
+        """
+        Returns archived (start, end) Unix time ranges of a channel.
+        """
+        meta = self.meta(channel_id)
+        return [tuple(covered) for covered in meta["covered"]] if meta else []
+
+    def missing(self, channel_id, start, end) -> list:
+        """
+        Returns the parts of a Unix time range [start, end) which are not archived.
+        """
+        missing = []
+        for covered_start, covered_end in self.covered(channel_id):
+            if covered_end <= start or covered_start >= end:
+                continue
+            if covered_start > start:
+                missing.append((start, covered_start))
+            start = max(start, covered_end)
+        if start < end:
+            missing.append((start, end))
+        return missing
+
+
+def _merge_ranges(ranges):
+    # sort and join overlapping or adjacent ranges
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
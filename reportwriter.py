@@ -0,0 +1,185 @@
+import os
+import tempfile
+
+# column widths of report sheets, the first three columns hold names and wrap
+TEXT_COLUMNS_WIDTH = 20
+VALUE_COLUMNS_WIDTH = 15
+INDEX_SHEET = "Index"
+INDEX_COLUMNS = ["Date", "Sheet", "Active Time, HH:mm", "Energy consumed, kWh"]
+
+
+def report_file_path(folder, org_name, report_date):
+    """
+    Returns the path of the monthly workbook which holds the report of a given date.
+
+    Args:
+        folder (str): Reports folder.
+        org_name (str): Organization name.
+        report_date (str): Report date in YYYY-MM-DD format.
+
+    Returns:
+        str: Workbook path.
+    """
+    return os.path.join(folder, f"{org_name}_alarms_report_{report_date[:7]}.xlsx")
+
+
+def _named_styles():
+    """
+    Returns header styles registered once per workbook instead of styling every cell separately.
+    """
+    from openpyxl.styles import Alignment, Font, NamedStyle, PatternFill
+
+    header_font = Font(bold=True)
+    header_fill = PatternFill(start_color="C0C0C0", end_color="C0C0C0", fill_type="solid")
+    return [
+        NamedStyle(
+            name="hw_header_text",
+            font=header_font,
+            fill=header_fill,
+            alignment=Alignment(wrap_text=True),
+        ),
+        NamedStyle(
+            name="hw_header_center",
+            font=header_font,
+            fill=header_fill,
+            alignment=Alignment(horizontal="center", vertical="center", wrap_text=True),
+        ),
+    ]
+
+
+def _sheet_order(title):
+    # Index first, then report and episodes sheets of every day in date order
+    if title == INDEX_SHEET:
+        return ("", 0)
+    kind, _, date = title.partition("_")
+    return (date, 0 if kind == "Report" else 1)
+
+
+def _read_month(file_path, skip):
+    """
+    Reads values of all sheets of an existing monthly workbook except the index and the sheets in skip.
+    """
+    from openpyxl import load_workbook
+
+    sheets = {}
+    if not os.path.exists(file_path):
+        return sheets
+    workbook = load_workbook(file_path, read_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            if worksheet.title == INDEX_SHEET or worksheet.title in skip:
+                continue
+            sheets[worksheet.title] = [list(row) for row in worksheet.values]
+    finally:
+        workbook.close()
+    return sheets
+
+
+def _frame_rows(frame):
+    # header and values of a dataframe with NaN replaced by empty cells
+    values = frame.astype(object).where(frame.notna(), None)
+    return [list(frame.columns)] + [list(row) for row in values.itertuples(index=False)]
+
+
+def _index_rows(sheets):
+    # one line per report sheet with totals taken from its SUMMARY line
+    rows = [INDEX_COLUMNS]
+    for title in sorted(sheets, key=_sheet_order):
+        if not title.startswith("Report_"):
+            continue
+        header, *lines = sheets[title]
+        summary = next(
+            (line for line in lines if "SUMMARY" in line),
+            [None] * len(header),
+        )
+        totals = dict(zip(header, summary))
+        rows.append(
+            [
+                title.partition("_")[2],
+                title,
+                totals.get("Active Time, HH:mm"),
+                totals.get("Energy consumed, kWh"),
+            ]
+        )
+    return rows
+
+
+def _write_sheet(workbook, title, rows):
+    """
+    Streams rows into a new sheet of a write-only workbook with styled header.
+    """
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+
+    worksheet = workbook.create_sheet(title)
+    width = len(rows[0]) if rows else 0
+    for column in range(1, width + 1):
+        worksheet.column_dimensions[get_column_letter(column)].width = (
+            TEXT_COLUMNS_WIDTH if column <= 3 else VALUE_COLUMNS_WIDTH
+        )
+    for number, row in enumerate(rows):
+        if number == 0:
+            header = []
+            for column, value in enumerate(row):
+                cell = WriteOnlyCell(worksheet, value=value)
+                cell.style = "hw_header_text" if column < 3 else "hw_header_center"
+                header.append(cell)
+            worksheet.append(header)
+        else:
+            worksheet.append(row)
+
+
+def write_reports(folder, org_name, day_sheets):
+    """
+    Write report sheets into monthly workbooks of an organization in write-only (streaming) mode.
+
+    Every affected monthly workbook is rewritten from the sheets it already holds and the new ones,
+    so the cost of adding a day is bounded by one month of reports. Each workbook starts with
+    an index sheet listing the report days with their totals.
+
+    Args:
+        folder (str): Reports folder.
+        org_name (str): Organization name.
+        day_sheets (dict): For every report date in YYYY-MM-DD format, a dict of sheet name to dataframe,
+            e.g. {"Report_2023-10-01": report_sum, "Episodes_2023-10-01": episodes}.
+
+    Returns:
+        list: Paths of the written workbooks.
+    """
+    from openpyxl import Workbook
+
+    months = {}
+    for report_date, sheets in day_sheets.items():
+        months.setdefault(report_file_path(folder, org_name, report_date), {}).update(
+            sheets
+        )
+
+    written = []
+    for file_path, new_sheets in sorted(months.items()):
+        # sheet names of the new days are replaced, including sheets which are not written any more
+        replaced = set(new_sheets)
+        for title in new_sheets:
+            date = title.partition("_")[2]
+            replaced.update({f"Report_{date}", f"Episodes_{date}"})
+        sheets = _read_month(file_path, replaced)
+        for title, frame in new_sheets.items():
+            sheets[title] = _frame_rows(frame)
+
+        workbook = Workbook(write_only=True)
+        for style in _named_styles():
+            workbook.add_named_style(style)
+        _write_sheet(workbook, INDEX_SHEET, _index_rows(sheets))
+        for title in sorted(sheets, key=_sheet_order):
+            _write_sheet(workbook, title, sheets[title])
+
+        # write next to the target and replace it, so an interrupted run never leaves a broken workbook
+        handle, temp_path = tempfile.mkstemp(suffix=".xlsx", dir=folder)
+        os.close(handle)
+        try:
+            workbook.save(temp_path)
+            os.replace(temp_path, file_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        written.append(file_path)
+    return written
@@ -0,0 +1,98 @@
+import os
+import re
+import time
+import shutil
+import pickle
+import pprint
+import hashlib
+import tempfile
+
+
+def config_hash(*config) -> str:
+    """
+    Returns a short stable hash of configuration values, e.g. monitoring list and report dates.
+    """
+    return hashlib.sha256(pprint.pformat(config).encode()).hexdigest()[:12]
+
+
+class RunJournal:
+    """
+    Class for checkpointing stage outputs of a run per organization, so a failed run can be resumed.
+
+    Outputs are pickled to {folder}/{run_key}_{config hash}/{organization}/{stage}.pkl. A changed
+    configuration gives a different hash and so never resumes from outputs of another configuration.
+
+    Args:
+        folder (str): Folder of all run journals.
+        run_key (str): Run identifier, e.g. the report date.
+        config (tuple): Configuration values the stage outputs depend on.
+        resume (bool): Reuse outputs of completed stages. If False, the run's journal is cleared.
+
+    Methods:
+        checkpoint(self, org, stage, compute): Returns the stored stage output or computes and stores it.
+        done(self, org, stage): Checks if a stage output is stored.
+        load(self, org, stage): Returns a stored stage output.
+        save(self, org, stage, value): Stores a stage output.
+        prune(self, keep_days): Removes journals of other runs older than keep_days.
+    """
+
+    def __init__(self, folder: str, run_key: str, config: tuple, resume: bool = False):
+        self.folder = folder
+        self.resume = resume
+        self.path = os.path.join(folder, f"{run_key}_{config_hash(*config)}")
+        if not resume and os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.makedirs(self.path, exist_ok=True)
+
+    def _stage_path(self, org: str, stage: str) -> str:
+        # organization names may contain characters not allowed in file names
+        org_folder = re.sub(r"[^\w.-]+", "_", org) + "_" + config_hash(org)[:6]
+        return os.path.join(self.path, org_folder, f"{stage}.pkl")
+
+    def done(self, org: str, stage: str) -> bool:
+        return os.path.exists(self._stage_path(org, stage))
+
+    def load(self, org: str, stage: str):
+        with open(self._stage_path(org, stage), "rb") as f:
+            return pickle.load(f)
+
+    def save(self, org: str, stage: str, value):
+        file_path = self._stage_path(org, stage)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        # write next to the target and rename, so a killed run never leaves a broken checkpoint
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(file_path))
+        try:
+            with os.fdopen(handle, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, file_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def checkpoint(self, org: str, stage: str, compute):
+        """
+        Returns the stored output of a stage when resuming, otherwise computes and stores it.
+
+        Args:
+            org (str): Organization name, or any key for run-level stages.
+            stage (str): Stage name.
+            compute (callable): Function computing the stage output.
+
+        Returns:
+            Stage output.
+        """
+        if self.resume and self.done(org, stage):
+            return self.load(org, stage)
+        value = compute()
+        self.save(org, stage, value)
+        return value
+
+    def prune(self, keep_days: int = 7):
+        """
+        Removes journals of other runs last modified more than keep_days ago.
+        """
+        cutoff = time.time() - keep_days * 86400
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if path != self.path and os.path.isdir(path) and os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,196 @@
+import os
+import re
+import json
+import time, datetime
+import cProfile
+import threading
+import tracemalloc
+import contextlib
+
+# names of the pipeline stages timed by hwminutes, per organization or "*" for the whole run, in pipeline order
+STAGES = [
+    "auth",
+    "resolve",
+    "metadata",
+    "plan",
+    "events",
+    "fetch",
+    "frame",
+    "pipeline",
+    "evaluate",
+    "excel",
+    "summary",
+    "upload",
+    "sheets",
+]
+
+
+class StageProfiler:
+    """
+    Class for timing named pipeline stages per organization, optionally with peak traced memory and
+    a cProfile dump of a chosen stage, and for writing them into a JSON run report.
+
+    Memory is traced with tracemalloc, which slows Python code down noticeably, so it is opt-in.
+    A stage's peak is the peak of the whole process while the stage ran: it is the stage's own peak
+    when organizations run one at a time (--workers 1). Only one cProfile profiler can be active,
+    so the profiled stage of an organization is not dumped while the same stage of another one is profiled.
+
+    Args:
+        trace_memory (bool): Track peak traced memory of every stage.
+        profile_stage (Optional[str]): Name of the stage to run under cProfile, one of STAGES.
+        profile_folder (str): Folder for run reports and cProfile dumps.
+
+    Methods:
+        stage(self, org, name): Context manager timing a stage of an organization.
+        merge(self, records): Adds stage records collected in another process.
+        report(self, **run_info): Returns the run report.
+        write(self, **run_info): Writes the run report and returns its path.
+    """
+
+    def __init__(self, trace_memory=False, profile_stage=None, profile_folder="./profiles"):
+        if profile_stage is not None and profile_stage not in STAGES:
+            raise ValueError(f"Unknown stage {profile_stage}, stages are {', '.join(STAGES)}")
+        self.trace_memory = trace_memory
+        self.profile_stage = profile_stage
+        self.profile_folder = profile_folder
+        self.started = time.time()
+        self.run_id = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.records = []
+        self.lock = threading.Lock()
+        # only one cProfile profiler can be active at a time
+        self.profile_lock = threading.Lock()
+        # running peaks of the stages in progress, updated whenever a stage starts or ends
+        self.active_peaks = {}
+
+    def __getstate__(self):
+        # locks can not be pickled into process pool workers, the worker gets its own
+        state = self.__dict__.copy()
+        del state["lock"], state["profile_lock"]
+        state["records"], state["active_peaks"] = [], {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.profile_lock = threading.Lock()
+
+    def _sample_peak(self):
+        # spread the peak since the last sample over all running stages and start a new sample
+        peak = tracemalloc.get_traced_memory()[1]
+        for key in self.active_peaks:
+            self.active_peaks[key] = max(self.active_peaks[key], peak)
+        tracemalloc.reset_peak()
+
+    @contextlib.contextmanager
+    def stage(self, org, name):
+        """
+        Times the enclosed code as stage name of organization org.
+
+        Args:
+            org (str): Organization name, "*" for stages of the whole run.
+            name (str): Stage name, one of STAGES, e.g. fetch or evaluate.
+        """
+        if name not in STAGES:
+            raise ValueError(f"Unknown stage {name}, stages are {', '.join(STAGES)}")
+        key = object()
+        record = {"org": org, "stage": name, "status": "ok"}
+        if self.trace_memory:
+            with self.lock:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                self._sample_peak()
+                self.active_peaks[key] = 0
+                record["start_bytes"] = tracemalloc.get_traced_memory()[0]
+
+        profiler = None
+        if name == self.profile_stage and self.profile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        record["offset_seconds"] = round(time.time() - self.started, 3)
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException:
+            record["status"] = "error"
+            raise
+        finally:
+            record["seconds"] = round(time.perf_counter() - start, 6)
+            if profiler is not None:
+                profiler.disable()
+                self.profile_lock.release()
+                os.makedirs(self.profile_folder, exist_ok=True)
+                org_name = re.sub(r"[^\w.-]+", "_", org)
+                record["profile_file"] = os.path.join(
+                    self.profile_folder, f"{self.run_id}_{name}_{org_name}.prof"
+                )
+                profiler.dump_stats(record["profile_file"])
+            with self.lock:
+                if self.trace_memory:
+                    self._sample_peak()
+                    record["peak_bytes"] = self.active_peaks.pop(key)
+                    record["net_bytes"] = tracemalloc.get_traced_memory()[0] - record.pop(
+                        "start_bytes"
+                    )
+                self.records.append(record)
+
+    def merge(self, records):
+        """
+        Adds stage records collected by a copy of the profiler in another process.
+        """
+        with self.lock:
+            self.records.extend(records)
+
+    def report(self, **run_info) -> dict:
+        """
+        Returns the run report: all stage records, totals per stage and per organization and the slowest stages.
+
+        Args:
+            run_info: Values describing the run, e.g. report date and workers.
+
+        Returns:
+            dict: Run report.
+        """
+        by_stage = {}
+        by_org = {}
+        for record in self.records:
+            for totals, key in ((by_stage, record["stage"]), (by_org, record["org"])):
+                total = totals.setdefault(key, {"seconds": 0.0, "count": 0})
+                total["seconds"] = round(total["seconds"] + record["seconds"], 6)
+                total["count"] += 1
+                if "peak_bytes" in record:
+                    total["peak_bytes"] = max(total.get("peak_bytes", 0), record["peak_bytes"])
+        return {
+            "run_id": self.run_id,
+            "started": datetime.datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            "total_seconds": round(time.time() - self.started, 3),
+            "trace_memory": self.trace_memory,
+            "profile_stage": self.profile_stage,
+            **run_info,
+            "stages": by_stage,
+            "orgs": by_org,
+            "slowest": sorted(self.records, key=lambda record: -record["seconds"])[:10],
+            "records": self.records,
+        }
+
+    def write(self, **run_info) -> str:
+        """
+        Writes the run report to {profile_folder}/run_{run_id}.json.
+
+        Returns:
+            str: Path of the run report.
+        """
+        os.makedirs(self.profile_folder, exist_ok=True)
+        file_path = os.path.join(self.profile_folder, f"run_{self.run_id}.json")
+        with open(file_path, "w") as f:
+            json.dump(self.report(**run_info), f, indent=2, default=str)
+        return file_path
+
+
+def stage(profiler, org, name):
+    """
+    Returns the profiler's stage timer, or a context doing nothing if profiling is off.
+    """
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.stage(org, name)
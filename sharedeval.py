@@ -0,0 +1,183 @@
+import contextlib
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import eniscopedata as ed
+
+
+class SharedFrame:
+    """
+    Class for numeric columns of a channel frame copied once into shared memory blocks, so process pool
+    workers read them as zero-copy numpy views instead of getting the frame pickled.
+
+    Only the descriptor (block names, dtypes and lengths) is sent to workers. The blocks are freed when
+    the frame is closed, workers only attach to them.
+
+    Args:
+        channel_data_df (pd.DataFrame): Readings sorted by channel and time.
+        columns (list): Numeric columns to share, e.g. ts and the alarm fields.
+
+    Methods:
+        close(self): Frees the shared memory blocks.
+    """
+
+    def __init__(self, channel_data_df: pd.DataFrame, columns: list):
+        self.blocks = []
+        self.descriptor = {}
+        try:
+            for column in columns:
+                dtype = np.dtype("int64") if column == "ts" else np.dtype("float64")
+                values = channel_data_df[column].to_numpy(dtype=dtype)
+                # a block can not be empty
+                block = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+                self.blocks.append(block)
+                np.ndarray(values.shape, dtype=dtype, buffer=block.buf)[:] = values
+                self.descriptor[column] = (block.name, dtype.str, values.size)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def attach(descriptor):
+    """
+    Attaches to the blocks of a SharedFrame descriptor.
+
+    Returns:
+        list: Attached blocks, to be closed once the arrays are no longer used.
+        dict: Read-only array view of every column.
+    """
+    blocks = []
+    arrays = {}
+    for column, (name, dtype, length) in descriptor.items():
+        block = shared_memory.SharedMemory(name=name)
+        blocks.append(block)
+        array = np.ndarray((length,), dtype=np.dtype(dtype), buffer=block.buf)
+        array.flags.writeable = False
+        arrays[column] = array
+    return blocks, arrays
+
+
+@functools.lru_cache(maxsize=None)
+def _schedule(days, start_time, end_time, tz):
+    # the same schedule as hwminutes.compile_schedule, compiled once per worker
+    return ed.Schedule(set(days), [start_time, end_time], tz=tz)
+
+
+def _channel_masks(arrays, start, stop, alarms, tz):
+    """
+    Evaluates the alarms of one channel on rows start to stop of shared arrays, the same way
+    hwminutes.evaluate_alarms does, and returns bit-packed activation masks of the channel rows.
+    """
+    datetime = pd.Series(pd.to_datetime(arrays["ts"][start:stop], unit="s", utc=True)).dt.tz_convert(tz)
+    masks = []
+    for key, field, threshold, direction, interval, days, start_time, end_time in alarms:
+        rule = ed.Threshold(threshold, direction, field, interval)
+        schedule = _schedule(days, start_time, end_time, tz)
+        field_mean = pd.Series(ed.rollingMean(arrays[field][start:stop], rule.reportInterval)).bfill()
+        active = ((schedule == datetime) & (rule == field_mean)).to_numpy()
+        masks.append((key, np.packbits(active)))
+    return masks
+
+
+def _evaluate_channel(descriptor, start, stop, alarms, tz):
+    blocks, arrays = attach(descriptor)
+    try:
+        return _channel_masks(arrays, start, stop, alarms, tz)
+    finally:
+        # views must be released before their blocks are closed
+        del arrays
+        for block in blocks:
+            block.close()
+
+
+def eval_pool(workers):
+    """
+    Starts the process pool evaluating alarms, to be created once per run and passed to every evaluation.
+
+    Workers are started by a fork server or spawned, never forked from the caller: pools are used from
+    organization worker threads, and a fork while other threads hold the locks of HTTP connection pools
+    or logging would leave those locks held in the child.
+
+    Args:
+        workers (Optional[int]): Number of worker processes.
+
+    Returns:
+        ProcessPoolExecutor: Pool to use as a context manager, or a context of None if workers is None or 1.
+    """
+    if not workers or workers < 2:
+        return contextlib.nullcontext()
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+
+
+def activation_masks(channel_data_df, alarms_to_monitor, tz, pool) -> dict:
+    """
+    Evaluates alarms in a process pool: the frame's ts and alarm field columns are put into shared memory once
+    and every channel with its alarms is a task, so workers get only row ranges and alarm settings.
+
+    Args:
+        channel_data_df (pd.DataFrame): Readings sorted by channel and time, rows of a channel are contiguous.
+        alarms_to_monitor (pd.DataFrame): Settings of the alarms to evaluate.
+        tz (str): Organization timezone.
+        pool (ProcessPoolExecutor): Pool started by eval_pool.
+
+    Returns:
+        dict: Activation mask of the channel rows for every alarm settings index label, None if rows of a
+            channel are not contiguous and the frame can not be shared by row ranges.
+    """
+    channel_rows = channel_data_df.groupby("channelId").indices
+    ranges = {}
+    for channel_id, rows in channel_rows.items():
+        if rows[-1] - rows[0] + 1 != rows.size:
+            return None
+        ranges[channel_id] = (int(rows[0]), int(rows[-1]) + 1)
+
+    tasks = []
+    for channel_id, channel_alarms in alarms_to_monitor.groupby("channelId", sort=True):
+        if channel_id not in ranges:
+            continue
+        alarms = [
+            (
+                key,
+                alarm.field,
+                alarm.thresholdValue,
+                alarm.thresholdDirection,
+                alarm.reportingInterval,
+                tuple(sorted(alarm.days)),
+                alarm.startTime,
+                alarm.endTime,
+            )
+            for key, alarm in channel_alarms.iterrows()
+        ]
+        tasks.append((*ranges[channel_id], alarms))
+
+    columns = ["ts", *dict.fromkeys(alarms_to_monitor["field"])]
+    masks = {}
+    with SharedFrame(channel_data_df, columns) as shared:
+        # the largest channels first, so they do not end up last on a busy pool
+        tasks.sort(key=lambda task: -(task[1] - task[0]) * len(task[2]))
+        futures = [
+            (start, stop, pool.submit(_evaluate_channel, shared.descriptor, start, stop, alarms, tz))
+            for start, stop, alarms in tasks
+        ]
+        for start, stop, future in futures:
+            for key, packed in future.result():
+                masks[key] = np.unpackbits(packed, count=stop - start).astype(bool)
+    return masks
@@ -1,16 +1,34 @@
 # %%
 # script which takes summary sheet and upodate feedback loop documents
 # version 0.1
-from google.oauth2.service_account import Credentials
-import gspread
 import time, datetime
+import numpy as np
 import pandas as pd
-import os, ast, pprint
+import os, ast, pprint, json
+import hashlib
 import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# last synced dates of every worksheet, so only new and changed rows are written
+SYNC_STATE_FILE = "./sheet_sync_state.json"
+# active time column is written as a fraction of a day and shown as time
+TIME_COLUMN = "Active Time, HH:mm"
+TIME_FORMAT = {"type": "TIME", "pattern": "hh:mm"}
+# Sheets API per user per minute quotas of the service account, and concurrent spreadsheet updates
+READS_PER_MINUTE = 60
+WRITES_PER_MINUTE = 60
+SHEET_WORKERS = 8
+# HTTP statuses of Sheets API responses which are worth retrying with backoff
+RETRY_STATUSES = {429, 500, 502, 503, 504}
 
 
 # authenticate with Google service accout and return client
 def gs_authentificate():
+    # Google client libraries are imported only when sheets are really updated
+    from google.oauth2.service_account import Credentials
+    import gspread
+
     cred_file = "feedbackloop-399807-300aec3efe37.json"
     # Load your credentials from service account file
     creds = Credentials.from_service_account_file(
@@ -21,6 +39,122 @@ def gs_authentificate():
     return gspread.authorize(creds)
 
 
+def error_status(error):
+    """
+    Return the HTTP status of a gspread APIError, None for other errors.
+    """
+    return getattr(getattr(error, "response", None), "status_code", None)
+
+
+def is_retryable(error):
+    """
+    Check if an error is a Sheets API quota (429) or transient server error.
+    """
+    return error_status(error) in RETRY_STATUSES or "The service is currently unavailable" in str(error)
+
+
+class TokenBucket:
+    """
+    Class for a thread-safe token bucket limiting requests to a per-minute quota.
+
+    The bucket holds up to burst tokens and refills at (per_minute - burst) tokens per minute,
+    so no 60 second window gets more than per_minute requests. A 429 response pauses the bucket
+    for everybody, not just for the worker which got it.
+
+    Args:
+        per_minute (int): Requests allowed per minute.
+        burst (Optional[int]): Requests which can be sent at once, a tenth of the quota by default.
+
+    Methods:
+        acquire(self): Waits for a token.
+        pause(self, seconds): Hands out no tokens for the given time.
+    """
+
+    def __init__(self, per_minute, burst=None):
+        self.burst = burst or max(1, per_minute // 10)
+        self.rate = max(1, per_minute - self.burst) / 60
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Waits until a token is available and takes it.
+
+        Returns:
+            float: Seconds waited.
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds):
+        """
+        Hands out no tokens for the given time and drops the saved up ones.
+        """
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+
+class SheetsQuota:
+    """
+    Class scheduling Sheets API calls of concurrent spreadsheet updates within the read and write quotas.
+
+    Args:
+        reads_per_minute (int): Read requests quota.
+        writes_per_minute (int): Write requests quota.
+        retries (int): Retries of quota and server errors per call.
+
+    Methods:
+        read(self, function, *args, **kwargs): Calls a function sending one read request.
+        write(self, function, *args, **kwargs): Calls a function sending one write request.
+    """
+
+    def __init__(self, reads_per_minute=READS_PER_MINUTE, writes_per_minute=WRITES_PER_MINUTE, retries=5):
+        self.buckets = {"read": TokenBucket(reads_per_minute), "write": TokenBucket(writes_per_minute)}
+        self.retries = retries
+        self.lock = threading.Lock()
+        self.stats = {"read": 0, "write": 0, "retried": 0, "waited": 0.0}
+
+    def call(self, kind, function, *args, **kwargs):
+        bucket = self.buckets[kind]
+        for attempt in range(self.retries + 1):
+            waited = bucket.acquire()
+            with self.lock:
+                self.stats[kind] += 1
+                self.stats["waited"] += waited
+            try:
+                return function(*args, **kwargs)
+            except Exception as error:
+                if attempt == self.retries or not is_retryable(error):
+                    raise
+                # exponential backoff with jitter, so paused workers do not come back at the same moment
+                delay = min(64, 2**attempt) + random.random()
+                if error_status(error) == 429:
+                    bucket.pause(delay)
+                with self.lock:
+                    self.stats["retried"] += 1
+                print(f"{current_time()}Sheets API error {error_status(error)}, retrying in {delay:.1f} s")
+                time.sleep(delay)
+
+    def read(self, function, *args, **kwargs):
+        return self.call("read", function, *args, **kwargs)
+
+    def write(self, function, *args, **kwargs):
+        return self.call("write", function, *args, **kwargs)
+
+
 # function which retry on failure
 def retry_on_failure(num_attempts=5, timeout=5, delay=1):
     def decorator(func):
@@ -30,7 +164,7 @@ def retry_on_failure(num_attempts=5, timeout=5, delay=1):
                     return func(*args, **kwargs)
                 except Exception as e:
                     print(f"{current_time()} Attempt {attempt} failed with error: {e}")
-                    if "The service is currently unavailable" in str(e):
+                    if is_retryable(e):
                         print(f"{current_time()} Applying exponential backoff.")
                         time.sleep(
                             (2**attempt) + random.random()
@@ -89,6 +223,184 @@ def gs_sheet_update(client, spreadsheet_id, worksheet_name, range_name, df):
         return True
 
 
+def cell_data(value, column):
+    """
+    Return Sheets API CellData of a summary value, active time column cells get the hh:mm time format.
+    """
+    if value is None or (isinstance(value, float) and value != value):
+        cell = {}
+    elif isinstance(value, (bool, int, float)):
+        cell = {"userEnteredValue": {"numberValue": value}}
+    else:
+        cell = {"userEnteredValue": {"stringValue": str(value)}}
+    if column == TIME_COLUMN:
+        cell["userEnteredFormat"] = {"numberFormat": TIME_FORMAT}
+    return cell
+
+
+def sheet_rows(df):
+    """
+    Return the rows of a summary frame as JSON compatible lists, in sheet order.
+    """
+    return json.loads(df.to_json(orient="values", date_format="iso"))
+
+
+def date_partitions(df, rows):
+    """
+    Return [date, row count, digest] of every date of an organization summary, in sheet order.
+    A date is the unit of change: its rows are replaced as a whole when any of them changes.
+    """
+    partitions = []
+    for date, row in zip(df["Date"].astype(str), rows):
+        if not partitions or partitions[-1][0] != date:
+            partitions.append([date, 0, hashlib.md5()])
+        partitions[-1][1] += 1
+        partitions[-1][2].update(json.dumps(row).encode())
+    return [[date, count, digest.hexdigest()] for date, count, digest in partitions]
+
+
+def load_sync_state(state_file=SYNC_STATE_FILE):
+    """
+    Read the sheet sync state: {"spreadsheet id/worksheet": {"organization", "header", "partitions"}}.
+    """
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file, "r") as f:
+        try:
+            return json.load(f)
+        except ValueError:
+            print(f"{current_time()}Sheet sync state is not valid JSON, sheets will be rewritten.")
+            return {}
+
+
+def save_sync_state(state, state_file=SYNC_STATE_FILE):
+    temp_path = f"{state_file}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(temp_path, state_file)
+
+
+def sync_requests(sheet_id, row_count, header, rows, partitions, synced):
+    """
+    Return Sheets API batchUpdate requests which bring a worksheet from its synced state to the summary rows.
+
+    Dates are compared with the synced ones in sheet order: a date with the same rows count but other
+    values is rewritten in place, from the first added, removed or resized date on all rows are rewritten
+    and rows left over below them are cleared. A daily run therefore writes only the rows of the new day.
+
+    Parameters:
+    - sheet_id (int): Worksheet ID.
+    - row_count (int): Current number of worksheet grid rows.
+    - header (list): Column names, written to the first row.
+    - rows (list): Summary rows.
+    - partitions (list): [date, row count, digest] of the rows, see date_partitions.
+    - synced (Optional[dict]): Synced state of the worksheet, None to rewrite it.
+
+    Returns:
+    - list: Requests, empty if the worksheet is up to date.
+    """
+    writes = []  # (first row index, rows), 0-based, row 0 is the header
+    old_partitions = []
+    if synced is None or synced.get("header") != header:
+        writes.append((0, [header]))
+    else:
+        old_partitions = synced["partitions"]
+
+    row = 1
+    tail = None
+    for number, (date, count, digest) in enumerate(partitions):
+        old = old_partitions[number] if number < len(old_partitions) else None
+        if old is None or old[0] != date or old[1] != count:
+            tail = (number, row)
+            break
+        if old[2] != digest:
+            writes.append((row, rows[row - 1 : row - 1 + count]))
+        row += count
+    new_end = 1 + len(rows)
+    old_end = 1 + sum(count for _, count, _ in old_partitions)
+    if tail is not None:
+        writes.append((row, rows[row - 1 :]))
+    # old rows below the new end are cleared, e.g. after dates were removed
+    if old_end > new_end:
+        writes.append((new_end, [[None] * len(header)] * (old_end - new_end)))
+
+    requests = []
+    if new_end > row_count:
+        requests.append(
+            {
+                "appendDimension": {
+                    "sheetId": sheet_id,
+                    "dimension": "ROWS",
+                    "length": new_end - row_count,
+                }
+            }
+        )
+    for start, values in writes:
+        requests.append(
+            {
+                "updateCells": {
+                    "start": {"sheetId": sheet_id, "rowIndex": start, "columnIndex": 0},
+                    "rows": [
+                        {
+                            "values": [
+                                cell_data(value, column)
+                                for column, value in zip(header, row_values)
+                            ]
+                        }
+                        for row_values in values
+                    ],
+                    "fields": "userEnteredValue,userEnteredFormat.numberFormat",
+                }
+            }
+        )
+    return requests
+
+
+def gs_sheet_sync(client, spreadsheet_id, worksheet_name, df, synced=None, quota=None):
+    """
+    Write new and changed summary rows of an organization to its worksheet in a single batch_update request
+    carrying both values and formats. Every API request goes through the quota scheduler, which retries
+    quota and server errors.
+
+    Parameters:
+    - client (gspread.Client): Authorized client.
+    - spreadsheet_id (str): Spreadsheet ID.
+    - worksheet_name (str): Worksheet name, created if missing.
+    - df (pd.DataFrame): Organization summary prepared by load_summary.
+    - synced (Optional[dict]): Synced state of the worksheet, None to rewrite it.
+    - quota (Optional[SheetsQuota]): Quota scheduler shared by concurrent updates.
+
+    Returns:
+    - dict: New synced state of the worksheet.
+    """
+    quota = quota or SheetsQuota()
+    sheet = quota.read(client.open_by_key, spreadsheet_id)
+    try:
+        worksheet = quota.read(sheet.worksheet, worksheet_name)
+    except Exception as error:
+        if is_retryable(error):
+            raise
+        worksheet = quota.write(sheet.add_worksheet, title=worksheet_name, rows="1000", cols="10")
+        print(f"{current_time()}Worksheet not found. New worksheet created.")
+        synced = None
+
+    header = df.columns.values.tolist()
+    rows = sheet_rows(df)
+    partitions = date_partitions(df, rows)
+    requests = sync_requests(worksheet.id, worksheet.row_count, header, rows, partitions, synced)
+    if requests:
+        quota.write(sheet.batch_update, {"requests": requests})
+    written = sum(
+        len(request["updateCells"]["rows"]) for request in requests if "updateCells" in request
+    )
+    print(f"{current_time()}Spreadsheet {sheet.title}: {written} rows written")
+    return {
+        "organization": df["Organization"].iloc[0] if len(df) else None,
+        "header": header,
+        "partitions": partitions,
+    }
+
+
 def current_time():
     return datetime.datetime.now().strftime("[%Y-%m-%d %H:%M:%S]: ")
 
@@ -101,7 +413,7 @@ def write_default_config(config_file, default_config):
 def read_config(config_file, default_config):
     if not os.path.exists(config_file):
         write_default_config(config_file, default_config)
-        org_sheets = default_config
+        return default_config
     else:
         with open(config_file, "r") as f:
             content = f.read()
@@ -131,49 +443,135 @@ live_org_sheets = {
 WORKSHEET_NAME = "HW_MINUTES"
 RANGE_NAME = "A1"  # Example range
 
-# temporary gspread warning suppression
-import warnings
-
-warnings.filterwarnings("ignore", category=UserWarning, module="gspread")
+SUMMARY_FILE = "./reports/hwminutes_summary.xlsx"
+SUMMARY_DB = "./hwminutes_summary.db"
+config_file = "fbl_files.conf"
 
 
 # %%
-# Read esxisting hwsummary file and create dataframe
+def prepare_sheet_frame(summary):
+    """
+    Convert summary lines to feedback loop sheet lines: the alarm name without its rule in brackets, capitalized,
+    and the active time HH:mm as a fraction of a day, which the sheet shows in hh:mm time format.
+
+    Parameters:
+    - summary (pd.DataFrame): Summary lines as read from the summary store or returned by hwminutes.run.
+
+    Returns:
+    - pd.DataFrame: Sheet lines, the summary is not changed.
+    """
+    df = summary.copy()
+    # a summary repeats a few alarm names and at most 1440 active times, so each distinct value
+    # is converted once and the results are taken by the factorized codes; missing values get code -1,
+    # which takes the blank appended after the converted values
+    codes, alarms = pd.factorize(df["Alarm"])
+    alarms = np.array([alarm.split(" (", 1)[0].capitalize() for alarm in alarms] + [None], dtype=object)
+    df["Alarm"] = alarms[codes]
+    codes, active_times = pd.factorize(df["Active Time, HH:mm"])
+    seconds = np.array(
+        [int(hours) * 3600 + int(minutes) * 60 for hours, minutes in (t.split(":") for t in active_times)]
+        + [np.nan],
+        dtype=float,
+    )
+    df["Active Time, HH:mm"] = seconds[codes] / (24 * 60 * 60)
+    return df
 
-df = pd.read_excel("./reports/hwminutes_summary.xlsx")
-df["Alarm"] = df["Alarm"].apply(lambda x: x[: x.index(" (")].capitalize())
-df["Active Time, HH:mm"] = (
-    pd.to_timedelta(df["Active Time, HH:mm"].apply(lambda x: x + ":00")).astype(int)
-    / 1e9
-    / (24 * 60 * 60)
-)
 
-# try to read config file, if return None, print error message and exit
-config_file = "fbl_files.conf"
-default_config = org_sheets
-live_org_sheets = read_config(config_file, default_config)
-if live_org_sheets == None:
-    print(f"{current_time()}Error: Configuration file load error!")
-    exit()
+# Read summary from the summary store, or esxisting hwsummary file if there is no store, and create dataframe
+def load_summary(summary_file=SUMMARY_FILE, summary_db=SUMMARY_DB):
+    if os.path.exists(summary_db):
+        from summarystore import SummaryStore
 
+        with SummaryStore(summary_db) as store:
+            df = store.read()
+    else:
+        df = pd.read_excel(summary_file)
+    return prepare_sheet_frame(df)
 
-# %%
 
-try:
-    client = gs_authentificate()
+def update_sheets(df, sheets, incremental=True, state_file=SYNC_STATE_FILE, workers=SHEET_WORKERS):
+    """
+    Update HW_MINUTES worksheet of every organization feedback loop spreadsheet with its summary lines.
+
+    Parameters:
+    - df (pd.DataFrame): Summary prepared by load_summary.
+    - sheets (dict): Spreadsheet ID for each organization name.
+    - incremental (bool, optional): Write only dates added or changed since the last sync, in one
+      batch_update request per spreadsheet. Otherwise every worksheet is rewritten as a whole.
+    - state_file (str, optional): Sheet sync state file.
+    - workers (int, optional): Spreadsheets updated concurrently in incremental mode, their requests
+      are scheduled within the Sheets API read and write quotas.
+    """
+    # temporary gspread warning suppression
+    import warnings
 
-    print(f"{current_time()}Client authenticated.")
-except:
-    print(f"{current_time()}Authentication failed!")
+    warnings.filterwarnings("ignore", category=UserWarning, module="gspread")
 
-for org in live_org_sheets.keys():
-    df_org = df[df["Organization"] == org]
     try:
-        gs_sheet_update(
-            client, live_org_sheets[org], WORKSHEET_NAME, RANGE_NAME, df_org
-        )
-        print(f"{current_time()}Update of {org} successful.")
+        client = gs_authentificate()
+
+        print(f"{current_time()}Client authenticated.")
     except:
-        print(f"{current_time()}Update of {org} failed!")
-    finally:
-        time.sleep(1)
+        print(f"{current_time()}Authentication failed!")
+        return
+
+    if incremental:
+        state = load_sync_state(state_file)
+        quota = SheetsQuota()
+        start = time.time()
+        org_frames = dict(tuple(df.groupby("Organization", sort=False)))
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(sheets)))) as executor:
+            futures = {}
+            for org, spreadsheet_id in sheets.items():
+                key = f"{spreadsheet_id}/{WORKSHEET_NAME}"
+                synced = state.get(key)
+                if synced is not None and synced.get("organization") not in (org, None):
+                    synced = None
+                df_org = org_frames.get(org, df.iloc[:0])
+                future = executor.submit(
+                    gs_sheet_sync, client, spreadsheet_id, WORKSHEET_NAME, df_org, synced, quota
+                )
+                futures[future] = (org, key)
+            for future in as_completed(futures):
+                org, key = futures[future]
+                try:
+                    state[key] = future.result()
+                    print(f"{current_time()}Update of {org} successful.")
+                except Exception as error:
+                    # the worksheet may be partly written, it is rewritten next time
+                    state.pop(key, None)
+                    print(f"{current_time()}Update of {org} failed! {error}")
+                save_sync_state(state, state_file)
+        print(
+            f"{current_time()}{len(sheets)} spreadsheets updated in {time.time() - start:.1f} s: "
+            f"{quota.stats['read']} reads, {quota.stats['write']} writes, {quota.stats['retried']} retried"
+        )
+        return
+
+    for org in sheets.keys():
+        df_org = df[df["Organization"] == org]
+        try:
+            gs_sheet_update(client, sheets[org], WORKSHEET_NAME, RANGE_NAME, df_org)
+            print(f"{current_time()}Update of {org} successful.")
+        except:
+            print(f"{current_time()}Update of {org} failed!")
+        finally:
+            time.sleep(1)
+
+
+def main(incremental=True, workers=SHEET_WORKERS, summary=None):
+    # try to read config file, if return None, print error message and exit
+    live_org_sheets = read_config(config_file, org_sheets)
+    if live_org_sheets == None:
+        print(f"{current_time()}Error: Configuration file load error!")
+        return 1
+
+    # summary lines handed over in process, e.g. by hwminutes run, are not read again
+    df = load_summary() if summary is None else prepare_sheet_frame(summary)
+    update_sheets(df, live_org_sheets, incremental=incremental, workers=workers)
+    return 0
+
+
+# %%
+if __name__ == "__main__":
+    raise SystemExit(main())
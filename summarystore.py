@@ -0,0 +1,313 @@
+import os
+import sqlite3
+import pandas as pd
+
+# summary frame columns and their names in the store
+COLUMNS = {
+    "Date": "date",
+    "Organization": "organization",
+    "Equipment": "equipment",
+    "Alarm": "alarm",
+    "Alarm Rule": "alarm_rule",
+    "Schedule": "schedule",
+    "Active Time, HH:mm": "active_time",
+    "Energy consumed, kWh": "energy_kwh",
+}
+
+# rollup tables, the SQLite expression of the first day of the period of a date column and the period length;
+# weeks start on Monday: 'weekday 0' moves to the coming Sunday (or keeps a Sunday), 6 days back is its Monday
+ROLLUPS = {
+    "week": ("rollup_week", "date({column}, 'weekday 0', '-6 days')", "+7 days"),
+    "month": ("rollup_month", "date({column}, 'start of month')", "+1 month"),
+}
+# active time HH:mm of summary lines as minutes
+ACTIVE_MINUTES = "CAST(substr(active_time, 1, 2) AS INTEGER) * 60 + CAST(substr(active_time, 4, 2) AS INTEGER)"
+
+
+def _where(column, start, end, organization):
+    """
+    Returns the WHERE clause selecting a column range (inclusive) and an organization, and its parameters.
+    Bounds which are None are not applied.
+    """
+    conditions, parameters = [], []
+    for condition, value in ((f"{column} >= ?", start), (f"{column} <= ?", end), ("organization = ?", organization)):
+        if value is not None:
+            conditions.append(condition)
+            parameters.append(value)
+    return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), parameters
+
+
+class SummaryStore:
+    """
+    Class for storing hwminutes summary lines in SQLite, clustered by (Date, Organization).
+
+    Summary lines of one organization and day are a partition: they are stored next to each other
+    and replaced as a whole, so an update costs the same no matter how much history is stored.
+
+    Weekly and monthly rollups (organization x equipment x alarm x period) are kept in their own tables.
+    An upsert recomputes only the periods of the replaced partitions, in the same transaction.
+
+    Args:
+        path (str): Path to the SQLite database file.
+
+    Methods:
+        upsert(self, frame, partitions): Replaces the (Date, Organization) partitions of the frame or given ones.
+        read(self, organization, start_date, end_date): Returns summary lines as a dataframe.
+        partitions(self): Returns stored (Date, Organization) pairs.
+        refresh_rollups(self, start_date, end_date, organization): Recomputes rollups of the periods of a date range.
+        read_rollup(self, period, organization, start_date, end_date): Returns weekly or monthly rollup lines.
+        import_excel(self, file_path): Loads summary lines from an Excel summary.
+        export_excel(self, file_path): Writes all summary lines and the rollups to an Excel summary.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.is_new = not os.path.exists(path)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS summary (
+                date TEXT NOT NULL,
+                organization TEXT NOT NULL,
+                line INTEGER NOT NULL,
+                equipment TEXT,
+                alarm TEXT,
+                alarm_rule TEXT,
+                schedule TEXT,
+                active_time TEXT,
+                energy_kwh REAL,
+                PRIMARY KEY (date, organization, line)
+            ) WITHOUT ROWID
+            """
+        )
+        rollups_exist = all(
+            self.connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+            ).fetchone()
+            for table, *_ in ROLLUPS.values()
+        )
+        for table, *_ in ROLLUPS.values():
+            self.connection.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    period TEXT NOT NULL,
+                    organization TEXT NOT NULL,
+                    equipment TEXT NOT NULL,
+                    alarm TEXT NOT NULL,
+                    days INTEGER,
+                    active_minutes INTEGER,
+                    energy_kwh REAL,
+                    PRIMARY KEY (period, organization, equipment, alarm)
+                ) WITHOUT ROWID
+                """
+            )
+        self.connection.commit()
+        # stores written before rollups existed get them built once
+        if not rollups_exist:
+            self.refresh_rollups()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def upsert(self, frame: pd.DataFrame, partitions=None) -> int:
+        """
+        Replaces stored lines of every (Date, Organization) present in the frame, and of the given partitions,
+        by the frame lines. A given partition without frame lines is cleared, e.g. a report day on which
+        no alarm was active.
+
+        Args:
+            frame (pd.DataFrame): Summary lines with the summary frame columns.
+            partitions (Optional[list]): (date, organization) pairs of all processed report days.
+
+        Returns:
+            int: Number of stored lines.
+        """
+        if frame.empty and not partitions:
+            return 0
+        frame = frame.reindex(columns=list(COLUMNS)).rename(columns=COLUMNS)
+        frame = frame.assign(date=frame["date"].astype(str))
+        frame.insert(2, "line", frame.groupby(["date", "organization"]).cumcount())
+        partitions = list(
+            dict.fromkeys(
+                [
+                    *((str(date), organization) for date, organization in partitions or []),
+                    *frame[["date", "organization"]].itertuples(index=False, name=None),
+                ]
+            )
+        )
+
+        with self.connection:
+            self.connection.executemany(
+                "DELETE FROM summary WHERE date = ? AND organization = ?", partitions
+            )
+            self.connection.executemany(
+                f"INSERT INTO summary ({', '.join(frame.columns)}) VALUES ({', '.join('?' * len(frame.columns))})",
+                frame.astype(object)
+                .where(frame.notna(), None)
+                .itertuples(index=False, name=None),
+            )
+            self._update_rollups(partitions)
+        return len(frame)
+
+    def _update_rollups(self, partitions):
+        """
+        Recomputes rollup lines of the periods and organizations of (date, organization) partitions.
+        """
+        partitions = list(partitions)
+        for table, period_start, length in ROLLUPS.values():
+            periods = {
+                (
+                    self.connection.execute(
+                        f"SELECT {period_start.format(column='?')}", (date,)
+                    ).fetchone()[0],
+                    organization,
+                )
+                for date, organization in partitions
+            }
+            for period, organization in sorted(periods):
+                self.connection.execute(
+                    f"DELETE FROM {table} WHERE period = ? AND organization = ?",
+                    (period, organization),
+                )
+                # the date range of the period is scanned on the primary key, then filtered by organization
+                self.connection.execute(
+                    f"""
+                    INSERT INTO {table} (period, organization, equipment, alarm, days, active_minutes, energy_kwh)
+                    SELECT ?, organization, coalesce(equipment, ''), coalesce(alarm, ''),
+                        COUNT(DISTINCT date), SUM({ACTIVE_MINUTES}), ROUND(SUM(energy_kwh), 2)
+                    FROM summary
+                    WHERE date >= ? AND date < date(?, '{length}')
+                        AND organization = ?
+                    GROUP BY organization, coalesce(equipment, ''), coalesce(alarm, '')
+                    """,
+                    (period, period, period, organization),
+                )
+
+    def refresh_rollups(self, start_date=None, end_date=None, organization=None) -> int:
+        """
+        Recomputes weekly and monthly rollups of all periods touching a date range, e.g. after a backfill
+        written outside the store. Without arguments all rollups are rebuilt.
+
+        Args:
+            start_date (Optional[str]): First date in YYYY-MM-DD format, inclusive.
+            end_date (Optional[str]): Last date in YYYY-MM-DD format, inclusive.
+            organization (Optional[str]): Organization name.
+
+        Returns:
+            int: Number of recomputed (date, organization) partitions.
+        """
+        where, parameters = _where("date", start_date, end_date, organization)
+        partitions = self.connection.execute(
+            f"SELECT DISTINCT date, organization FROM summary {where}", parameters
+        ).fetchall()
+        with self.connection:
+            if not parameters:
+                for table, *_ in ROLLUPS.values():
+                    self.connection.execute(f"DELETE FROM {table}")
+            self._update_rollups(partitions)
+        return len(partitions)
+
+    def read_rollup(self, period="month", organization=None, start_date=None, end_date=None) -> pd.DataFrame:
+        """
+        Returns rollup lines of an organization, equipment and alarm for every week or month.
+
+        Args:
+            period (str): "week" or "month".
+            organization (Optional[str]): Organization name.
+            start_date (Optional[str]): First period start in YYYY-MM-DD format, inclusive.
+            end_date (Optional[str]): Last period start in YYYY-MM-DD format, inclusive.
+
+        Returns:
+            pd.DataFrame: Period (first day), Organization, Equipment, Alarm, Days, Active Time, HH:mm,
+                Active minutes and Energy consumed, kWh columns, ordered by period and organization.
+        """
+        table = ROLLUPS[period][0]
+        where, parameters = _where("period", start_date, end_date, organization)
+        frame = pd.read_sql_query(
+            f"SELECT * FROM {table} {where} ORDER BY period, organization, energy_kwh DESC",
+            self.connection,
+            params=parameters,
+        )
+        # active time of a week or month can be longer than a day, so hours are not wrapped
+        active_time = (frame["active_minutes"] // 60).astype(str) + ":" + (
+            frame["active_minutes"] % 60
+        ).astype(str).str.zfill(2)
+        frame.insert(5, "active_time", active_time)
+        return frame.rename(
+            columns={
+                "period": "Period",
+                "organization": "Organization",
+                "equipment": "Equipment",
+                "alarm": "Alarm",
+                "days": "Days",
+                "active_time": "Active Time, HH:mm",
+                "active_minutes": "Active minutes",
+                "energy_kwh": "Energy consumed, kWh",
+            }
+        )
+
+    def read(self, organization=None, start_date=None, end_date=None) -> pd.DataFrame:
+        """
+        Returns summary lines, optionally for one organization and a date range.
+
+        Args:
+            organization (Optional[str]): Organization name.
+            start_date (Optional[str]): First date in YYYY-MM-DD format, inclusive.
+            end_date (Optional[str]): Last date in YYYY-MM-DD format, inclusive.
+
+        Returns:
+            pd.DataFrame: Summary lines with the summary frame columns, ordered by date and organization.
+        """
+        where, parameters = _where("date", start_date, end_date, organization)
+        frame = pd.read_sql_query(
+            f"SELECT {', '.join(COLUMNS.values())} FROM summary {where} ORDER BY date, organization, line",
+            self.connection,
+            params=parameters,
+        )
+        return frame.rename(columns={v: k for k, v in COLUMNS.items()})
+
+    def partitions(self) -> list:
+        """
+        Returns stored (Date, Organization) pairs.
+
+        Returns:
+            list: List of (date, organization) tuples.
+        """
+        return self.connection.execute(
+            "SELECT DISTINCT date, organization FROM summary ORDER BY date, organization"
+        ).fetchall()
+
+    def import_excel(self, file_path: str) -> int:
+        """
+        Loads summary lines from an Excel summary, e.g. hwminutes_summary.xlsx written before the store existed.
+
+        Args:
+            file_path (str): Path to the Excel file.
+
+        Returns:
+            int: Number of imported lines.
+        """
+        frame = pd.read_excel(file_path)
+        if frame.empty:
+            return 0
+        frame["Date"] = pd.to_datetime(frame["Date"]).dt.strftime("%Y-%m-%d")
+        return self.upsert(frame)
+
+    def export_excel(self, file_path: str):
+        """
+        Writes all summary lines to the first sheet of an Excel summary, and weekly and monthly rollups
+        to the Weekly and Monthly sheets.
+
+        Args:
+            file_path (str): Path to the Excel file.
+        """
+        with pd.ExcelWriter(file_path) as writer:
+            self.read().to_excel(writer, index=False)
+            self.read_rollup("week").to_excel(writer, sheet_name="Weekly", index=False)
+            self.read_rollup("month").to_excel(writer, sheet_name="Monthly", index=False)
@@ -0,0 +1,33 @@
+import contextlib
+import io
+
+import pytest
+
+import hwminutes as hw
+from synthetic import SyntheticAPI, SyntheticData
+
+# 2023-10-29 is the 25 hour day of the end of daylight saving time in Europe
+DATES = ("2023-10-28", "2023-10-30")
+TZ = "Europe/Madrid"
+
+
+@pytest.fixture(scope="session")
+def api():
+    return SyntheticAPI(SyntheticData(3, channels=6, alarms=3, tz=TZ))
+
+
+@pytest.fixture(scope="session")
+def sites(api):
+    """
+    Planned alarms, report days and readings of every synthetic site over the DST change.
+    """
+    sites = []
+    for org in api.get_organizations_list():
+        channel_names = [channel["channelName"] for channel in api.get_channels_list(org["organizationId"])]
+        with contextlib.redirect_stdout(io.StringIO()):
+            alarms = hw.get_alarm_settings(api, org["organizationId"], channel_names)
+        days = hw.report_days(TZ, *DATES)
+        alarms, _ = hw.plan_alarms(alarms, days, TZ)
+        frame = hw.get_channel_frame(api, alarms, [day[:2] for day in days], TZ)
+        sites.append((org["organizationName"], alarms, days, frame))
+    return sites
@@ -0,0 +1,31 @@
+import sys
+import types
+
+import requests
+
+import eniscopeapi as es
+
+
+def test_expired_token_is_renewed_on_the_same_session(monkeypatch):
+    monkeypatch.setitem(sys.modules, "credentials", types.SimpleNamespace(encryption_key=None))
+    api = es.EniscopeAPIClient("key")
+    session = api.session
+    session.headers["X-Eniscope-Token"] = "expired"
+    logins = []
+
+    def authenticate_user():
+        logins.append(session.headers["X-Eniscope-Token"])
+        session.headers["X-Eniscope-Token"] = "renewed"
+        return True
+
+    def get(url, **kwargs):
+        response = requests.Response()
+        response.status_code = 200 if session.headers["X-Eniscope-Token"] == "renewed" else 401
+        response._content = b'{"channels": []}'
+        return response
+
+    monkeypatch.setattr(api, "authenticate_user", authenticate_user)
+    monkeypatch.setattr(session, "get", get)
+    assert api.get_request_data("https://core.eniscope.com/v1/channels/") == {"channels": []}
+    assert api.get_request_data("https://core.eniscope.com/v1/channels/") == {"channels": []}
+    assert logins == ["expired"] and api.session is session
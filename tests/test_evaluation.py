@@ -0,0 +1,126 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import hwminutes as hw
+import sharedeval
+import whatif
+from conftest import DATES, TZ
+from minutearchive import MinuteArchive
+
+
+@pytest.fixture(scope="module")
+def reports(sites):
+    # the reference: all channels of a site evaluated at once in this process
+    return [hw.evaluate_alarms(org, frame, alarms, TZ, days) for org, alarms, days, frame in sites]
+
+
+def assert_same(result, reference):
+    for frame, expected in zip(result, reference):
+        pd.testing.assert_frame_equal(frame, expected)
+
+
+def test_synthetic_readings_do_not_depend_on_the_requested_range(api, sites):
+    _, alarms, days, _ = sites[0]
+    channel_id = alarms["channelId"].iloc[0]
+    whole = pd.DataFrame(api.data.channel_data(channel_id, days[0][0], days[-1][1])["records"])
+    part = pd.DataFrame(api.data.channel_data(channel_id, days[1][0] + 3600, days[2][0] + 7200)["records"])
+    pd.testing.assert_frame_equal(part, whole[whole["ts"].isin(part["ts"])].reset_index(drop=True))
+
+
+def test_sites_span_the_dst_change(sites):
+    _, _, days, frame = sites[0]
+    assert [end - start for start, end, _ in days] == [86400, 90000, 86400]
+    assert frame["datetime"].map(lambda moment: moment.utcoffset()).nunique() == 2
+
+
+def test_end_date_before_report_date_is_rejected():
+    assert [date for _, _, date in hw.report_days(TZ, DATES[0], DATES[0])] == [DATES[0]]
+    with pytest.raises(ValueError):
+        hw.report_days(TZ, DATES[1], DATES[0])
+    with pytest.raises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+        hw.main(["run", "--date", DATES[1], "--end-date", DATES[0]])
+
+
+@pytest.mark.parametrize("chunk_channels", [1, 4])
+def test_chunks_match(api, sites, reports, chunk_channels):
+    for (org, alarms, days, _), reference in zip(sites, reports):
+        chunks = hw.channel_chunks(alarms, days, chunk_channels=chunk_channels)
+        assert len(chunks) > 1
+        assert_same(hw.evaluate_in_chunks(api, org, alarms, TZ, days, chunks), reference)
+
+
+def test_pipeline_matches(api, sites, reports):
+    for (org, alarms, days, _), reference in zip(sites, reports):
+        assert_same(hw.evaluate_stream(api, org, alarms, TZ, days), reference)
+
+
+def test_shared_memory_workers_match(api, sites, reports):
+    # one pool serves every evaluation of a run; its workers are not forked from the threads of the run
+    with sharedeval.eval_pool(2) as eval_pool:
+        assert eval_pool._mp_context.get_start_method() != "fork"
+        for (org, alarms, days, frame), reference in zip(sites, reports):
+            assert_same(hw.evaluate_alarms(org, frame, alarms, TZ, days, eval_pool=eval_pool), reference)
+            chunks = hw.channel_chunks(alarms, days, chunk_channels=4)
+            assert_same(hw.evaluate_in_chunks(api, org, alarms, TZ, days, chunks, eval_pool=eval_pool), reference)
+
+
+def test_archived_readings_match(api, sites, reports, tmp_path):
+    archive = MinuteArchive(str(tmp_path / "archive"))
+    for (org, alarms, days, _), reference in zip(sites, reports):
+        fields = list(dict.fromkeys([*alarms["field"], "E"]))
+        archive.store_channel_data(
+            api.get_multiple_channel_data(
+                list(alarms["channelId"].unique()), [day[:2] for day in days], fields=fields
+            )
+        )
+        frame = archive.frame(alarms["channelId"].unique(), fields, [day[:2] for day in days], TZ)
+        report, episodes = hw.evaluate_alarms(org, frame, alarms, TZ, days)
+        pd.testing.assert_frame_equal(report, reference[0])
+        pd.testing.assert_frame_equal(episodes, reference[1], check_exact=False)
+
+
+@pytest.mark.parametrize("limited", [False, True])
+def test_whatif_grid_of_alarm_settings_matches(sites, reports, limited):
+    for (org, alarms, days, frame), (report, _) in zip(sites, reports):
+        if limited:
+            alarms = alarms.copy()
+            for column in ["startDate", "expires"]:
+                alarms[column] = alarms[column].astype(object)
+            # half of the alarms start on the second report day, the others expire on it
+            alarms.iloc[::2, alarms.columns.get_loc("startDate")] = f"{days[1][2]} 12:00:00"
+            alarms.iloc[1::2, alarms.columns.get_loc("expires")] = f"{days[1][2]} 12:00:00"
+            report, _ = hw.evaluate_alarms(org, frame, alarms, TZ, days)
+        enabled = alarms[alarms["status"] == 1]
+        results = whatif.evaluate_grid(frame, whatif.candidate_grid(enabled), TZ, days)
+        results = results.merge(enabled[["alarmId", "alarmName"]], on="alarmId")
+        results = results[results["Active minutes"] > 0].sort_values(["Date", "alarmName"])
+        expected = report.sort_values(["Date", "Alarm"])
+
+        active_time = expected["Active Time, HH:mm"].str.split(":", expand=True).astype(int)
+        assert results["Date"].tolist() == expected["Date"].tolist()
+        assert results["alarmName"].tolist() == expected["Alarm"].tolist()
+        assert results["Active minutes"].tolist() == (active_time[0] * 60 + active_time[1]).tolist()
+        assert np.allclose(results["Energy consumed, kWh"], expected["Energy consumed, kWh"], atol=0.005 + 1e-9)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_pipelined_orgs_match(api, workers, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "reports").mkdir()
+    monitoring_list = {
+        org["organizationName"]: [channel["channelName"] for channel in api.get_channels_list(org["organizationId"])]
+        for org in api.get_organizations_list()
+    }
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = hw.process_orgs(api, monitoring_list, *DATES, workers, "thread")
+        pipelined = hw.process_orgs(api, monitoring_list, *DATES, workers, "thread", pipeline=True)
+        shared = hw.process_orgs(api, monitoring_list, *DATES, workers, "thread", eval_workers=2)
+    assert list(pipelined) == list(shared) == list(expected) == list(monitoring_list)
+    for org, (summary_lines, dates) in expected.items():
+        for result in (pipelined, shared):
+            pd.testing.assert_frame_equal(result[org][0], summary_lines)
+            assert result[org][1] == dates
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+import hwminutes as hw
+from conftest import TZ
+
+
+def test_event_spans(sites):
+    _, alarms, days, _ = sites[0]
+    alarm = alarms.iloc[0]
+    other = alarms[alarms["channelId"] != alarm.channelId].iloc[0]
+    reporting, reminder = int(alarm.reportingInterval), int(alarm.reminderInterval)
+    sent = days[1][0] + 3 * 3600
+    events = [
+        {"alarmId": str(alarm.alarmId), "ts": sent},
+        # a reminder while the alarm stays active extends its span
+        {"alarmId": str(alarm.alarmId), "ts": sent + reminder},
+        {"alarmId": str(other.alarmId), "ts": str(days[2][0] + 60)},
+        # events of alarms which are not monitored
+        {"alarmId": "1", "ts": sent},
+        # events which can not be read
+        {"alarmId": str(alarm.alarmId), "time": sent},
+        {"ts": sent},
+    ]
+    channel_ids, fetch_spans, spans, skipped = hw.event_spans(events, alarms, days, TZ)
+
+    assert channel_ids == sorted([alarm.channelId, other.channelId])
+    assert skipped == 2
+    start = sent - reporting - alarm.alarmInterval - hw.EVENT_MARGIN
+    end = sent + 2 * reminder + hw.EVENT_MARGIN
+    assert spans[0] == (start // 60 * 60, -(-end // 60) * 60)
+    assert fetch_spans[0] == (spans[0][0] - reporting - hw.EVENT_MARGIN, spans[0][1])
+    assert len(spans) == len(fetch_spans) == 2
+    assert hw.event_spans({"meta": {"pageCount": 0}, "events": []}, alarms, days, TZ) == ([], [], [], 0)
+
+
+def test_in_spans():
+    ts = np.arange(0, 600, 60)
+    assert hw.in_spans(ts, [(60, 180), (300, 360)]).tolist() == [t in (60, 120, 300) for t in ts]
+    assert not hw.in_spans(ts, []).any()
+
+
+def test_compare_reports(sites):
+    org, alarms, days, frame = sites[0]
+    report, _ = hw.evaluate_alarms(org, frame, alarms, TZ, days)
+    assert hw.compare_reports(report, report).empty
+
+    changed = report.copy()
+    changed.loc[0, "Active Time, HH:mm"] = "23:59"
+    mismatches = hw.compare_reports(changed.iloc[1:-1], report)
+    # the changed first line, and the last line which is missing
+    assert mismatches[["Date", "Equipment", "Alarm"]].values.tolist() == report.iloc[[0, -1]][
+        ["Date", "Equipment", "Alarm"]
+    ].values.tolist()
+    assert mismatches["Active Time, HH:mm events"].isna().tolist() == [True, True]
+    assert len(hw.compare_reports(pd.DataFrame(), report)) == len(report)
+
+
+def test_events_path_matches_full_path(api, sites, monkeypatch):
+    for org, alarms, days, frame in sites:
+        report, episodes = hw.evaluate_alarms(org, frame, alarms, TZ, days)
+        # events as Eniscope sends them: with the reading which completes an alarm interval of activation and
+        # every reminder interval while the activation lasts
+        alarm_ids = alarms.set_index(["channelName", "alarmName"])["alarmId"]
+        events = []
+        for episode in episodes.itertuples():
+            alarm = alarms[alarms["alarmId"] == alarm_ids[(episode.Equipment, episode.Alarm)]].iloc[0]
+            start, end = int(episode.start.timestamp()), int(episode.end.timestamp())
+            for sent in range(start + int(alarm.alarmInterval) - 60, end, int(alarm.reminderInterval)):
+                events.append({"alarmId": str(alarm.alarmId), "ts": sent})
+        monkeypatch.setattr(api, "get_events_list", lambda org_id, date_range: events, raising=False)
+
+        event_frame, spans, info = hw.get_event_frame(api, None, alarms, days, TZ)
+        assert info["skipped_events"] == 0 and info["event_minutes"] < len(frame)
+        events_report, _ = hw.evaluate_alarms(org, event_frame, alarms, TZ, days, spans)
+        assert hw.compare_reports(events_report, report).empty
@@ -0,0 +1,86 @@
+import contextlib
+import io
+
+import pandas as pd
+import pytest
+
+import hwminutes as hw
+import hwservice
+from conftest import DATES
+
+
+@pytest.fixture
+def service(monkeypatch):
+    monkeypatch.setattr(hw, "authenticate", lambda: object())
+    return hwservice.HWMinutesService(port=0)
+
+
+def fake_run(organizations, failed):
+    def run(run_info=None, **kwargs):
+        run_info.update(organizations=organizations, failed=failed)
+        return pd.DataFrame()
+
+    return run
+
+
+def test_cycle_without_failures_is_ok(service, monkeypatch):
+    monkeypatch.setattr(hw, "run", fake_run(["A", "B"], []))
+    assert service.run_cycle()
+    assert service.status()["status"] == "ok"
+
+
+def test_failed_organization_degrades_health(service, monkeypatch):
+    monkeypatch.setattr(hw, "run", fake_run(["A", "B"], ["B"]))
+    assert service.run_cycle()
+    status = service.status()
+    assert status["status"] == "degraded"
+    assert status["last_cycle_failed"] == ["B"] and status["organization_failures"] == 1
+
+    # the next cycle without failures is healthy again
+    monkeypatch.setattr(hw, "run", fake_run(["A", "B"], []))
+    service.run_cycle()
+    assert service.status()["status"] == "ok"
+
+
+def test_all_organizations_failed_fails_the_cycle(service, monkeypatch):
+    monkeypatch.setattr(hw, "run", fake_run(["A", "B"], ["A", "B"]))
+    assert not service.run_cycle()
+    status = service.status()
+    assert status["status"] == "degraded"
+    assert status["failures"] == 1 and status["last_error"] == "All 2 organizations failed"
+
+
+
+def test_client_is_kept_after_a_failed_cycle(service, monkeypatch):
+    clients = []
+    monkeypatch.setattr(hw, "authenticate", lambda: clients.append(object()) or clients[-1])
+    monkeypatch.setattr(hw, "run", fake_run(["A"], ["A"]))
+    assert not service.run_cycle()
+    monkeypatch.setattr(hw, "run", fake_run(["A"], []))
+    assert service.run_cycle()
+    assert len(clients) == 1 and service.api is clients[0]
+
+
+def test_metadata_is_kept_for_cycles_and_channels(api, service, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "reports").mkdir()
+    org = api.get_organizations_list()[0]
+    channel_names = [channel["channelName"] for channel in api.get_channels_list(org["organizationId"])]
+    requests = []
+    get_alarm_data = api.get_alarm_data
+    monkeypatch.setattr(
+        api, "get_alarm_data", lambda *args, **kwargs: requests.append(kwargs) or get_alarm_data(*args, **kwargs)
+    )
+
+    def cycle(channel_names, cycles=1):
+        with contextlib.redirect_stdout(io.StringIO()):
+            hw.process_org(api, org["organizationName"], channel_names, *DATES, metadata_cache=service.cache)
+        service.metrics["cycles"] += cycles
+        return len(requests)
+
+    assert cycle(channel_names) == 1
+    # the next cycles of the default daily schedule take the metadata from the cache
+    assert cycle(channel_names) == 1
+    # the monitored channels were edited in the configuration
+    assert cycle(channel_names[:2], cycles=hwservice.METADATA_CYCLES) == 2
+    assert cycle(channel_names[:2]) == 3
@@ -0,0 +1,26 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from minutearchive import MinuteArchive
+
+
+def test_concurrent_stores_of_one_and_several_channels(tmp_path):
+    archive = MinuteArchive(str(tmp_path))
+    assert archive._channel_lock(1) is archive._channel_lock("1")
+    assert archive._channel_lock(1) is not archive._channel_lock(2)
+
+    hours = 24
+    start = 1_700_000_000 // 3600 * 3600
+
+    def store(channel_id, hour):
+        ts = np.arange(start + hour * 3600, start + (hour + 1) * 3600, 60)
+        archive.store(channel_id, ts, {"P": ts % 7}, covered=(int(ts[0]), int(ts[-1]) + 60))
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(store, [1, 2] * hours, [hour for hour in range(hours) for _ in (1, 2)]))
+
+    ts = np.arange(start, start + hours * 3600, 60)
+    for channel_id in (1, 2):
+        assert archive.covered(channel_id) == [(start, start + hours * 3600)]
+        np.testing.assert_array_equal(archive.read(channel_id, "P", start, start + hours * 3600), ts % 7)
@@ -0,0 +1,52 @@
+import pandas as pd
+
+import hwminutes as hw
+from conftest import TZ
+
+
+def active_alarm(sites):
+    # the alarm of the synthetic sites with report lines on most report days
+    candidates = []
+    for org, alarms, days, frame in sites:
+        report, _ = hw.evaluate_alarms(org, frame, alarms, TZ, days)
+        counts = report.groupby("Alarm")["Date"].nunique()
+        candidates.append((counts.max(), counts.idxmax(), org, alarms, days, frame, report))
+    count, alarm_name, org, alarms, days, frame, report = max(candidates, key=lambda candidate: candidate[0])
+    assert count > 1, "no alarm is active on several report days"
+    return org, alarms, days, frame, report, alarm_name
+
+
+def test_plan_drops_alarms_expired_before_the_window(sites):
+    _, alarms, days, _ = sites[0]
+    alarms = alarms.copy()
+    alarms["expires"] = "2023-10-01 00:00:00"
+    planned, plan = hw.plan_alarms(alarms, days, TZ)
+    assert planned.empty
+    assert plan["dropped"] == {"expired": len(alarms)}
+
+
+def test_days_out_of_alarm_validity_are_not_counted(sites):
+    org, alarms, days, frame, report, alarm_name = active_alarm(sites)
+    alarms = alarms.copy()
+    selected = alarms["alarmName"] == alarm_name
+    active = sorted(report.loc[report["Alarm"] == alarm_name, "Date"])
+
+    for column, value, kept in [
+        ("startDate", f"{active[-1]} 12:00:00", [active[-1]]),
+        ("endDate", f"{active[0]} 08:00:00", [active[0]]),
+        ("expires", f"{active[0]} 12:00:00", [active[0]]),
+    ]:
+        limited = alarms.copy()
+        limited[column] = limited[column].astype(object)
+        limited.loc[selected, column] = value
+        # the alarm may fire on some report days, so it is planned
+        planned, _ = hw.plan_alarms(limited, days, TZ)
+        assert selected[planned.index].any()
+
+        limited_report, _ = hw.evaluate_alarms(org, frame, planned, TZ, days)
+        is_alarm = limited_report["Alarm"] == alarm_name
+        assert sorted(limited_report.loc[is_alarm, "Date"]) == kept
+        expected = report[(report["Alarm"] != alarm_name) | report["Date"].isin(kept)]
+        pd.testing.assert_frame_equal(
+            limited_report.reset_index(drop=True), expected.reset_index(drop=True)
+        )
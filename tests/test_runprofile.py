@@ -0,0 +1,45 @@
+import ast
+import inspect
+
+import pytest
+
+import hwminutes as hw
+import runprofile
+
+
+def timed_stages(module):
+    # literal stage names of the runprofile.stage calls of a module
+    names = set()
+    for node in ast.walk(ast.parse(inspect.getsource(module))):
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Attribute)
+            and node.func.attr == "stage"
+            and isinstance(node.func.value, ast.Name)
+            and node.func.value.id == "runprofile"
+        ):
+            names.add(node.args[2].value)
+    return names
+
+
+def test_timed_stages_are_known():
+    stages = timed_stages(hw)
+    assert {"pipeline", "events", "sheets"} <= stages
+    assert stages <= set(runprofile.STAGES)
+
+
+def test_every_stage_can_be_profiled(monkeypatch):
+    calls = []
+    monkeypatch.setattr(hw, "run", lambda **kwargs: calls.append(kwargs) or object())
+    for name in runprofile.STAGES:
+        assert hw.main(["run", "--profile-stage", name, "--no-upload"]) == 0
+    assert [call["profile_stage"] for call in calls] == runprofile.STAGES
+
+
+def test_unknown_stage_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        runprofile.StageProfiler(profile_stage="evaluation")
+    profiler = runprofile.StageProfiler(profile_folder=str(tmp_path))
+    with pytest.raises(ValueError):
+        with profiler.stage("Site", "evaluation"):
+            pass
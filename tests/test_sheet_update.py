@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+
+import sheet_update
+from sheet_update import cell_data, prepare_sheet_frame, sheet_rows
+
+
+def test_prepare_sheet_frame():
+    summary = pd.DataFrame(
+        {
+            "Date": ["2023-10-02", "2023-10-02", "2023-10-03"],
+            "Organization": ["Site"] * 3,
+            "Alarm": ["oven out of hours (P > 200)", "OVEN OUT OF HOURS (P > 200)", "fryer night"],
+            "Active Time, HH:mm": ["01:30", "00:00", "12:00"],
+        }
+    )
+    sheet = prepare_sheet_frame(summary)
+    assert sheet["Alarm"].tolist() == ["Oven out of hours", "Oven out of hours", "Fryer night"]
+    assert sheet["Active Time, HH:mm"].tolist() == [1.5 / 24, 0.0, 0.5]
+    # the summary is not changed
+    assert summary["Alarm"][0] == "oven out of hours (P > 200)"
+
+
+def test_missing_values_stay_blank():
+    summary = pd.DataFrame(
+        {
+            "Date": ["2023-10-02", "2023-10-02", "2023-10-03"],
+            "Organization": ["Site"] * 3,
+            "Alarm": ["oven out of hours (P > 200)", None, np.nan],
+            "Active Time, HH:mm": [None, "00:45", np.nan],
+        }
+    )
+    sheet = prepare_sheet_frame(summary)
+    assert sheet["Alarm"].tolist()[0] == "Oven out of hours"
+    assert sheet["Alarm"][1:].isna().all()
+    assert np.isnan(sheet["Active Time, HH:mm"][0]) and np.isnan(sheet["Active Time, HH:mm"][2])
+    assert sheet["Active Time, HH:mm"][1] == 0.75 / 24
+    row = sheet_rows(sheet)[2]
+    assert cell_data(row[2], "Alarm") == {}
+
+
+class FakeWorksheet:
+    def __init__(self):
+        self.id = 7
+        self.row_count = 3
+        self.cells = {}
+
+
+class FakeSpreadsheet:
+    # applies the updateCells and appendDimension requests of batch_update to a dict of cell values
+    def __init__(self):
+        self.sheet = FakeWorksheet()
+        self.requests = []
+        self.title = "Feedback loop"
+
+    def worksheet(self, title):
+        return self.sheet
+
+    def batch_update(self, body):
+        for request in body["requests"]:
+            self.requests.append(request)
+            if "appendDimension" in request:
+                self.sheet.row_count += request["appendDimension"]["length"]
+            if "updateCells" in request:
+                update = request["updateCells"]
+                first = update["start"]["rowIndex"]
+                assert first + len(update["rows"]) <= self.sheet.row_count
+                for offset, row in enumerate(update["rows"]):
+                    self.sheet.cells[first + offset] = [
+                        next(iter(cell.get("userEnteredValue", {None: None}).values())) for cell in row["values"]
+                    ]
+
+    def rows(self):
+        rows = [self.sheet.cells[index] for index in sorted(self.sheet.cells)]
+        return [row for row in rows if any(value is not None for value in row)]
+
+
+class FakeClient:
+    def __init__(self):
+        self.spreadsheets = {}
+
+    def open_by_key(self, key):
+        return self.spreadsheets.setdefault(key, FakeSpreadsheet())
+
+
+def sheet_lines(dates, changed=None):
+    return pd.DataFrame(
+        [
+            {
+                "Date": date,
+                "Organization": "Site",
+                "Equipment": f"Oven {number}",
+                "Alarm": "Out of hours",
+                "Active Time, HH:mm": number / 24,
+                "Energy consumed, kWh": 9.0 if date == changed else 1.5,
+            }
+            for date in dates
+            for number in range(3 if date == "2023-10-03" else 2)
+        ]
+    )
+
+
+def test_incremental_sync_matches_the_summary(tmp_path, monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(sheet_update, "gs_authentificate", lambda: client)
+    state_file = str(tmp_path / "sync_state.json")
+    dates = ["2023-10-01", "2023-10-02", "2023-10-03", "2023-10-04"]
+
+    for lines in [
+        sheet_lines(dates[:2]),
+        # a new date is appended, the grid grows
+        sheet_lines(dates[:3]),
+        sheet_lines(dates[:3], changed="2023-10-02"),
+        sheet_lines(dates),
+        # dates removed, the leftover rows are cleared
+        sheet_lines(dates[:2]),
+        sheet_lines(dates[1:]),
+    ]:
+        sheet_update.update_sheets(lines, {"Site": "sheet"}, state_file=state_file)
+        spreadsheet = client.spreadsheets["sheet"]
+        assert spreadsheet.rows() == [lines.columns.tolist()] + sheet_rows(lines)
+
+    # an unchanged summary sends nothing
+    sent = len(spreadsheet.requests)
+    sheet_update.update_sheets(lines, {"Site": "sheet"}, state_file=state_file)
+    assert len(spreadsheet.requests) == sent
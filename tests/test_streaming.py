@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import eniscopedata as ed
+import hwminutes as hw
+from conftest import TZ
+
+REPORT_KEYS = ["Date", "Equipment", "Alarm"]
+
+
+@pytest.mark.parametrize("window", [1, 5, 15])
+@pytest.mark.parametrize("batch", [1, 7, 1000])
+def test_stream_means_match_rolling_mean(window, batch):
+    values = np.random.default_rng(window).uniform(0, 1000, 3000)
+    values[np.random.default_rng(batch).random(values.size) < 0.01] = np.nan
+    stream = ed.AlarmStream(ed.Threshold(0, ">", "P", window * 60), ed.Schedule(set(range(7)), ["00:00", "23:59"]))
+    means = np.concatenate(
+        [stream._rolling_means(values[i : i + batch]) for i in range(0, values.size, batch)]
+    )
+    expected = ed.rollingMean(values, window)
+    assert np.array_equal(means, expected, equal_nan=True)
+    assert np.allclose(expected, pd.Series(values).rolling(window).mean(), equal_nan=True)
+
+
+def stream_evaluation(org, alarms, days, frame, batch_minutes):
+    # report lines of the report days and episodes of readings streamed in batches of batch_minutes
+    streams = hw.create_alarm_streams(alarms, TZ)
+    batches = frame["ts"] // (batch_minutes * 60)
+    # readings before the first report day only complete rolling windows, as in the batch evaluation
+    results = [
+        hw.stream_readings(org, streams, alarms, batch, flush=False)
+        for _, batch in frame.groupby(batches, sort=True)
+    ]
+    results.append(hw.stream_readings(org, streams, alarms, frame.iloc[:0], flush=True))
+    report = pd.concat([result[0] for result in results], ignore_index=True)
+    episodes = pd.concat([result[1] for result in results], ignore_index=True)
+    return report[report["Date"].isin([day[2] for day in days])], episodes
+
+
+def assert_same_evaluation(stream_result, batch_result):
+    (stream_report, stream_episodes), (report, episodes) = stream_result, batch_result
+    expected = report.sort_values(REPORT_KEYS).reset_index(drop=True)
+    streamed = stream_report.sort_values(REPORT_KEYS).reset_index(drop=True)
+    pd.testing.assert_frame_equal(streamed, expected, check_exact=True)
+
+    keys = ["Equipment", "Alarm", "start"]
+    expected = episodes.sort_values(keys).reset_index(drop=True)
+    streamed = stream_episodes.sort_values(keys).reset_index(drop=True)
+    pd.testing.assert_frame_equal(streamed[expected.columns], expected, check_exact=True)
+
+
+@pytest.mark.parametrize("batch_minutes", [90, 720])
+def test_stream_readings_match_evaluate_alarms(sites, batch_minutes):
+    for org, alarms, days, frame in sites:
+        assert_same_evaluation(
+            stream_evaluation(org, alarms, days, frame, batch_minutes),
+            hw.evaluate_alarms(org, frame, alarms, TZ, days),
+        )
+
+
+def test_stream_counts_only_days_within_alarm_validity(sites):
+    org, alarms, days, frame = sites[0]
+    full_report, _ = hw.evaluate_alarms(org, frame, alarms, TZ, days)
+    limited = alarms.copy()
+    for column in ["startDate", "expires"]:
+        limited[column] = limited[column].astype(object)
+    # half of the alarms start on the second report day, the others expire on it
+    limited.iloc[::2, limited.columns.get_loc("startDate")] = f"{days[1][2]} 12:00:00"
+    limited.iloc[1::2, limited.columns.get_loc("expires")] = f"{days[1][2]} 12:00:00"
+
+    report, episodes = hw.evaluate_alarms(org, frame, limited, TZ, days)
+    assert len(report) < len(full_report)
+    assert_same_evaluation(stream_evaluation(org, limited, days, frame, 720), (report, episodes))
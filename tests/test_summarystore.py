@@ -0,0 +1,90 @@
+import pandas as pd
+
+import hwminutes as hw
+from summarystore import SummaryStore
+
+
+def summary_lines(date, organization, lines):
+    return pd.DataFrame(
+        [
+            {
+                "Date": date,
+                "Organization": organization,
+                "Equipment": equipment,
+                "Alarm": "Out of hours",
+                "Alarm Rule": "P > 200",
+                "Schedule": "00:00-06:00",
+                "Active Time, HH:mm": active_time,
+                "Energy consumed, kWh": energy,
+            }
+            for equipment, active_time, energy in lines
+        ]
+    )
+
+
+def test_upsert_replaces_partitions(tmp_path):
+    with SummaryStore(str(tmp_path / "summary.db")) as store:
+        store.upsert(summary_lines("2023-10-02", "Site", [("Oven", "01:30", 2.5), ("Fryer", "00:10", 0.5)]))
+        store.upsert(summary_lines("2023-10-02", "Site", [("Oven", "00:20", 1.0)]))
+        assert store.read()["Equipment"].tolist() == ["Oven"]
+        assert store.read_rollup("month")["Active minutes"].tolist() == [20]
+
+
+def test_day_without_lines_clears_stored_lines(tmp_path):
+    with SummaryStore(str(tmp_path / "summary.db")) as store:
+        hw.store_summary(
+            store,
+            {
+                "Site": (
+                    pd.concat(
+                        [
+                            summary_lines("2023-10-02", "Site", [("Oven", "01:30", 2.5)]),
+                            summary_lines("2023-10-03", "Site", [("Oven", "00:45", 1.2)]),
+                        ],
+                        ignore_index=True,
+                    ),
+                    ["2023-10-02", "2023-10-03"],
+                ),
+                "Other": (summary_lines("2023-10-02", "Other", [("Fryer", "00:05", 0.1)]), ["2023-10-02"]),
+            },
+        )
+        assert len(store.read(organization="Site")) == 2
+
+        # the alarms were fixed and no longer fire on either day
+        hw.store_summary(store, {"Site": (pd.DataFrame(), ["2023-10-02", "2023-10-03"])})
+
+        assert store.read(organization="Site").empty
+        assert store.read_rollup("week", organization="Site").empty
+        assert store.read_rollup("month", organization="Site").empty
+        # other organizations are kept
+        assert store.read(organization="Other")["Equipment"].tolist() == ["Fryer"]
+        assert store.read_rollup("month", organization="Other")["Active minutes"].tolist() == [5]
+
+
+def test_backfill_day_without_lines_keeps_other_days(tmp_path):
+    with SummaryStore(str(tmp_path / "summary.db")) as store:
+        store.upsert(summary_lines("2023-10-02", "Site", [("Oven", "01:30", 2.5)]))
+        store.upsert(summary_lines("2023-10-03", "Site", [("Oven", "00:45", 1.2)]))
+
+        store.upsert(
+            summary_lines("2023-10-03", "Site", [("Oven", "00:15", 0.4)]),
+            partitions=[("2023-10-02", "Site"), ("2023-10-03", "Site")],
+        )
+
+        assert store.read()["Date"].tolist() == ["2023-10-03"]
+        week = store.read_rollup("week")
+        assert week[["Days", "Active minutes"]].values.tolist() == [[1, 15]]
+
+
+def test_reads_filter_by_dates_and_organization(tmp_path):
+    with SummaryStore(str(tmp_path / "summary.db")) as store:
+        for date in ["2023-09-29", "2023-10-02", "2023-10-09"]:
+            for organization in ["Site", "Other"]:
+                store.upsert(summary_lines(date, organization, [("Oven", "00:10", 0.5)]))
+
+        assert store.read("Site", "2023-10-01", "2023-10-09")["Date"].tolist() == ["2023-10-02", "2023-10-09"]
+        assert store.read(end_date="2023-10-01")["Organization"].tolist() == ["Other", "Site"]
+        weeks = store.read_rollup("week", "Other", start_date="2023-10-02", end_date="2023-10-02")
+        assert weeks["Period"].tolist() == ["2023-10-02"]
+        assert store.refresh_rollups(start_date="2023-10-02", organization="Site") == 2
+        assert len(store.read_rollup("month")) == 4
@@ -0,0 +1,223 @@
+import itertools
+import numpy as np
+import pandas as pd
+
+import eniscopedata as ed
+import hwminutes as hw
+
+# candidate columns, named as the alarm settings columns so alarms can be evaluated as candidates
+CANDIDATE_COLUMNS = [
+    "channelId",
+    "field",
+    "thresholdDirection",
+    "thresholdValue",
+    "reportingInterval",
+    "days",
+    "startTime",
+    "endTime",
+]
+# alarm settings columns limiting the days an alarm may fire on, kept with the candidates when present
+VALIDITY_COLUMNS = ["startDate", "endDate", "expires"]
+
+
+def candidate_grid(
+    alarms, thresholds=None, directions=None, intervals=None, windows=None, weekdays=None
+) -> pd.DataFrame:
+    """
+    Builds what-if candidates from alarm settings: every combination of the given values, with the alarm's
+    own setting where a dimension is not given. E.g. thresholds=[200, 500], windows=[("00:00", "06:00"),
+    ("00:00", "06:30")] gives four candidates per alarm.
+
+    Args:
+        alarms (pd.DataFrame): Alarm settings as returned by hwminutes.get_alarm_settings, or any frame
+            with the candidate columns.
+        thresholds (Optional[list]): Threshold values.
+        directions (Optional[list]): Threshold directions, '<', '>' or '=='.
+        intervals (Optional[list]): Reporting intervals, seconds.
+        windows (Optional[list]): (startTime, endTime) schedule windows in HH:MM format.
+        weekdays (Optional[list]): Lists of schedule days (0-6, where 0 is Sunday).
+
+    Returns:
+        pd.DataFrame: One candidate per row with alarmId and the validity columns (if present) and the
+            candidate columns.
+    """
+    validity = [column for column in VALIDITY_COLUMNS if column in alarms]
+    rows = []
+    for alarm in alarms.to_dict("records"):
+        for threshold, direction, interval, window, days in itertools.product(
+            thresholds or [alarm["thresholdValue"]],
+            directions or [alarm["thresholdDirection"]],
+            intervals or [alarm["reportingInterval"]],
+            windows or [(alarm["startTime"], alarm["endTime"])],
+            weekdays or [alarm["days"]],
+        ):
+            rows.append(
+                {
+                    **({"alarmId": alarm["alarmId"]} if "alarmId" in alarm else {}),
+                    "channelId": alarm["channelId"],
+                    "field": alarm["field"],
+                    "thresholdDirection": direction,
+                    "thresholdValue": threshold,
+                    "reportingInterval": interval,
+                    "days": list(days),
+                    "startTime": window[0],
+                    "endTime": window[1],
+                    **{column: alarm[column] for column in validity},
+                }
+            )
+    columns = (["alarmId"] if "alarmId" in alarms else []) + CANDIDATE_COLUMNS + validity
+    return pd.DataFrame(rows, columns=columns)
+
+
+def load_history(archive, candidates, days, tz) -> pd.DataFrame:
+    """
+    Returns archived readings of the candidates' channels and fields for the report days,
+    in the layout of hwminutes.get_channel_frame.
+
+    Args:
+        archive (MinuteArchive): Archive of fetched readings.
+        candidates (pd.DataFrame): Candidates as returned by candidate_grid.
+        days (list): (start, end, date) tuples of the report days as returned by hwminutes.report_days.
+        tz (str): Organization timezone.
+
+    Returns:
+        pd.DataFrame: Readings of the candidates' channels.
+    """
+    fields = list(dict.fromkeys([*candidates["field"].unique(), "E"]))
+    return archive.frame(
+        candidates["channelId"].unique().tolist(),
+        fields,
+        [(start, end) for start, end, _ in days],
+        tz,
+    )
+
+
+def _threshold_counts(means, day_codes, energy, direction, thresholds, n_days):
+    """
+    Counts minutes and sums energy of the means breaking each threshold, per day, after a single sort.
+
+    Means are sorted within every day and energy is cumulated in that order, so the minutes above
+    (or below) any threshold are a contiguous run found by binary search and their energy is the
+    difference of two cumulative sums.
+
+    Returns:
+        np.ndarray: Minutes, shape (thresholds, days).
+        np.ndarray: Energy in Wh, shape (thresholds, days).
+    """
+    order = np.lexsort((means, day_codes))
+    means, day_codes, energy = means[order], day_codes[order], energy[order]
+    cumulated = np.concatenate([[0.0], np.cumsum(energy)])
+    bounds = np.searchsorted(day_codes, np.arange(n_days + 1))
+
+    minutes = np.zeros((thresholds.size, n_days), dtype=np.int64)
+    wh = np.zeros((thresholds.size, n_days))
+    for day in range(n_days):
+        low, high = bounds[day], bounds[day + 1]
+        if low == high:
+            continue
+        values = means[low:high]
+        if direction == ">":
+            first = low + np.searchsorted(values, thresholds, side="right")
+            last = np.full(thresholds.size, high)
+        elif direction == "<":
+            first = np.full(thresholds.size, low)
+            last = low + np.searchsorted(values, thresholds, side="left")
+        elif direction == "==":
+            first = low + np.searchsorted(values, thresholds, side="left")
+            last = low + np.searchsorted(values, thresholds, side="right")
+        else:
+            raise ValueError("Operator is not supported")
+        minutes[:, day] = last - first
+        wh[:, day] = cumulated[last] - cumulated[first]
+    return minutes, wh
+
+
+def evaluate_grid(channel_data_df, candidates, tz, days=None) -> pd.DataFrame:
+    """
+    Evaluates what-if candidates against readings: minutes and energy each candidate would flag per day.
+
+    Rolling means are computed once per channel, field and reporting interval and schedule masks once per
+    channel and schedule, as hwminutes.evaluate_alarms does for a single alarm. Readings are assigned to
+    days by hwminutes.report_day_codes, and candidates with the validity columns count only the days their
+    alarm may fire on, as in evaluate_alarms. All thresholds of the same
+    mean, direction and schedule are then evaluated together from one sort, so a grid of many thresholds
+    costs about as much as one alarm. Minutes are the same as a daily run with the candidate settings
+    would report, energy is equal up to floating point rounding.
+
+    Args:
+        channel_data_df (pd.DataFrame): Readings sorted by channel and time, e.g. from load_history.
+        candidates (pd.DataFrame): Candidates as returned by candidate_grid.
+        tz (str): Organization timezone.
+        days (Optional[list]): (start, end, date) tuples of the report days as returned by
+            hwminutes.report_days. Default is one day covering all readings.
+
+    Returns:
+        pd.DataFrame: One row per candidate and day with the candidate columns, Date, Active minutes
+            and Energy consumed, kWh.
+    """
+    candidates = candidates.reset_index(drop=True)
+    ts = channel_data_df["ts"].to_numpy(dtype="int64")
+    days, day_codes = hw.report_day_codes(ts, tz, days)
+    energy = np.nan_to_num(channel_data_df["E"].to_numpy(dtype=float))
+
+    minutes = np.zeros((len(candidates), len(days)), dtype=np.int64)
+    wh = np.zeros((len(candidates), len(days)))
+    channel_rows = channel_data_df.groupby("channelId").indices
+    schedule_keys = [
+        (frozenset(days_), start, end)
+        for days_, start, end in zip(candidates["days"], candidates["startTime"], candidates["endTime"])
+    ]
+    groups = pd.Series(range(len(candidates))).groupby(
+        [
+            candidates["channelId"],
+            candidates["field"],
+            candidates["reportingInterval"],
+            candidates["thresholdDirection"],
+            pd.factorize(pd.Series(schedule_keys, dtype=object))[0],
+        ],
+        sort=False,
+    )
+    means = {}
+    schedules = {}
+    for (channel_id, field, interval, direction, _), indices in groups:
+        rows = channel_rows.get(channel_id)
+        if rows is None:
+            continue
+        indices = indices.to_numpy()
+        channel_df = channel_data_df.iloc[rows]
+        rule = ed.Threshold(0, direction, field, interval)
+        if (channel_id, field, rule.reportInterval) not in means:
+            means[channel_id, field, rule.reportInterval] = (
+                pd.Series(ed.rollingMean(channel_df[field], rule.reportInterval)).bfill().to_numpy()
+            )
+        schedule_key = schedule_keys[indices[0]]
+        if (channel_id, schedule_key) not in schedules:
+            schedule = ed.Schedule(set(schedule_key[0]), schedule_key[1:], tz)
+            schedules[channel_id, schedule_key] = (schedule == channel_df["datetime"]).to_numpy()
+        field_mean = means[channel_id, field, rule.reportInterval]
+        selected = (
+            schedules[channel_id, schedule_key] & ~np.isnan(field_mean) & (day_codes[rows] >= 0)
+        )
+        # thresholds as stored, float32 settings are compared as their exact float64 value like Threshold does
+        thresholds = np.asarray(candidates["thresholdValue"].to_numpy()[indices], dtype=float)
+        minutes[indices], wh[indices] = _threshold_counts(
+            field_mean[selected],
+            day_codes[rows][selected],
+            energy[rows][selected],
+            direction,
+            thresholds,
+            len(days),
+        )
+
+    if set(VALIDITY_COLUMNS) <= set(candidates.columns):
+        valid = np.array(
+            [hw.alarm_valid_days(candidate, days, tz) for candidate in candidates.itertuples()], dtype=bool
+        ).reshape(minutes.shape)
+        minutes[~valid] = 0
+        wh[~valid] = 0
+
+    results = candidates.loc[np.repeat(np.arange(len(candidates)), len(days))].reset_index(drop=True)
+    results.insert(0, "Date", [day[2] for day in days] * len(candidates))
+    results["Active minutes"] = minutes.ravel()
+    results["Energy consumed, kWh"] = wh.ravel() / 1000
+    return results